@@ -1,7 +1,14 @@
 from fastapi import APIRouter
 
+from app.core.config import settings
+
+from .admin.route import router as admin_router
 from .short_urls.route import router as shorturls_router
 
 router = APIRouter(prefix="/v1")
 
-router.include_router(shorturls_router)
\ No newline at end of file
+router.include_router(shorturls_router)
+
+# admin endpoints expose the internals of the workers (pools, replicas), never serve them unauthenticated
+if settings.ADMIN_TOKEN is not None:
+    router.include_router(admin_router)
@@ -0,0 +1,16 @@
+import secrets
+from typing import Optional
+
+from fastapi import Header
+
+from app.core.config import settings
+from app.core.exceptions import UnauthorizedException
+
+
+async def verify_admin_token(x_admin_token: Optional[str] = Header(default=None)) -> None:
+    # the routes are not mounted without a token, refuse rather than serve them to anyone if one is
+    if settings.ADMIN_TOKEN is None:
+        raise UnauthorizedException(detail="Admin endpoints are disabled, set ADMIN_TOKEN")
+
+    if x_admin_token is None or not secrets.compare_digest(x_admin_token, settings.ADMIN_TOKEN):
+        raise UnauthorizedException(detail="Invalid admin token")
@@ -0,0 +1,34 @@
+from fastapi import APIRouter, Depends
+
+from app.core.common.app_response import AppResponse
+from app.core.db.database import engine, replica_set
+
+from .dependencies import verify_admin_token
+from .schema import PoolStats, ReplicaSetStats, ReplicaStats
+
+router = APIRouter(tags=["admin"], prefix='/admin', dependencies=[Depends(verify_admin_token)])
+
+
+@router.get('/pool', response_model=AppResponse[PoolStats])
+async def get_pool_stats():
+    return AppResponse(data=PoolStats(**engine.pool.stats()))
+
+
+@router.get('/replicas', response_model=AppResponse[ReplicaSetStats])
+async def get_replica_stats():
+    available = replica_set.available()
+
+    return AppResponse(data=ReplicaSetStats(
+        selection=replica_set.selection,
+        max_lag_seconds=replica_set.max_lag_seconds,
+        replica_reads=replica_set.replica_reads,
+        primary_fallbacks=replica_set.primary_fallbacks,
+        replicas=[
+            ReplicaStats(name=replica.name,
+                         reachable=replica.reachable,
+                         lag_seconds=replica.lag_seconds,
+                         available=replica in available,
+                         pool=PoolStats(**replica.engine.pool.stats()))
+            for replica in replica_set.replicas
+        ],
+    ))
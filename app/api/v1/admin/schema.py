@@ -0,0 +1,49 @@
+from typing import Optional
+
+from pydantic import AliasGenerator, BaseModel, ConfigDict
+from pydantic.alias_generators import to_camel
+
+
+class PoolStats(BaseModel):
+    pool_size: int
+    max_overflow: int
+    checked_out: int
+    checked_in: int
+    overflow: int
+    checkouts: int
+    timeouts: int
+    total_wait_seconds: float
+    average_wait_seconds: float
+    max_wait_seconds: float
+
+    model_config = ConfigDict(
+        alias_generator=AliasGenerator(to_camel),
+        populate_by_name=True,
+    )
+
+
+class ReplicaStats(BaseModel):
+    name: str
+    reachable: bool
+    # null until the first check and while unreachable
+    lag_seconds: Optional[float]
+    available: bool
+    pool: PoolStats
+
+    model_config = ConfigDict(
+        alias_generator=AliasGenerator(to_camel),
+        populate_by_name=True,
+    )
+
+
+class ReplicaSetStats(BaseModel):
+    selection: str
+    max_lag_seconds: float
+    replica_reads: int
+    primary_fallbacks: int
+    replicas: list[ReplicaStats]
+
+    model_config = ConfigDict(
+        alias_generator=AliasGenerator(to_camel),
+        populate_by_name=True,
+    )
@@ -0,0 +1,182 @@
+import asyncio
+import enum
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.sql.elements import ColumnElement
+
+from app.core.common.pagination_factory import CountPolicy
+from app.core.config import settings
+from app.core.db.database import AsyncSessionMaker
+
+from .repository import URLShortRepository
+from .schema import ShortUrlBulkDeleteJobResult
+
+logger = logging.getLogger(__name__)
+
+
+class BulkDeleteStatus(str, enum.Enum):
+    RUNNING = 'running'
+    COMPLETED = 'completed'
+    CANCELLED = 'cancelled'
+    FAILED = 'failed'
+
+
+class BulkDeleteJob:
+    def __init__(self, filter_by: str, where_clause: list[ColumnElement[bool]], batch_size: int, throttle: float):
+        self.id = uuid.uuid4().hex
+        self.filter_by = filter_by
+        self.where_clause = where_clause
+        self.batch_size = batch_size
+        self.throttle = throttle
+
+        self.status = BulkDeleteStatus.RUNNING
+        self.deleted = 0
+        self.batches = 0
+        self.estimated_total: Optional[int] = None
+        self.error: Optional[str] = None
+        self.started_at = datetime.now(timezone.utc)
+        self.finished_at: Optional[datetime] = None
+
+        self._started = time.perf_counter()
+        self._duration: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        self._cancel_requested = asyncio.Event()
+
+    def finish(self, status: BulkDeleteStatus, error: Optional[str] = None) -> None:
+        self.status = status
+        self.error = error
+        self.finished_at = datetime.now(timezone.utc)
+        self._duration = time.perf_counter() - self._started
+
+    def result(self) -> ShortUrlBulkDeleteJobResult:
+        duration = self._duration if self._duration is not None else time.perf_counter() - self._started
+
+        return ShortUrlBulkDeleteJobResult(
+            job_id=self.id,
+            status=self.status.value,
+            filter_by=self.filter_by,
+            batch_size=self.batch_size,
+            throttle_ms=int(self.throttle * 1000),
+            deleted=self.deleted,
+            batches=self.batches,
+            estimated_total=self.estimated_total,
+            rows_per_second=self.deleted / duration if duration else 0.0,
+            started_at=self.started_at,
+            finished_at=self.finished_at,
+            error=self.error,
+        )
+
+
+class BulkDeleter:
+    """
+    Deletes every short url matching a filter in the background, batch after batch.
+
+    Each batch is its own short transaction deleting at most `batch_size` rows, skipping rows locked by
+    live traffic, and invalidating the caches of the rows it deleted. Batches are `throttle` seconds apart.
+    Jobs live in the memory of the worker running them, their progress is only known to that worker.
+    """
+
+    def __init__(self,
+                 session_maker: async_sessionmaker[AsyncSession],
+                 batch_size: int = 1000,
+                 throttle: float = 0.05,
+                 max_finished_jobs: int = 100):
+        self.session_maker = session_maker
+        self.batch_size = batch_size
+        self.throttle = throttle
+        self.max_finished_jobs = max_finished_jobs
+
+        self._jobs: OrderedDict[str, BulkDeleteJob] = OrderedDict()
+
+    def jobs(self) -> list[BulkDeleteJob]:
+        return list(self._jobs.values())
+
+    def get(self, job_id: str) -> Optional[BulkDeleteJob]:
+        return self._jobs.get(job_id)
+
+    def start(self,
+              filter_by: str,
+              where_clause: list[ColumnElement[bool]],
+              batch_size: Optional[int] = None,
+              throttle: Optional[float] = None) -> BulkDeleteJob:
+        if not where_clause:
+            raise ValueError("A bulk delete needs a filter")
+
+        job = BulkDeleteJob(filter_by=filter_by,
+                            where_clause=where_clause,
+                            batch_size=batch_size or self.batch_size,
+                            throttle=self.throttle if throttle is None else throttle)
+
+        self._jobs[job.id] = job
+        self._forget_finished_jobs()
+
+        job._task = asyncio.create_task(self._run(job), name=f"bulk-delete:{job.id}")
+        return job
+
+    async def cancel(self, job_id: str) -> Optional[BulkDeleteJob]:
+        """Stops a job once its current batch is committed and invalidated, the rows already deleted stay deleted."""
+        job = self._jobs.get(job_id)
+
+        if job is not None and job._task is not None and not job._task.done():
+            job._cancel_requested.set()
+            # a cancelled caller must not interrupt the batch in flight
+            await asyncio.shield(job._task)
+
+        return job
+
+    async def stop(self) -> None:
+        for job in self.jobs():
+            await self.cancel(job.id)
+
+    async def _run(self, job: BulkDeleteJob) -> None:
+        completed = False
+
+        try:
+            async with self.session_maker() as session:
+                job.estimated_total = await URLShortRepository(session).count(job.where_clause, CountPolicy.ESTIMATED)
+
+            while not job._cancel_requested.is_set():
+                async with self.session_maker() as session:
+                    repo = URLShortRepository(session)
+                    deleted = len(await repo.delete_batch(job.where_clause, job.batch_size))
+
+                    job.deleted += deleted
+                    job.batches += 1
+
+                    # an empty batch may only mean the remaining rows were locked, they are retried after the pause
+                    if deleted == 0 and not await repo.has_any(job.where_clause):
+                        completed = True
+                        break
+
+                try:
+                    await asyncio.wait_for(job._cancel_requested.wait(), timeout=job.throttle)
+                except asyncio.TimeoutError:
+                    pass
+        except asyncio.CancelledError:
+            job.finish(BulkDeleteStatus.CANCELLED)
+            raise
+        except Exception as e:
+            logger.exception(f"Bulk delete {job.id} of '{job.filter_by}' failed after deleting {job.deleted} rows")
+            job.finish(BulkDeleteStatus.FAILED, error=str(e))
+            return
+
+        job.finish(BulkDeleteStatus.COMPLETED if completed else BulkDeleteStatus.CANCELLED)
+        logger.info(f"Bulk delete {job.id} of '{job.filter_by}' {job.status.value} after deleting {job.deleted} rows in {job.batches} batches")
+
+    def _forget_finished_jobs(self) -> None:
+        finished = [job.id for job in self._jobs.values() if job.status is not BulkDeleteStatus.RUNNING]
+
+        for job_id in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            del self._jobs[job_id]
+
+
+bulk_deleter = BulkDeleter(session_maker=AsyncSessionMaker,
+                           batch_size=settings.BULK_DELETE_BATCH_SIZE,
+                           throttle=settings.BULK_DELETE_THROTTLE_MS / 1000,
+                           max_finished_jobs=settings.BULK_DELETE_MAX_FINISHED_JOBS)
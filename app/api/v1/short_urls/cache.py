@@ -0,0 +1,128 @@
+from typing import Any, Hashable, Iterable, Optional
+
+from app.core.cache.invalidation import InvalidationBus
+from app.core.cache.lru import TTLCache
+from app.core.cache.single_flight import SingleFlight
+from app.core.config import settings
+from app.core.db.database import engine
+from app.core.metrics.collectors import register_cache_metrics, register_single_flight_metrics
+
+from .schema import ShortUrlRead
+
+
+class ShortUrlCache(TTLCache[str, ShortUrlRead]):
+    """
+    Caches short url rows by short code.
+
+    Keeps an id -> short code index so a row can still be evicted after its
+    short code was changed by a bulk update. Cached rows are shared, callers must not mutate them.
+
+    `generation` changes with every invalidation: a lookup reads it before querying and fills the
+    cache with `set_if_unchanged`, so a row read before a write that was invalidated meanwhile is not cached.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._codes_by_id: dict[int, str] = {}
+        self.generation = 0
+
+    def set(self, key: str, value: ShortUrlRead, ttl: Optional[float] = None) -> None:
+        # the same row cached under an older code is stale by definition
+        previous_code = self._codes_by_id.get(value.id)
+        if previous_code is not None and previous_code != key:
+            self.invalidate(previous_code)
+
+        super().set(key, value, ttl=ttl)
+
+        if key in self._entries:
+            self._codes_by_id[value.id] = key
+
+    def set_if_unchanged(self, key: str, value: ShortUrlRead, generation: int) -> bool:
+        """Caches `value` unless anything was invalidated since `generation` was read, returns whether it did."""
+        if generation != self.generation:
+            return False
+
+        self.set(key, value)
+        return True
+
+    def invalidate_records(self, records: Iterable[Any]) -> None:
+        """Evicts every cached row matching the `id` or `short_code` of the given records."""
+        records = list(records)
+        self.invalidate_many(ids=[record.id for record in records], short_codes=[record.short_code for record in records])
+
+    def invalidate_many(self, ids: Iterable[int], short_codes: Iterable[str]) -> None:
+        # even when nothing is cached, a lookup in progress may have read the old rows
+        self.generation += 1
+
+        for short_code in short_codes:
+            self.invalidate(short_code)
+
+        for id in ids:
+            code = self._codes_by_id.get(id)
+            if code is not None:
+                self.invalidate(code)
+
+    def clear(self) -> None:
+        self.generation += 1
+        super().clear()
+        self._codes_by_id.clear()
+
+    def _remove(self, key: str) -> ShortUrlRead:
+        value = super()._remove(key)
+
+        if self._codes_by_id.get(value.id) == key:
+            del self._codes_by_id[value.id]
+
+        return value
+
+
+short_url_cache: ShortUrlCache | None = ShortUrlCache(
+    max_entries=settings.CACHE_MAX_ENTRIES,
+    max_bytes=settings.CACHE_MAX_BYTES,
+    ttl=settings.CACHE_TTL_SECONDS,
+) if settings.CACHE_ENABLED else None
+
+# listing counts of `count=cached`, keyed by normalized filters. Local writes clear it, changes made
+# by other workers without going through the invalidation bus (creates, clicks) show up within the TTL
+short_url_count_cache: TTLCache[Hashable, int] | None = TTLCache(
+    max_entries=settings.CACHE_COUNT_MAX_ENTRIES,
+    ttl=settings.CACHE_COUNT_TTL_SECONDS,
+) if settings.CACHE_ENABLED else None
+
+# lookups of a short code by every request missing the cache at once (a viral link after a deploy
+# or an expiry) are coalesced in a single query per worker
+short_url_lookups: SingleFlight[str, ShortUrlRead] | None = SingleFlight() if settings.CACHE_COALESCE_LOOKUPS else None
+
+if settings.METRICS_ENABLED and short_url_cache is not None:
+    register_cache_metrics({"short_urls": short_url_cache, "short_url_counts": short_url_count_cache})
+
+if settings.METRICS_ENABLED and short_url_lookups is not None:
+    register_single_flight_metrics({"short_url_lookups": short_url_lookups})
+
+
+def _invalidate_short_urls(ids: list[int], short_codes: list[str]) -> None:
+    # lookups in flight may have read the old rows, later ones must not join them
+    if short_url_lookups is not None:
+        for short_code in short_codes:
+            short_url_lookups.forget(short_code)
+
+    short_url_cache.invalidate_many(ids, short_codes)
+    if short_url_count_cache is not None:
+        short_url_count_cache.clear()
+
+
+def _resync_short_urls() -> None:
+    short_url_cache.clear()
+    if short_url_count_cache is not None:
+        short_url_count_cache.clear()
+
+
+# LISTEN/NOTIFY is postgres only, with sqlite run a single worker or rely on CACHE_TTL_SECONDS
+short_url_invalidation_bus: InvalidationBus | None = InvalidationBus(
+    dsn=engine.url.set(drivername="postgresql", query={}).render_as_string(hide_password=False),
+    channel=settings.CACHE_INVALIDATION_CHANNEL,
+    on_invalidate=_invalidate_short_urls,
+    on_resync=_resync_short_urls,
+    reconnect_delay=settings.CACHE_INVALIDATION_RECONNECT_SECONDS,
+    healthcheck_interval=settings.CACHE_INVALIDATION_HEALTHCHECK_SECONDS,
+) if short_url_cache is not None and settings.CACHE_INVALIDATION_ENABLED and settings.DB_BACKEND == 'postgres' else None
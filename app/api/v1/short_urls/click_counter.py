@@ -0,0 +1,318 @@
+import abc
+import asyncio
+import enum
+import logging
+import math
+import random
+from typing import Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core.config import ClickCounterSettings, settings
+from app.core.db.database import AsyncSessionMaker
+
+from .repository import URLShortRepository
+from .schema import ShortUrlGetResult, ShortUrlRead
+
+logger = logging.getLogger(__name__)
+
+
+class ClickCounter:
+    """
+    Write-behind buffer for access_count increments.
+
+    Clicks are aggregated in memory per short code and written with one set-based UPDATE
+    every `flush_interval` seconds, or as soon as `max_pending_events` clicks are buffered.
+    Counts that fail to flush are put back in the buffer and retried, after a delay doubling with
+    every failure up to `max_retry_delay`. While the database is down the buffer holds at most
+    `max_buffered_events` clicks, later ones are dropped and counted in `dropped_events`.
+
+    Rows served to clicks are usually cached, their access count is a snapshot. The counter remembers,
+    for up to `max_tracked_codes` short codes, the count of the last row a click was served from and
+    how many clicks it wrote since, so `unseen` can tell what such a row is missing.
+    """
+
+    def __init__(self, session_maker: async_sessionmaker[AsyncSession], flush_interval: float = 1.0, max_pending_events: int = 1000,
+                 max_tracked_codes: int = 100_000, max_buffered_events: int = 1_000_000, max_retry_delay: float = 30.0):
+        self.session_maker = session_maker
+        self.flush_interval = flush_interval
+        self.max_pending_events = max_pending_events
+        self.max_tracked_codes = max_tracked_codes
+        self.max_buffered_events = max_buffered_events
+        self.max_retry_delay = max_retry_delay
+
+        self.flushes = 0
+        self.flushed_events = 0
+        self.failed_flushes = 0
+        self.dropped_events = 0
+
+        self._dropping = False
+        self._pending: dict[str, int] = {}
+        self._pending_events = 0
+        # short code -> (access count of the last row seen, clicks written since that row was seen)
+        self._written: dict[str, tuple[int, int]] = {}
+        self._flush_lock = asyncio.Lock()
+        self._flush_requested = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def pending_events(self) -> int:
+        return self._pending_events
+
+    def pending(self, short_code: str) -> int:
+        """Clicks recorded for `short_code` by this worker that are not written yet."""
+        return self._pending.get(short_code, 0)
+
+    def unseen(self, short_code: str, access_count: int) -> int:
+        """
+        Clicks recorded by this worker that a row of `short_code` read with `access_count` does not include:
+        the buffered ones, plus the ones written since a row with that count was last seen.
+        """
+        written = self._written.get(short_code)
+        written_since = written[1] if written is not None and written[0] == access_count else 0
+        return self.pending(short_code) + written_since
+
+    def record(self, short_code: str, amount: int = 1, access_count: Optional[int] = None) -> None:
+        """Buffers `amount` clicks, `access_count` is the count of the row they were served from."""
+        if access_count is not None:
+            self._seen(short_code, access_count)
+
+        self._buffer(short_code, amount)
+
+    def _seen(self, short_code: str, access_count: int) -> None:
+        written = self._written.get(short_code)
+
+        # a row with another count is a fresher read, it already includes what was written before it
+        if written is not None and written[0] == access_count:
+            return
+
+        if written is None and len(self._written) >= self.max_tracked_codes:
+            del self._written[next(iter(self._written))]
+
+        self._written[short_code] = (access_count, 0)
+
+    def _buffer(self, short_code: str, amount: int, request_flush: bool = True) -> None:
+        if self._pending_events + amount > self.max_buffered_events:
+            if not self._dropping:
+                self._dropping = True
+                logger.warning(f"Click buffer is full ({self._pending_events} clicks), dropping clicks until a flush succeeds")
+            self.dropped_events += amount
+            return
+
+        self._pending[short_code] = self._pending.get(short_code, 0) + amount
+        self._pending_events += amount
+
+        if request_flush and self._pending_events >= self.max_pending_events:
+            self._flush_requested.set()
+
+    async def flush(self) -> int:
+        """
+        Writes all buffered increments.
+
+        Returns:
+            The number of clicks written.
+        """
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+
+            # swap the buffer before awaiting so clicks recorded during the flush go to the next one
+            pending, pending_events = self._pending, self._pending_events
+            self._pending, self._pending_events = {}, 0
+
+            try:
+                async with self.session_maker() as session:
+                    await URLShortRepository(session).add_access_counts(pending)
+            except Exception:
+                self.failed_flushes += 1
+                # retried on the flusher's schedule, not straight away
+                for short_code, amount in pending.items():
+                    self._buffer(short_code, amount, request_flush=False)
+                raise
+
+            if self._dropping:
+                self._dropping = False
+                logger.warning(f"Click buffer flushed again, {self.dropped_events} clicks dropped since the worker started")
+
+            for short_code, amount in pending.items():
+                written = self._written.get(short_code)
+                if written is not None:
+                    self._written[short_code] = (written[0], written[1] + amount)
+
+            self.flushes += 1
+            self.flushed_events += pending_events
+            return pending_events
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="click-counter")
+
+    async def stop(self) -> None:
+        """Stops the background flusher and writes whatever is still buffered."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception(f"Failed to flush {self._pending_events} buffered clicks on shutdown")
+
+    async def _run(self) -> None:
+        # set while flushes fail, a full buffer does not cut it short
+        retry_delay: Optional[float] = None
+
+        while True:
+            if retry_delay is None:
+                try:
+                    await asyncio.wait_for(self._flush_requested.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                await asyncio.sleep(retry_delay)
+
+            self._flush_requested.clear()
+
+            try:
+                await self.flush()
+                retry_delay = None
+            except Exception as e:
+                if retry_delay is None:
+                    retry_delay = self.flush_interval
+                    logger.exception(f"Failed to flush buffered clicks, {self._pending_events} clicks will be retried")
+                else:
+                    retry_delay = min(retry_delay * 2, self.max_retry_delay)
+                    logger.warning(f"Failed to flush buffered clicks again ({e}), retrying in {retry_delay:.1f}s")
+
+
+class ClickCountingMode(str, enum.Enum):
+    ATOMIC = 'atomic'
+    BATCHED = 'batched'
+    SAMPLED = 'sampled'
+
+
+class ClickCounting(abc.ABC):
+    """
+    Base class for the ways a redirect can be counted.
+
+    `count` records one click for a short url and returns the row to send back, `stats` returns
+    the row as seen by the stats endpoint along with the expected error of its access count.
+    """
+    mode: ClickCountingMode
+
+    @abc.abstractmethod
+    async def count(self, repo: URLShortRepository, short_url: ShortUrlRead) -> ShortUrlRead | None:
+        ...
+
+    def stats(self, short_url: ShortUrlRead) -> ShortUrlGetResult:
+        return ShortUrlGetResult(**short_url.model_dump(),
+                                 counting_mode=self.mode.value,
+                                 access_count_error_bound=self.error_bound(short_url))
+
+    def error_bound(self, short_url: ShortUrlRead) -> float:
+        return 0.0
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+
+class AtomicClickCounting(ClickCounting):
+    """Every click is one `UPDATE ... SET access_count = access_count + 1 RETURNING` round-trip, counts are exact."""
+    mode = ClickCountingMode.ATOMIC
+
+    async def count(self, repo: URLShortRepository, short_url: ShortUrlRead) -> ShortUrlRead | None:
+        access_count = await repo.increment_access_count(short_code=short_url.short_code)
+
+        if access_count is None:
+            return None
+
+        # cached rows are shared, never mutate them in place
+        return short_url.model_copy(update={"access_count": access_count})
+
+
+class BatchedClickCounting(ClickCounting):
+    """
+    Clicks go through a `ClickCounter` buffer. No click is lost while workers shut down cleanly, but each
+    other worker may hold up to `max_pending_events` clicks that are not written yet (for at most the flush interval).
+    """
+    mode = ClickCountingMode.BATCHED
+
+    def __init__(self, counter: ClickCounter):
+        self.counter = counter
+
+    async def count(self, repo: URLShortRepository, short_url: ShortUrlRead) -> ShortUrlRead | None:
+        self.counter.record(short_url.short_code, access_count=short_url.access_count)
+        return short_url
+
+    def stats(self, short_url: ShortUrlRead) -> ShortUrlGetResult:
+        return super().stats(short_url.model_copy(update={"access_count": self.access_count(short_url)}))
+
+    def access_count(self, short_url: ShortUrlRead) -> int:
+        """The row's count plus the clicks this worker recorded that the (possibly cached) row does not include."""
+        return short_url.access_count + self.counter.unseen(short_url.short_code, short_url.access_count)
+
+    def error_bound(self, short_url: ShortUrlRead) -> float:
+        return float(self.counter.max_pending_events)
+
+    async def start(self) -> None:
+        await self.counter.start()
+
+    async def stop(self) -> None:
+        await self.counter.stop()
+
+
+class SampledClickCounting(BatchedClickCounting):
+    """
+    Batched counting where links past `threshold` clicks only record one in `factor` clicks, as `factor` clicks.
+
+    The count stays an unbiased estimate, the sampled part has a variance of (factor - 1) per sampled click,
+    the reported bound is the 95% confidence interval half-width plus the batching bound.
+    """
+    mode = ClickCountingMode.SAMPLED
+
+    def __init__(self, counter: ClickCounter, factor: int, threshold: int):
+        super().__init__(counter)
+        self.factor = factor
+        self.threshold = threshold
+
+    async def count(self, repo: URLShortRepository, short_url: ShortUrlRead) -> ShortUrlRead | None:
+        if self.access_count(short_url) < self.threshold:
+            self.counter.record(short_url.short_code, access_count=short_url.access_count)
+        elif random.random() * self.factor < 1:
+            self.counter.record(short_url.short_code, self.factor, access_count=short_url.access_count)
+
+        return short_url
+
+    def error_bound(self, short_url: ShortUrlRead) -> float:
+        # stats passes the row with its count already brought up to date
+        sampled_clicks = max(short_url.access_count - self.threshold, 0)
+        return super().error_bound(short_url) + 1.96 * math.sqrt(sampled_clicks * (self.factor - 1))
+
+
+def create_click_counting(settings: ClickCounterSettings) -> ClickCounting:
+    mode = ClickCountingMode(settings.CLICK_COUNTING_MODE)
+
+    if mode is ClickCountingMode.ATOMIC:
+        return AtomicClickCounting()
+
+    counter = ClickCounter(
+        session_maker=AsyncSessionMaker,
+        flush_interval=settings.CLICK_FLUSH_INTERVAL_MS / 1000,
+        max_pending_events=settings.CLICK_FLUSH_MAX_EVENTS,
+        max_buffered_events=settings.CLICK_BUFFER_MAX_EVENTS,
+    )
+
+    if mode is ClickCountingMode.SAMPLED:
+        return SampledClickCounting(counter, factor=settings.CLICK_SAMPLING_FACTOR, threshold=settings.CLICK_SAMPLING_THRESHOLD)
+
+    return BatchedClickCounting(counter)
+
+
+click_counting = create_click_counting(settings)
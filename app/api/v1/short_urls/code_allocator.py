@@ -0,0 +1,153 @@
+import asyncio
+import hashlib
+import math
+import string
+from typing import Iterable
+
+from app.core.config import settings
+
+from .model import CODE_BLOCK_SIZE
+from .repository import URLShortRepository
+
+ALPHABET = string.ascii_letters + string.digits
+BASE = len(ALPHABET)
+
+
+class FeistelPermutation:
+    """
+    Keyed bijection of [0, domain).
+
+    A balanced Feistel network permutes the smallest even-width bit space holding `domain`,
+    values landing outside of the domain are encrypted again (cycle walking) until they fall inside.
+    The bit space is less than 4 times the domain, so this takes under 4 rounds on average.
+    """
+
+    def __init__(self, key: bytes, domain: int, rounds: int = 8):
+        self.key = key
+        self.domain = domain
+        self.rounds = rounds
+        self.half_bits = max(1, ((domain - 1).bit_length() + 1) // 2)
+        self.mask = (1 << self.half_bits) - 1
+        # keyed once, copying the state is cheaper than keying blake2b again on every round
+        self._keyed_hash = hashlib.blake2b(key=key, digest_size=16)
+
+    def permute(self, value: int) -> int:
+        if not 0 <= value < self.domain:
+            raise ValueError(f"{value} is outside of the permutation domain [0, {self.domain})")
+
+        value = self._encrypt(value)
+        while value >= self.domain:
+            value = self._encrypt(value)
+
+        return value
+
+    def _encrypt(self, value: int) -> int:
+        left, right = value >> self.half_bits, value & self.mask
+
+        for round in range(self.rounds):
+            left, right = right, left ^ self._round_function(round, right)
+
+        return (left << self.half_bits) | right
+
+    def _round_function(self, round: int, value: int) -> int:
+        hash = self._keyed_hash.copy()
+        hash.update(value.to_bytes(16, 'big') + bytes([round]))
+        return int.from_bytes(hash.digest(), 'big') & self.mask
+
+
+class ShortCodeEncoder:
+    """
+    Maps sequential ids to non-sequential base62 short codes, one to one.
+
+    Ids are split in bands, one per code length: the first 62^min_length ids give codes of
+    `min_length` characters, the next 62^(min_length + 1) give codes one character longer, and so on.
+    Inside a band the id is shuffled by a Feistel permutation keyed with `secret` and the band length.
+    """
+
+    def __init__(self, secret: str, min_length: int = 6):
+        self.secret = secret
+        self.min_length = min_length
+        self._permutations: dict[int, FeistelPermutation] = {}
+
+    def encode_many(self, ids: Iterable[int]) -> list[str]:
+        return [self.encode(id) for id in ids]
+
+    def encode(self, id: int) -> str:
+        if id < 0:
+            raise ValueError("ids to encode must be positive")
+
+        length, offset = self.min_length, 0
+        while id - offset >= BASE ** length:
+            offset += BASE ** length
+            length += 1
+
+        value = self._permutation(length).permute(id - offset)
+
+        characters = []
+        for _ in range(length):
+            value, remainder = divmod(value, BASE)
+            characters.append(ALPHABET[remainder])
+
+        return ''.join(reversed(characters))
+
+    def _permutation(self, length: int) -> FeistelPermutation:
+        if length not in self._permutations:
+            key = hashlib.blake2b(self.secret.encode(), digest_size=32, person=f"short-code-{length}".encode()).digest()
+            self._permutations[length] = FeistelPermutation(key=key, domain=BASE ** length)
+
+        return self._permutations[length]
+
+
+class CodeAllocator:
+    """
+    Hands out unique short codes without querying the table.
+
+    Each worker leases blocks of ids from a Postgres sequence (one `nextval` per block) and encodes
+    them locally, so workers never coordinate per request and never hand out the same code twice.
+    """
+
+    def __init__(self, encoder: ShortCodeEncoder):
+        self.encoder = encoder
+        self.leases = 0
+
+        self._block = range(0)
+        self._position = 0
+        self._lease_lock = asyncio.Lock()
+
+    async def allocate(self, url_short_repo: URLShortRepository) -> str:
+        if self._position >= len(self._block):
+            async with self._lease_lock:
+                # another caller may have leased a block while we were waiting for the lock
+                if self._position >= len(self._block):
+                    self._block = (await url_short_repo.lease_code_blocks(1))[0]
+                    self._position = 0
+                    self.leases += 1
+
+        id = self._block[self._position]
+        self._position += 1
+
+        return self.encoder.encode(id)
+
+    async def allocate_many(self, url_short_repo: URLShortRepository, count: int) -> list[str]:
+        """Allocates `count` codes, leasing all the missing blocks in a single round-trip."""
+        async with self._lease_lock:
+            ids = list(self._block[self._position:self._position + count])
+            self._position += len(ids)
+
+            missing = count - len(ids)
+
+            if missing > 0:
+                blocks = await url_short_repo.lease_code_blocks(math.ceil(missing / CODE_BLOCK_SIZE))
+                self.leases += len(blocks)
+
+                leased_ids = [id for block in blocks for id in block]
+                ids.extend(leased_ids[:missing])
+
+                # the unused tail of the last block serves the next allocations
+                self._block = range(leased_ids[missing], blocks[-1].stop) if missing < len(leased_ids) else range(0)
+                self._position = 0
+
+        return self.encoder.encode_many(ids)
+
+
+code_allocator = CodeAllocator(encoder=ShortCodeEncoder(secret=settings.SHORT_CODE_SECRET, min_length=settings.SHORT_CODE_MIN_LENGTH))
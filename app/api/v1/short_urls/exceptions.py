@@ -3,4 +3,10 @@ class ShortUrlNotFound(Exception):
     pass
 
 class ShortUrlDeleteFail(Exception):
-    pass
\ No newline at end of file
+    pass
+
+class ShortCodeTaken(Exception):
+    pass
+
+class UrlAlreadyShortened(Exception):
+    pass
@@ -0,0 +1,86 @@
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from typing import Any, AsyncIterator, Iterable
+
+from sqlalchemy.engine import RowMapping
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm.attributes import InstrumentedAttribute
+from sqlalchemy.sql.elements import ColumnElement
+
+from app.core.db.database import AsyncSessionMaker
+
+from .repository import URLShortRepository
+from .schema import ExportFormat, ShortUrlRead
+
+# columns of the exported rows, in order, the importer reads them back
+EXPORT_COLUMNS = list(ShortUrlRead.model_fields)
+
+MEDIA_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def _value(value: Any) -> Any:
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def encode_ndjson(rows: Iterable[RowMapping]) -> str:
+    return ''.join(
+        json.dumps({column: _value(row[column]) for column in EXPORT_COLUMNS}, separators=(',', ':')) + '\n'
+        for row in rows
+    )
+
+
+def encode_csv(rows: Iterable[RowMapping]) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows([_value(row[column]) for column in EXPORT_COLUMNS] for row in rows)
+    return buffer.getvalue()
+
+
+def csv_header() -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(EXPORT_COLUMNS)
+    return buffer.getvalue()
+
+
+ENCODERS = {
+    'ndjson': encode_ndjson,
+    'csv': encode_csv,
+}
+
+
+async def export_short_urls(where_clause: list[ColumnElement[bool]],
+                            order_clause: list[InstrumentedAttribute],
+                            format: ExportFormat,
+                            gzip: bool = False,
+                            batch_size: int = 1000,
+                            session_maker: async_sessionmaker[AsyncSession] = AsyncSessionMaker) -> AsyncIterator[bytes]:
+    """
+    Yields the short urls matching `where_clause` as NDJSON or CSV (optionally gzipped), one chunk per
+    batch of rows read from a server-side cursor.
+
+    The session is opened here rather than injected: the response body is produced after the
+    request handler returned, once its dependencies are closed.
+    """
+    encode = ENCODERS[format]
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16) if gzip else None
+
+    def output(text: str) -> bytes:
+        data = text.encode()
+        return compressor.compress(data) if compressor is not None else data
+
+    if format == 'csv':
+        yield output(csv_header())
+
+    async with session_maker() as session:
+        async for rows in URLShortRepository(session).stream_many(where_clause=where_clause, order_clause=order_clause, batch_size=batch_size):
+            # the compressor holds data back until it has a block worth writing
+            if chunk := output(encode(rows)):
+                yield chunk
+
+    if compressor is not None:
+        yield compressor.flush()
@@ -0,0 +1,377 @@
+import codecs
+import csv
+import json
+import time
+import uuid
+from collections import deque
+from typing import AsyncIterable, AsyncIterator, Literal, Optional
+
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+
+from app.core.db.database import AsyncSessionMaker, engine
+from app.core.exceptions import BadRequestException
+
+from .cache import short_url_count_cache
+from .code_allocator import CodeAllocator, code_allocator
+from .model import hash_url
+from .redirect import SHORT_CODE_PATTERN
+from .repository import URLShortRepository
+from .schema import ShortUrlImportRejection, ShortUrlImportResult
+
+# rows allocated and copied to the staging table at once, the only rows held in memory
+IMPORT_BATCH_SIZE = 10_000
+MAX_REJECTION_SAMPLES = 100
+# re-allocations of generated codes that were already taken by legacy codes
+MAX_CODE_REALLOCATIONS = 5
+# longest csv record, past it an unclosed quote is taken for a stray one
+MAX_CSV_RECORD_LINES = 32
+MAX_CSV_RECORD_LENGTH = 64 * 1024
+
+ImportFormat = Literal['ndjson', 'csv']
+
+
+class ImportRecord:
+    __slots__ = ('line', 'url', 'short_code', 'access_count')
+
+    def __init__(self, line: int, url: str, short_code: Optional[str] = None, access_count: Optional[int] = None):
+        self.line = line
+        self.url = url
+        self.short_code = short_code
+        self.access_count = access_count
+
+
+async def iter_lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[str]:
+    """Splits a stream of utf-8 bytes in lines without reading it whole."""
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    pending = ''
+
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split('\n')
+        for line in lines:
+            yield line.rstrip('\r')
+
+    pending += decoder.decode(b'', final=True)
+    if pending:
+        yield pending.rstrip('\r')
+
+
+def validate_record(line: int, fields: dict) -> ImportRecord:
+    """
+    Raises:
+        ValueError: With the reason the row is rejected.
+    """
+    url = fields.get('url')
+    if not isinstance(url, str) or not url.strip():
+        raise ValueError("missing url")
+
+    short_code = fields.get('short_code') or None
+    if short_code is not None and (not isinstance(short_code, str) or len(short_code) > 256 or not SHORT_CODE_PATTERN.fullmatch(short_code)):
+        raise ValueError(f"invalid short_code '{short_code}'")
+
+    access_count = fields.get('access_count')
+    if access_count in (None, ''):
+        access_count = None
+    else:
+        try:
+            access_count = int(access_count)
+        except (TypeError, ValueError):
+            raise ValueError(f"invalid access_count '{access_count}'")
+        if access_count < 0:
+            raise ValueError(f"invalid access_count '{access_count}'")
+
+    return ImportRecord(line=line, url=url.strip(), short_code=short_code, access_count=access_count)
+
+
+async def parse_ndjson(lines: AsyncIterable[str]) -> AsyncIterator[ImportRecord | ShortUrlImportRejection]:
+    """One json object per line: `{"url": ..., "short_code": ..., "access_count": ...}`, only `url` is required."""
+    line_number = 0
+
+    async for line in lines:
+        line_number += 1
+        if not line.strip():
+            continue
+
+        try:
+            fields = json.loads(line)
+            if not isinstance(fields, dict):
+                raise ValueError("expected a json object")
+            yield validate_record(line_number, fields)
+        except ValueError as e:
+            yield ShortUrlImportRejection(line=line_number, reason=str(e))
+
+
+class _LineFeed:
+    """Input of a csv reader, fed the lines of one complete record at a time."""
+
+    def __init__(self):
+        self.lines: deque[str] = deque()
+
+    def __iter__(self) -> '_LineFeed':
+        return self
+
+    def __next__(self) -> str:
+        if not self.lines:
+            raise StopIteration
+        return self.lines.popleft()
+
+
+def _ends_in_quoted_field(line: str, in_quoted_field: bool) -> bool:
+    """
+    Whether a csv record (default dialect) is still inside a quoted field at the end of `line`,
+    given whether it was at its start. Quotes only open a field they start, `""` is an escaped quote.
+    """
+    if not in_quoted_field and '"' not in line:
+        return False
+
+    position = 0
+    while True:
+        if in_quoted_field:
+            quote = line.find('"', position)
+            if quote < 0:
+                return True
+            if line.startswith('"', quote + 1):
+                position = quote + 2
+                continue
+            in_quoted_field = False
+            position = quote + 1
+        elif line.startswith('"', position):
+            in_quoted_field = True
+            position += 1
+            continue
+
+        # the rest of the field is taken as is, up to the next delimiter
+        delimiter = line.find(',', position)
+        if delimiter < 0:
+            return False
+        position = delimiter + 1
+
+
+async def parse_csv(lines: AsyncIterable[str]) -> AsyncIterator[ImportRecord | ShortUrlImportRejection]:
+    """
+    A header line naming the columns (`url`, and optionally `short_code` and `access_count`), then one url per record.
+
+    Quoted fields may span up to `MAX_CSV_RECORD_LINES` lines and `MAX_CSV_RECORD_LENGTH` characters, rejections
+    report the first line of their record. A longer record (a stray quote) is rejected and parsing starts over
+    at the next line, rather than swallowing the rest of the file.
+    """
+    line_number = 0
+    header: Optional[list[str]] = None
+
+    # whether a record is complete is tracked line by line, the single reader then parses it once
+    feed = _LineFeed()
+    reader = csv.reader(feed)
+    record_lines: list[str] = []
+    record_length = 0
+    in_quoted_field = False
+
+    async for line in lines:
+        line_number += 1
+        record_lines.append(line + '\n')
+        record_length += len(line) + 1
+        record_line = line_number - len(record_lines) + 1
+
+        in_quoted_field = _ends_in_quoted_field(line, in_quoted_field)
+
+        if in_quoted_field:
+            if len(record_lines) < MAX_CSV_RECORD_LINES and record_length < MAX_CSV_RECORD_LENGTH:
+                continue
+
+            record_lines.clear()
+            record_length = 0
+            in_quoted_field = False
+            yield ShortUrlImportRejection(line=record_line, reason=f"quoted field not closed within {MAX_CSV_RECORD_LINES} lines "
+                                                                   f"and {MAX_CSV_RECORD_LENGTH} characters")
+            continue
+
+        feed.lines.extend(record_lines)
+        record_lines.clear()
+        record_length = 0
+
+        try:
+            values = next(reader)
+        except csv.Error as e:
+            feed.lines.clear()
+            yield ShortUrlImportRejection(line=record_line, reason=str(e))
+            continue
+
+        if not ''.join(values).strip():
+            continue
+
+        if header is None:
+            header = [value.strip() for value in values]
+            if 'url' not in header:
+                yield ShortUrlImportRejection(line=record_line, reason="csv header must have a 'url' column")
+                return
+            continue
+
+        try:
+            yield validate_record(record_line, dict(zip(header, values)))
+        except ValueError as e:
+            yield ShortUrlImportRejection(line=record_line, reason=str(e))
+
+    if record_lines:
+        yield ShortUrlImportRejection(line=line_number - len(record_lines) + 1, reason="unexpected end of data, unterminated quoted field")
+
+
+PARSERS = {
+    'ndjson': parse_ndjson,
+    'csv': parse_csv,
+}
+
+
+class ShortUrlImporter:
+    """
+    Loads short urls in bulk.
+
+    Rows are read as a stream, given a short code in batches (unless they bring their own legacy code),
+    and COPYed into a temporary staging table. A single `INSERT ... SELECT ... ON CONFLICT DO NOTHING`
+    then moves them into `short_urls`: urls that already exist are skipped and keep their code, a url
+    repeated in the import keeps its last row.
+    """
+
+    def __init__(self,
+                 engine: AsyncEngine = engine,
+                 session_maker: async_sessionmaker[AsyncSession] = AsyncSessionMaker,
+                 allocator: CodeAllocator = code_allocator,
+                 batch_size: int = IMPORT_BATCH_SIZE):
+        self.engine = engine
+        self.session_maker = session_maker
+        self.allocator = allocator
+        self.batch_size = batch_size
+
+    async def run(self, rows: AsyncIterable[ImportRecord | ShortUrlImportRejection]) -> ShortUrlImportResult:
+        """
+        Raises:
+            BadRequestException: If the database is not postgres, which alone has COPY.
+        """
+        if self.engine.dialect.name != 'postgresql':
+            raise BadRequestException(detail="Imports require the postgres backend")
+
+        started_at = time.perf_counter()
+        staging_table = f"short_urls_import_{uuid.uuid4().hex}"
+
+        rows_read = 0
+        rows_rejected = 0
+        rejected: list[ShortUrlImportRejection] = []
+
+        # COPY is only reachable through the asyncpg connection itself
+        async with self.engine.connect() as connection:
+            raw_connection = (await connection.get_raw_connection()).driver_connection
+
+            await raw_connection.execute(f"""
+                CREATE TEMP TABLE {staging_table} (
+                    line bigint NOT NULL,
+                    url text NOT NULL,
+                    url_hash bytea NOT NULL,
+                    short_code text NOT NULL,
+                    access_count integer,
+                    generated boolean NOT NULL
+                )
+            """)
+
+            try:
+                batch: list[ImportRecord] = []
+
+                async for row in rows:
+                    rows_read += 1
+
+                    if isinstance(row, ShortUrlImportRejection):
+                        rows_rejected += 1
+                        if len(rejected) < MAX_REJECTION_SAMPLES:
+                            rejected.append(row)
+                        continue
+
+                    batch.append(row)
+                    if len(batch) >= self.batch_size:
+                        await self._copy_batch(raw_connection, staging_table, batch)
+                        batch = []
+
+                if batch:
+                    await self._copy_batch(raw_connection, staging_table, batch)
+
+                rows_inserted = await self._merge(raw_connection, staging_table)
+                total_rows = await raw_connection.fetchval("SELECT count(*) FROM short_urls")
+            finally:
+                # temporary tables also go away with the connection, should the worker die before this
+                await raw_connection.execute(f"DROP TABLE IF EXISTS {staging_table}")
+
+        # other writes clear cached counts through the repository, the import bypasses it
+        if short_url_count_cache is not None:
+            short_url_count_cache.clear()
+
+        duration = time.perf_counter() - started_at
+        rows_accepted = rows_read - rows_rejected
+
+        return ShortUrlImportResult(
+            rows_read=rows_read,
+            rows_rejected=rows_rejected,
+            rows_inserted=rows_inserted,
+            rows_skipped=rows_accepted - rows_inserted,
+            total_rows=total_rows,
+            duration_seconds=duration,
+            rows_per_second=rows_read / duration if duration else 0.0,
+            rejected=rejected,
+        )
+
+    async def _allocate(self, count: int) -> list[str]:
+        async with self.session_maker() as session:
+            return await self.allocator.allocate_many(URLShortRepository(session), count)
+
+    async def _copy_batch(self, raw_connection, staging_table: str, batch: list[ImportRecord]) -> None:
+        short_codes = iter(await self._allocate(sum(1 for record in batch if record.short_code is None)))
+
+        await raw_connection.copy_records_to_table(
+            staging_table,
+            columns=['line', 'url', 'url_hash', 'short_code', 'access_count', 'generated'],
+            records=[
+                (record.line, record.url, hash_url(record.url), record.short_code or next(short_codes), record.access_count, record.short_code is None)
+                for record in batch
+            ],
+        )
+
+    async def _merge(self, raw_connection, staging_table: str) -> int:
+        """Inserts the staged rows that are not in the table yet, returns how many were inserted."""
+        merge = f"""
+            INSERT INTO short_urls (url, url_hash, short_code, access_count, created_at, updated_at)
+            SELECT DISTINCT ON (url_hash) url, url_hash, short_code, COALESCE(access_count, 0), now(), now()
+            FROM {staging_table}
+            {{where}}
+            ORDER BY url_hash, line DESC
+            ON CONFLICT DO NOTHING
+        """
+
+        async with raw_connection.transaction():
+            await raw_connection.execute("SET LOCAL statement_timeout = 0")
+            status = await raw_connection.execute(merge.format(where=""))
+        rows_inserted = int(status.split()[-1])
+
+        # a generated code can only be skipped because a legacy code took it first, give those urls another code
+        for _ in range(MAX_CODE_REALLOCATIONS):
+            lines = await raw_connection.fetch(f"""
+                SELECT DISTINCT ON (s.url_hash) s.line FROM {staging_table} s
+                WHERE s.generated AND NOT EXISTS (SELECT 1 FROM short_urls u WHERE u.url_hash = s.url_hash)
+                ORDER BY s.url_hash, s.line DESC
+            """)
+
+            if not lines:
+                break
+
+            lines = [record['line'] for record in lines]
+            short_codes = await self._allocate(len(lines))
+
+            async with raw_connection.transaction():
+                await raw_connection.execute(f"""
+                    UPDATE {staging_table} s SET short_code = c.short_code
+                    FROM unnest($1::bigint[], $2::text[]) AS c(line, short_code)
+                    WHERE s.line = c.line
+                """, lines, short_codes)
+                status = await raw_connection.execute(merge.format(where="WHERE line = ANY($1::bigint[])"), lines)
+            rows_inserted += int(status.split()[-1])
+
+        return rows_inserted
+
+
+async def import_short_urls(chunks: AsyncIterable[bytes], format: ImportFormat) -> ShortUrlImportResult:
+    return await ShortUrlImporter().run(PARSERS[format](iter_lines(chunks)))
+
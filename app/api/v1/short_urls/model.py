@@ -1,15 +1,80 @@
-from sqlalchemy import String
+import hashlib
+
+from sqlalchemy import LargeBinary, Sequence, String, text
+from sqlalchemy.ext.asyncio import AsyncEngine
 from sqlalchemy.orm import Mapped, mapped_column
 
 from app.core.db.database import Base
+
+# every nextval leases a block of this many ids for short code allocation,
+# changing it for an existing database requires an `ALTER SEQUENCE ... INCREMENT BY` as well
+CODE_BLOCK_SIZE = 1000
+
+short_code_sequence = Sequence("short_urls_code_seq", start=1, increment=CODE_BLOCK_SIZE, metadata=Base.metadata)
+
+# urls are deduplicated on a fixed-width digest rather than on the unbounded text
+URL_HASH_BYTES = 16
+
+
+def hash_url(url: str) -> bytes:
+    """First `URL_HASH_BYTES` bytes of the sha256 of the utf-8 url."""
+    return hashlib.sha256(url.encode()).digest()[:URL_HASH_BYTES]
+
+
 class ShortUrl(Base):
     __tablename__ = "short_urls"
     
-    url: Mapped[str] = mapped_column(unique=True)
+    url: Mapped[str] = mapped_column()
+    url_hash: Mapped[bytes] = mapped_column(LargeBinary(URL_HASH_BYTES), unique=True, index=True)
     short_code: Mapped[str] = mapped_column(String(256), unique=True)
     access_count: Mapped[int] = mapped_column(default=0)
     
     def __repr__(self):
         return f"ShortUrl:<id: {self.id}, short_code: {self.short_code}, access_count: {self.access_count}>"
-    
-    
+
+
+# rows backfilled per transaction by `migrate_url_hash`
+URL_HASH_BACKFILL_BATCH_SIZE = 10_000
+
+
+async def migrate_url_hash(engine: AsyncEngine, batch_size: int = URL_HASH_BACKFILL_BATCH_SIZE) -> bool:
+    """
+    Brings a postgres `short_urls` table created before `url_hash` existed up to date: adds the column,
+    backfills it in short batches, indexes it `CONCURRENTLY` so writes keep going, and drops the unique
+    constraint on `url` it replaces. Run once per database with `python -m app.cli migrate`, it can be
+    run again after a failure and does nothing once applied. Returns whether anything was done.
+    """
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction, every statement commits on its own
+    async with engine.connect() as connection:
+        connection = await connection.execution_options(isolation_level="AUTOCOMMIT")
+
+        index_valid = await connection.scalar(text("""
+            SELECT i.indisvalid FROM pg_index i WHERE i.indexrelid = to_regclass('ix_short_urls_url_hash')
+        """))
+        has_url_key = await connection.scalar(text("""
+            SELECT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'short_urls_url_key')
+        """))
+
+        if index_valid and not has_url_key:
+            return False
+
+        await connection.execute(text("ALTER TABLE short_urls ADD COLUMN IF NOT EXISTS url_hash bytea"))
+
+        while True:
+            # the digest of `hash_url`
+            backfilled = await connection.execute(text(f"""
+                UPDATE short_urls SET url_hash = substring(sha256(convert_to(url, 'UTF8')) for {URL_HASH_BYTES})
+                WHERE id IN (SELECT id FROM short_urls WHERE url_hash IS NULL LIMIT :batch_size)
+            """), {"batch_size": batch_size})
+            if backfilled.rowcount == 0:
+                break
+
+        if index_valid is False:
+            # left invalid by an interrupted build, IF NOT EXISTS would keep it as is
+            await connection.execute(text("DROP INDEX CONCURRENTLY ix_short_urls_url_hash"))
+
+        await connection.execute(text("CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS ix_short_urls_url_hash ON short_urls (url_hash)"))
+        await connection.execute(text("ALTER TABLE short_urls ALTER COLUMN url_hash SET NOT NULL"))
+        await connection.execute(text("ALTER TABLE short_urls DROP CONSTRAINT IF EXISTS short_urls_url_key"))
+
+    return True
@@ -0,0 +1,85 @@
+import re
+from typing import Iterable, Optional
+from urllib.parse import quote
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.core.db.database import AsyncSessionMaker
+from app.core.metrics.middleware import ROUTE_LABEL
+
+from .click_counter import ClickCounting, click_counting
+from .repository import URLShortRepository
+
+SHORT_CODE_PATTERN = re.compile(r'[A-Za-z0-9]+')
+
+# characters allowed to stay as is in a Location header, everything else is percent-encoded
+LOCATION_SAFE_CHARS = ":/?#[]@!$&'()*+,;=%~"
+
+
+class RedirectMiddleware:
+    """
+    Pure ASGI layer answering `GET|HEAD {prefix}{short_code}` with a redirect to the stored url.
+
+    Lookups go straight to the short url cache and repository, without FastAPI routing, dependency
+    injection or response models. Paths that are not a short code, reserved first path segments
+    and unknown codes fall through to the wrapped application.
+
+    Short codes must never shadow a route of the application (api, docs, openapi.json...): unless
+    `reserved` is given, the first path segments of its routes are reserved on the first request.
+    """
+
+    def __init__(self,
+                 app: ASGIApp,
+                 prefix: str = "/",
+                 status_code: int = 302,
+                 reserved: Optional[Iterable[str]] = None,
+                 session_maker: async_sessionmaker[AsyncSession] = AsyncSessionMaker,
+                 counting: ClickCounting = click_counting):
+        self.app = app
+        self.prefix = prefix if prefix.endswith("/") else f"{prefix}/"
+        self.status_code = status_code
+        self.reserved = frozenset(reserved) if reserved is not None else None
+        self.session_maker = session_maker
+        self.counting = counting
+        self.route_label = f"{self.prefix}{{short_code}}"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] not in ("GET", "HEAD"):
+            return await self.app(scope, receive, send)
+
+        path: str = scope["path"]
+
+        if not path.startswith(self.prefix):
+            return await self.app(scope, receive, send)
+
+        short_code = path[len(self.prefix):]
+
+        if self.reserved is None:
+            self.reserved = frozenset(route.path.strip('/').split('/')[0] for route in scope["app"].routes)
+
+        if short_code in self.reserved or not SHORT_CODE_PATTERN.fullmatch(short_code):
+            return await self.app(scope, receive, send)
+
+        # sessions only check out a connection on their first query, cache hits never touch the pool
+        async with self.session_maker() as session:
+            url_short_repo = URLShortRepository(session)
+
+            short_url = await url_short_repo.get_by_short_code(short_code)
+
+            if short_url is not None:
+                short_url = await self.counting.count(url_short_repo, short_url)
+
+        if short_url is None:
+            return await self.app(scope, receive, send)
+
+        scope[ROUTE_LABEL] = self.route_label
+
+        location = quote(short_url.url, safe=LOCATION_SAFE_CHARS).encode("ascii")
+
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": [(b"location", location), (b"content-length", b"0")],
+        })
+        await send({"type": "http.response.body", "body": b""})
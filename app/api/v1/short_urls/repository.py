@@ -1,11 +1,27 @@
+from functools import partial
+from typing import Hashable, Optional
 
+from pydantic import BaseModel
+from sqlalchemy import ARRAY, Integer, String, any_, bindparam, column, func, select, update, values
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import Depends
-from app.api.v1.short_urls.exceptions import ShortUrlNotFound
+from app.api.v1.short_urls.exceptions import ShortCodeTaken, UrlAlreadyShortened
 from app.api.v1.short_urls.schema import ShortUrlRead
-from app.core.db.base_repo import BaseRepo
+from app.core.db.base_repo import MAX_BIND_PARAMS, BaseRepo
 from app.core.db.database import get_async_session
-from .model import ShortUrl
+from app.core.db.sqlite import next_values
+from app.core.exceptions import NotFoundException
+from app.core.cache.invalidation import InvalidationBus
+from app.core.cache.lru import TTLCache
+from app.core.cache.single_flight import SingleFlight
+from app.core.metrics.db import instrumented
+from .cache import ShortUrlCache, short_url_cache, short_url_count_cache, short_url_invalidation_bus, short_url_lookups
+from .model import CODE_BLOCK_SIZE, ShortUrl, hash_url, short_code_sequence
+
+# names postgres reports for the unique constraints of short_urls
+SHORT_CODE_CONSTRAINT = 'short_urls_short_code_key'
+URL_HASH_INDEX = 'ix_short_urls_url_hash'
 
 
 def get_short_url_repo(db: AsyncSession = Depends(get_async_session())):
@@ -15,12 +31,207 @@ def get_short_url_repo(db: AsyncSession = Depends(get_async_session())):
 class URLShortRepository(BaseRepo[ShortUrl, ShortUrlRead]):
     __dbmodel__ = ShortUrl
     __model__ = ShortUrlRead
+    __write_keys__ = ('id', 'short_code')
+
+    def __init__(self,
+                 session: AsyncSession,
+                 cache: ShortUrlCache | None = short_url_cache,
+                 invalidation_bus: InvalidationBus | None = short_url_invalidation_bus,
+                 count_cache: TTLCache[Hashable, int] | None = short_url_count_cache,
+                 lookups: SingleFlight[str, ShortUrlRead] | None = short_url_lookups):
+        super().__init__(session, count_cache=count_cache)
+        self.cache = cache
+        self.invalidation_bus = invalidation_bus
+        self.lookups = lookups
 
-    async def get_by_short_code(self, short_code: str) -> ShortUrlRead | None:
+    @instrumented
+    async def create(self, data: BaseModel, return_model: Optional[BaseModel] = None):
+        """
+        Same as `BaseRepo.create`, raises `ShortCodeTaken` when the short code is already used
+        so callers can retry with another one, and `UrlAlreadyShortened` when the url already has a short url.
+        """
         try:
-            found_short_url = await super().get_one(val=short_code, field='short_code')
-            return found_short_url
-        except ShortUrlNotFound:
+            return await super().create(data=data, return_model=return_model)
+        except IntegrityError as e:
+            await self.session.rollback()
+            # asyncpg names the violated constraint
+            constraint = getattr(e.orig.__cause__, 'constraint_name', None)
+
+            if constraint is None:
+                # other drivers (sqlite) do not, look up which value is taken instead
+                if await self.get_taken_short_codes([data.short_code]):
+                    constraint = SHORT_CODE_CONSTRAINT
+                elif await self.get_by_url(data.url) is not None:
+                    constraint = URL_HASH_INDEX
+
+            if constraint == SHORT_CODE_CONSTRAINT:
+                raise ShortCodeTaken from e
+            if constraint == URL_HASH_INDEX:
+                raise UrlAlreadyShortened from e
+            raise
+
+    @instrumented
+    async def get_by_url(self, url: str, return_model: Optional[BaseModel] = None) -> BaseModel | None:
+        """
+        Returns the short url of `url` if there is one, with a single lookup of the unique `url_hash` index.
+
+        Reads the primary: callers use it right before inserting and must see the latest rows.
+        """
+        found_short_url = await self.session.scalar(select(ShortUrl).where(ShortUrl.url_hash == hash_url(url)))
+
+        if found_short_url is None:
+            return None
+
+        return (return_model or self._model)(**found_short_url.dict())
+
+    @instrumented
+    async def lease_code_blocks(self, count: int) -> list[range]:
+        """Reserves the next `count` blocks of ids of the short code sequence for this worker, in one query."""
+        if self._dialect == 'sqlite':
+            starts = await next_values(self.session, short_code_sequence, count)
+            # unlike nextval, the emulated sequence is transactional
+            await self.session.commit()
+        else:
+            starts = await self.session.scalars(
+                select(short_code_sequence.next_value()).select_from(func.generate_series(1, count))
+            )
+        return [range(start, start + CODE_BLOCK_SIZE) for start in sorted(starts)]
+
+    @instrumented
+    async def get_taken_short_codes(self, short_codes: list[str]) -> set[str]:
+        """
+        Returns which of `short_codes` are already used, with a single `short_code = ANY(:short_codes)` query
+        (sqlite has no arrays, one `short_code IN (...)` query per chunk of codes there).
+        """
+        if self._dialect == 'sqlite':
+            taken_short_codes = set()
+            for start in range(0, len(short_codes), MAX_BIND_PARAMS):
+                taken_short_codes.update(await self.session.scalars(
+                    select(ShortUrl.short_code).where(ShortUrl.short_code.in_(short_codes[start:start + MAX_BIND_PARAMS]))
+                ))
+            return taken_short_codes
+
+        taken_short_codes = await self.session.scalars(
+            select(ShortUrl.short_code)
+            .where(ShortUrl.short_code == any_(bindparam('short_codes', short_codes, type_=ARRAY(String))))
+        )
+        return set(taken_short_codes)
+
+    @instrumented
+    async def get_by_short_code(self, short_code: str, use_cache: bool = True) -> ShortUrlRead | None:
+        """
+        Returns the short url of `short_code`, from the cache when `use_cache` allows it.
+
+        Cache misses join the lookup of the same code already running in this worker, if any, rather
+        than running the same SELECT again, they get its row (shared, like cached rows) or its error.
+        Uncached reads (`use_cache=False`) want the latest row and always run their own query.
+
+        Writes forget the lookups in flight for their codes, so a lookup made after a write never joins
+        one that read the row before it. A row is only cached when its lookup was not forgotten and
+        nothing was invalidated while it was read, otherwise a write committed during the read could be
+        hidden by the row it replaced. For the same reason rows that may be cached, and uncached reads,
+        come from the primary: a lagging replica could hand back a row older than the last invalidation.
+        Only a worker without cache reads replicas.
+        """
+        if use_cache and self.cache is not None:
+            cached_short_url = self.cache.get(short_code)
+            if cached_short_url is not None:
+                return cached_short_url
+
+        generation = self.cache.generation if self.cache is not None else None
+        read_replica = use_cache and self.cache is None
+
+        forgotten = False
+
+        # database errors propagate, to every caller of a coalesced lookup: a failed read is not a missing code
+        if use_cache and self.lookups is not None:
+            found_short_url, forgotten = await self.lookups.do(short_code, partial(self._find_by_short_code, short_code, read_replica))
+        else:
+            found_short_url = await self._find_by_short_code(short_code, read_replica)
+
+        if found_short_url is None:
             return None
-        except Exception as e:
+
+        if self.cache is not None and not forgotten:
+            self.cache.set_if_unchanged(short_code, found_short_url, generation)
+
+        return found_short_url
+
+    async def _find_by_short_code(self, short_code: str, read_replica: bool) -> ShortUrlRead | None:
+        # an unknown code is an answer rather than a failure of the (possibly coalesced) lookup
+        try:
+            return await super().get_one(val=short_code, field='short_code', read_replica=read_replica)
+        except NotFoundException:
             return None
+
+    @instrumented
+    async def increment_access_count(self, short_code: str, amount: int = 1) -> int | None:
+        """
+        Atomically adds `amount` to the access count of a short url in a single UPDATE.
+
+        Returns:
+            The new access count, or None if the short code does not exist.
+        """
+        session = self.session
+
+        # a click is not an edit, keep updated_at (and every cached copy of the row) as is
+        access_count = await session.scalar(
+            update(ShortUrl)
+            .where(ShortUrl.short_code == short_code)
+            .values(access_count=ShortUrl.access_count + amount, updated_at=ShortUrl.updated_at)
+            .returning(ShortUrl.access_count)
+        )
+
+        await session.commit()
+
+        return access_count
+
+    @instrumented
+    async def add_access_counts(self, counts: dict[str, int]) -> None:
+        """
+        Adds each count to the access count of its short code with a single set-based UPDATE
+        (one per chunk of codes when there are more than fit in one statement).
+
+        Args:
+            counts: A mapping of short code to the number of clicks to add.
+        """
+        session = self.session
+
+        items = list(counts.items())
+        chunk_size = MAX_BIND_PARAMS // 2
+
+        for start in range(0, len(items), chunk_size):
+            deltas = values(column('short_code', String), column('delta', Integer), name='deltas').data(items[start:start + chunk_size])
+
+            await session.execute(
+                update(ShortUrl)
+                .where(ShortUrl.short_code == deltas.c.short_code)
+                .values(access_count=ShortUrl.access_count + deltas.c.delta, updated_at=ShortUrl.updated_at),
+                execution_options={"synchronize_session": False}
+            )
+
+        await session.commit()
+
+    async def _before_commit(self, records: list[ShortUrl]) -> None:
+        await super()._before_commit(records)
+
+        # sent with the write: other workers hear of it exactly when it commits, and never if it rolls back.
+        # they evict by id as well, the row may be cached there under its old short code
+        if records and self.invalidation_bus is not None:
+            await self.invalidation_bus.publish(self.session,
+                                                ids=[record.id for record in records],
+                                                keys=[record.short_code for record in records])
+
+    async def _after_write(self, records: list[ShortUrl]) -> None:
+        await super()._after_write(records)
+
+        if not records:
+            return
+
+        # lookups in flight may have read the old rows, later ones must not join them
+        if self.lookups is not None:
+            for record in records:
+                self.lookups.forget(record.short_code)
+
+        if self.cache is not None:
+            self.cache.invalidate_records(records)
@@ -1,12 +1,16 @@
-from fastapi import APIRouter, Depends, Query
-from fastapi.encoders import jsonable_encoder
-from fastapi.responses import JSONResponse
-from app.core.common.app_response import AppResponse
-from app.core.exceptions import NotFoundException, ServerFailException
+from fastapi import APIRouter, Depends, Query, Request
+from fastapi.responses import StreamingResponse
+from app.core.common.app_response import AppJSONResponse, AppResponse
+from app.core.exceptions import BadRequestException, NotFoundException, ServerFailException
 from app.core.config import AppSettings
+from app.core.db.base_repo import UpsertReturning, UpsertTransaction
 
+from .bulk_delete import bulk_deleter
 from .exceptions import ShortUrlDeleteFail, ShortUrlNotFound
-from .schema import ShortUrlCreateRequest, ShortUrlCreateResult, ShortUrlDeleteManyRequest, ShortUrlGetManyRequest, ShortUrlGetManyResult, ShortUrlGetResult, ShortUrlRead, ShortUrlUpdateManyRequest, ShortUrlUpdateRequest
+from .exporter import MEDIA_TYPES, export_short_urls
+from .importer import ImportFormat, import_short_urls
+from .model import ShortUrl
+from .schema import ShortUrlBulkDeleteJobRequest, ShortUrlBulkDeleteJobResult, ShortUrlCreateRequest, ShortUrlCreateResult, ShortUrlDeleteManyRequest, ShortUrlExportRequest, ShortUrlGetManyRequest, ShortUrlGetManyResult, ShortUrlGetResult, ShortUrlImportResult, ShortUrlRead, ShortUrlUpdateManyRequest, ShortUrlUpdateRequest
 from .service import URLShortenerService
 
 settings = AppSettings()
@@ -19,8 +23,8 @@ async def shorten_url(
     payload: ShortUrlCreateRequest,
     url_short_service: URLShortenerService = Depends(URLShortenerService),
 ):
-    created_short_url = await url_short_service.create_short_url(payload)
-    return AppResponse(data=created_short_url, status_code=201)
+    short_url, created = await url_short_service.create_short_url(payload)
+    return AppResponse(data=short_url, status_code=201 if created else 200)
 
 @router.get('/', response_model=AppResponse[ShortUrlGetManyResult])
 async def get_urls(
@@ -28,15 +32,73 @@ async def get_urls(
     url_short_service: URLShortenerService = Depends(URLShortenerService),
 ):
     data = await url_short_service.get_many(payload=payload)
-    return AppResponse(data=data)
+    return AppJSONResponse(AppResponse(data=data))
 
-@router.post('/bulk-upsert', response_model=AppResponse[list[ShortUrlCreateResult]])
+@router.post('/bulk-upsert', response_model=AppResponse[list[ShortUrlCreateResult] | list[int] | int])
 async def upsert_many(
     payload: list[ShortUrlCreateRequest],
+    returning: UpsertReturning = UpsertReturning.ROWS,
+    transaction: UpsertTransaction = UpsertTransaction.SINGLE,
     url_short_service: URLShortenerService = Depends(URLShortenerService),
 ):
-    created_short_urls = await url_short_service.upsert_short_urls(payload)
-    return AppResponse(data=created_short_urls, status_code=200)
+    created_short_urls = await url_short_service.upsert_short_urls(payload, returning=returning, transaction=transaction)
+    return AppJSONResponse(AppResponse(data=created_short_urls, status_code=200))
+
+
+@router.post('/import', response_model=AppResponse[ShortUrlImportResult])
+async def import_urls(request: Request, format: ImportFormat = 'ndjson'):
+    """Streams a NDJSON or CSV body into the table, see `importer.py` for the expected rows."""
+    result = await import_short_urls(request.stream(), format)
+    return AppResponse(data=result, status_code=200)
+
+
+@router.get('/export')
+async def export_urls(payload: ShortUrlExportRequest = Query(...)):
+    """Streams every short url matching `filter_by` as NDJSON or CSV, memory use does not depend on the number of rows."""
+    # parsed before streaming starts, so invalid filters still answer 400
+    sort_by, filter_by = payload.convert_to_model(ShortUrl)
+
+    filename = f"short_urls.{payload.format}" + (".gz" if payload.gzip else "")
+
+    return StreamingResponse(
+        export_short_urls(where_clause=filter_by, order_clause=sort_by, format=payload.format, gzip=payload.gzip, batch_size=payload.batch_size),
+        media_type='application/gzip' if payload.gzip else MEDIA_TYPES[payload.format],
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'},
+    )
+
+
+@router.post('/bulk-delete/jobs', response_model=AppResponse[ShortUrlBulkDeleteJobResult], status_code=202)
+async def start_bulk_delete(payload: ShortUrlBulkDeleteJobRequest):
+    """Deletes every short url matching `filter_by` in background batches, poll the returned job for progress."""
+    _, filter_by = payload.convert_to_model(ShortUrl)
+
+    if not filter_by:
+        raise BadRequestException(detail="'filter_by' does not select any row")
+
+    throttle = payload.throttle_ms / 1000 if payload.throttle_ms is not None else None
+    job = bulk_deleter.start(filter_by=payload.filter_by, where_clause=filter_by, batch_size=payload.batch_size, throttle=throttle)
+    return AppResponse(data=job.result(), status_code=202)
+
+
+@router.get('/bulk-delete/jobs', response_model=AppResponse[list[ShortUrlBulkDeleteJobResult]])
+async def get_bulk_delete_jobs():
+    return AppResponse(data=[job.result() for job in bulk_deleter.jobs()])
+
+
+@router.get('/bulk-delete/jobs/{job_id}', response_model=AppResponse[ShortUrlBulkDeleteJobResult])
+async def get_bulk_delete_job(job_id: str):
+    job = bulk_deleter.get(job_id)
+    if job is None:
+        raise NotFoundException(detail="Bulk delete job not found")
+    return AppResponse(data=job.result())
+
+
+@router.delete('/bulk-delete/jobs/{job_id}', response_model=AppResponse[ShortUrlBulkDeleteJobResult])
+async def cancel_bulk_delete_job(job_id: str):
+    job = await bulk_deleter.cancel(job_id)
+    if job is None:
+        raise NotFoundException(detail="Bulk delete job not found")
+    return AppResponse(data=job.result())
 
 
 @router.get('/{short_code}')
@@ -82,11 +144,11 @@ async def delete_url(short_code: str, url_short_service: URLShortenerService = D
 @router.post('/bulk-delete')
 async def delete_many(url_ids: ShortUrlDeleteManyRequest, url_short_service: URLShortenerService = Depends(URLShortenerService)):    
     deleted_short_url = await url_short_service.delete_many(url_ids)
-    return AppResponse(data=deleted_short_url, status_code=200, message="Successfully deleted")
+    return AppJSONResponse(AppResponse(data=deleted_short_url, status_code=200, message="Successfully deleted"))
 
 
 
 @router.post('/bulk-update')
 async def update_many(payload: ShortUrlUpdateManyRequest, url_short_service: URLShortenerService = Depends(URLShortenerService)):    
     updated_result = await url_short_service.update_many(payload)
-    return AppResponse(data=updated_result, status_code=200, message="Successfully updated")
+    return AppJSONResponse(AppResponse(data=updated_result, status_code=200, message="Successfully updated"))
@@ -2,12 +2,12 @@
 
 from datetime import datetime
 from re import S
-from typing import Optional
-from pydantic import AliasGenerator, BaseModel, ConfigDict
+from typing import Literal, Optional
+from pydantic import AliasGenerator, BaseModel, ConfigDict, Field
 from pydantic.alias_generators import to_camel
 
 from app.api.v1.short_urls.model import ShortUrl
-from app.core.common.pagination_factory import PaginationFactory
+from app.core.common.pagination_factory import FilterQuery, PaginationFactory, SortFilterQuery
 
 
 class ShortUrlRead(BaseModel):
@@ -25,11 +25,13 @@ class ShortUrlRead(BaseModel):
 
 class ShortUrlCreate(BaseModel):
     url: str
+    url_hash: bytes
     short_code: str
 
 
 class ShortUrlUpdate(BaseModel):
     url: str
+    url_hash: bytes
     access_count: Optional[int] = None
 
 
@@ -62,7 +64,9 @@ class ShortUrlUpdateResult(ShortUrlRead):
 
 
 class ShortUrlGetResult(ShortUrlRead):
-    pass
+    counting_mode: Optional[str] = None
+    # expected absolute error of access_count, in clicks, for the configured counting mode
+    access_count_error_bound: Optional[float] = None
 
 
 class ShortUrlDeleteResult(ShortUrlRead):
@@ -80,6 +84,11 @@ class ShortUrlManyPayload(BaseModel):
     access_count: Optional[int] = None
 
 
+class ShortUrlUpdateMany(ShortUrlManyPayload):
+    # set along with url
+    url_hash: Optional[bytes] = None
+
+
 class ShortUrlUpdateManyRequest(BaseModel):
     records: list[ShortUrlManyPayload]
 
@@ -94,15 +103,84 @@ class ShortUrlUpdateManyResult(BaseModel):
     )
 
 
-PaginatedShortUrl = PaginationFactory.create_pagination(sortable_fields=ShortUrl.columns(), filterable_fields=ShortUrl.columns())
+class ShortUrlImportRejection(BaseModel):
+    line: int
+    reason: str
+
+
+class ShortUrlImportResult(BaseModel):
+    rows_read: int
+    rows_rejected: int
+    rows_inserted: int
+    # urls that already existed, repeated urls, or legacy short codes already taken
+    rows_skipped: int
+    # rows in the table once the import is done
+    total_rows: int
+    duration_seconds: float
+    rows_per_second: float
+    # the first rejected rows only
+    rejected: list[ShortUrlImportRejection]
+
+    model_config = ConfigDict(
+        alias_generator=AliasGenerator(to_camel),
+        populate_by_name=True,
+    )
+
+
+# url_hash is an implementation detail of url deduplication, never exposed to clients
+QUERYABLE_FIELDS = ShortUrl.columns() - {'url_hash'}
+
+PaginatedShortUrl = PaginationFactory.create_pagination(sortable_fields=QUERYABLE_FIELDS, filterable_fields=QUERYABLE_FIELDS)
 # PaginatedShortUrl = PaginationMixin.create_pagination_mixin(sortable_fields=ShortUrl.columns(), filterable_fields=ShortUrl.columns())
 class ShortUrlGetManyRequest(PaginatedShortUrl):    
     pass
 
 
+ExportFormat = Literal['ndjson', 'csv']
+
+
+class ShortUrlExportRequest(PaginationFactory.create_pagination(sortable_fields=QUERYABLE_FIELDS, filterable_fields=QUERYABLE_FIELDS, base=SortFilterQuery)):
+    format: ExportFormat = 'ndjson'
+    gzip: bool = False
+    # rows fetched from the server-side cursor at once
+    batch_size: int = Field(default=1000, ge=1, le=10_000)
+
+
+class ShortUrlBulkDeleteJobRequest(PaginationFactory.create_pagination(filterable_fields=QUERYABLE_FIELDS, base=FilterQuery)):
+    # required: a bulk delete never runs without a filter
+    filter_by: str = Field(min_length=1)
+    # default to the BULK_DELETE_* settings
+    batch_size: Optional[int] = Field(default=None, ge=1, le=100_000)
+    throttle_ms: Optional[int] = Field(default=None, ge=0)
+
+
+class ShortUrlBulkDeleteJobResult(BaseModel):
+    job_id: str
+    status: str
+    filter_by: str
+    batch_size: int
+    throttle_ms: int
+    deleted: int
+    batches: int
+    # planner estimate of the matching rows when the job started
+    estimated_total: Optional[int] = None
+    rows_per_second: float
+    started_at: datetime
+    finished_at: Optional[datetime] = None
+    error: Optional[str] = None
+
+    model_config = ConfigDict(
+        alias_generator=AliasGenerator(to_camel),
+        populate_by_name=True,
+    )
+
+
 class ShortUrlGetManyResult(BaseModel):
-    total_count: int
+    # None when requested with `count=none`
+    total_count: Optional[int] = None
     data: list[ShortUrlRead]
+    # set when paginating with cursors and more rows follow
+    next_cursor: Optional[str] = None
 
     model_config = ConfigDict(
         alias_generator=AliasGenerator(to_camel),
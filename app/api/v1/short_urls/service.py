@@ -1,68 +1,117 @@
 
-import string
-import random
-
 from sqlalchemy import asc, desc
 
-from app.api.v1.short_urls.model import ShortUrl
-from app.api.v1.short_urls.schema import ShortUrlCreate, ShortUrlCreateRequest, ShortUrlCreateResult, ShortUrlDeleteManyRequest, ShortUrlDeleteResult, ShortUrlGetManyRequest, ShortUrlGetManyResult, ShortUrlGetResult, ShortUrlRead, ShortUrlUpdate, ShortUrlUpdateManyRequest, ShortUrlUpdateManyResult, ShortUrlUpdateResult
+from app.api.v1.short_urls.model import ShortUrl, hash_url
+from app.api.v1.short_urls.schema import ShortUrlCreate, ShortUrlCreateRequest, ShortUrlCreateResult, ShortUrlDeleteManyRequest, ShortUrlDeleteResult, ShortUrlGetManyRequest, ShortUrlGetManyResult, ShortUrlGetResult, ShortUrlRead, ShortUrlUpdate, ShortUrlUpdateMany, ShortUrlUpdateManyRequest, ShortUrlUpdateManyResult, ShortUrlUpdateResult
+from app.core.db.base_repo import UpsertReturning, UpsertTransaction
 from app.core.db.dependencies import get_repository
-from app.core.exceptions import BadRequestException, NotFoundException
+from app.core.exceptions import BadRequestException, NotFoundException, ServerFailException
 
+from .click_counter import click_counting
+from .code_allocator import code_allocator
+from .exceptions import ShortCodeTaken, UrlAlreadyShortened
 from .repository import URLShortRepository
 
 
+# allocated codes are unique, only random codes created before the allocator existed can collide
+MAX_SHORT_CODE_ATTEMPTS = 5
+
+
 class URLShortenerService:
-    def __init__(self, code_length=6, url_short_repo: URLShortRepository = get_repository(URLShortRepository)):
-        self.code_length = code_length
+    def __init__(self, url_short_repo: URLShortRepository = get_repository(URLShortRepository)):
         self.url_short_repo = url_short_repo
+        self.click_counting = click_counting
+        self.code_allocator = code_allocator
+
+    async def create_short_url(self, payload: ShortUrlCreateRequest) -> tuple[ShortUrlCreateResult, bool]:
+        """
+        Returns the short url of `payload.url` and whether it was just created: shortening a url
+        that already has a short url returns the existing one.
+        """
+        existing_short_url = await self.url_short_repo.get_by_url(payload.url, return_model=ShortUrlCreateResult)
+
+        if existing_short_url is not None:
+            return existing_short_url, False
+
+        url_hash = hash_url(payload.url)
+
+        for _ in range(MAX_SHORT_CODE_ATTEMPTS):
+            short_code = await self.code_allocator.allocate(self.url_short_repo)
+            try:
+                return await self.url_short_repo.create(data=ShortUrlCreate(url=payload.url, url_hash=url_hash, short_code=short_code),
+                                                        return_model=ShortUrlCreateResult), True
+            except ShortCodeTaken:
+                continue
+            except UrlAlreadyShortened:
+                # shortened by a concurrent request since the lookup
+                return await self.url_short_repo.get_by_url(payload.url, return_model=ShortUrlCreateResult), False
+
+        raise ServerFailException(detail="Could not allocate a free short code")
 
-    async def _generate_short_code(self) -> str:
-        characters = string.ascii_letters + string.digits
-        while True:
-            code = ''.join(random.choices(characters, k=self.code_length))
-            if not await self.url_short_repo.get_by_short_code(short_code=code):
-                return code
+    async def _allocate_free_short_codes(self, count: int) -> list[str]:
+        """Allocates `count` codes at once and replaces the (rare) ones already taken by random legacy codes."""
+        short_codes = await self.code_allocator.allocate_many(self.url_short_repo, count)
 
-    async def create_short_url(self, payload: ShortUrlCreateRequest) -> ShortUrlCreateResult:
-        short_code = await self._generate_short_code()
-        return await self.url_short_repo.create(data=ShortUrlCreate(url=payload.url, short_code=short_code), return_model=ShortUrlCreateResult)
+        for _ in range(MAX_SHORT_CODE_ATTEMPTS):
+            taken_short_codes = await self.url_short_repo.get_taken_short_codes(short_codes)
+
+            if not taken_short_codes:
+                return short_codes
+
+            replacements = iter(await self.code_allocator.allocate_many(self.url_short_repo, len(taken_short_codes)))
+            short_codes = [next(replacements) if short_code in taken_short_codes else short_code for short_code in short_codes]
+
+        raise ServerFailException(detail="Could not allocate free short codes")
 
     async def get_short_url(self, short_code: str, update_stats=False) -> ShortUrlGetResult | None:
-        short_url: ShortUrlGetResult = await self.url_short_repo.get_by_short_code(short_code=short_code)
+        # stats readers want the current access_count, only redirects are served from the cache
+        short_url: ShortUrlGetResult = await self.url_short_repo.get_by_short_code(short_code=short_code, use_cache=update_stats)
 
         if not short_url:
             raise NotFoundException
-        
+
         if not update_stats:
-            return short_url
+            return self.click_counting.stats(short_url)
+
+        counted_short_url = await self.click_counting.count(self.url_short_repo, short_url)
 
-        short_url.access_count += 1
+        if counted_short_url is None:
+            raise NotFoundException
 
-        return await self.url_short_repo.update_one(data=short_url,
-                                                    where_clause=[ShortUrl.short_code == short_code])
+        return counted_short_url
 
     async def update_short_url(self, short_code: str, new_url: str) -> ShortUrlUpdateResult | None:
-        data = ShortUrlUpdate(url=new_url)
+        data = ShortUrlUpdate(url=new_url, url_hash=hash_url(new_url))
         return await self.url_short_repo.update_one(data=data, return_model=ShortUrlUpdateResult, where_clause=[ShortUrl.short_code == short_code])
 
     async def delete_short_url(self, short_code: str) -> ShortUrlDeleteResult | None:
         return await self.url_short_repo.delete_one(val=short_code, field='short_code', return_model=ShortUrlDeleteResult)
 
-    async def upsert_short_urls(self, payload: list[ShortUrlCreateRequest]) -> list[ShortUrlCreateResult]:
-        transformed_payload = [ShortUrlCreate(url=item.url, short_code=await self._generate_short_code()) for item in payload]
-        return await self.url_short_repo.upsert_many(data=transformed_payload, index_elements=[ShortUrl.url], return_model=ShortUrlCreateResult)
+    async def upsert_short_urls(self,
+                                payload: list[ShortUrlCreateRequest],
+                                returning: UpsertReturning = UpsertReturning.ROWS,
+                                transaction: UpsertTransaction = UpsertTransaction.SINGLE) -> list[ShortUrlCreateResult] | list[int] | int:
+        short_codes = await self._allocate_free_short_codes(len(payload))
+        transformed_payload = [ShortUrlCreate(url=item.url, url_hash=hash_url(item.url), short_code=short_code) for item, short_code in zip(payload, short_codes)]
+        # urls already shortened keep their short code, the codes allocated for them go unused
+        return await self.url_short_repo.upsert_many(data=transformed_payload, index_elements=[ShortUrl.url_hash], return_model=ShortUrlCreateResult,
+                                                     returning=returning, transaction=transaction,
+                                                     insert_only=[ShortUrl.short_code, ShortUrl.url_hash])
 
     async def delete_many(self, payload: ShortUrlDeleteManyRequest):
         return await self.url_short_repo.delete_many(where_clause=[ShortUrl.id.in_(payload.ids)])
 
     async def update_many(self, payload: ShortUrlUpdateManyRequest) -> ShortUrlUpdateManyResult:
-        data = await self.url_short_repo.update_many(data=payload.records)
+        records = [
+            ShortUrlUpdateMany(**record.model_dump(), url_hash=hash_url(record.url) if record.url is not None else None)
+            for record in payload.records
+        ]
+        data = await self.url_short_repo.update_many(data=records)
         updated_records = len(data)
         return ShortUrlUpdateManyResult(updated_records=updated_records, data=data)
 
     async def get_many(self, payload: ShortUrlGetManyRequest) -> ShortUrlGetManyResult:
         sort_by, filter_by = payload.convert_to_model(ShortUrl)
-        paginated_short_urls = await self.url_short_repo.get_many(page=payload.page, size=payload.size, order_clause=sort_by, where_clause=filter_by, return_model=ShortUrlRead) 
+        paginated_short_urls = await self.url_short_repo.get_many(page=payload.page, size=payload.size, cursor=payload.cursor, count_policy=payload.count, order_clause=sort_by, where_clause=filter_by, return_model=ShortUrlRead) 
         
-        return ShortUrlGetManyResult(total_count=paginated_short_urls.total_count, data=paginated_short_urls.data)
\ No newline at end of file
+        return ShortUrlGetManyResult(total_count=paginated_short_urls.total_count, data=paginated_short_urls.data, next_cursor=paginated_short_urls.next_cursor)
\ No newline at end of file
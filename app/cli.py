@@ -0,0 +1,57 @@
+import argparse
+import asyncio
+from typing import AsyncIterator
+
+from app.api.v1.short_urls.importer import PARSERS, ImportFormat, import_short_urls
+from app.api.v1.short_urls.model import migrate_url_hash
+from app.core.db.database import engine
+
+
+async def _read_file(path: str, chunk_size: int = 1024 * 1024) -> AsyncIterator[bytes]:
+    with open(path, 'rb') as file:
+        while chunk := file.read(chunk_size):
+            yield chunk
+
+
+async def import_file(path: str, format: ImportFormat) -> None:
+    try:
+        result = await import_short_urls(_read_file(path), format)
+        print(result.model_dump_json(indent=2))
+    finally:
+        await engine.dispose()
+
+
+async def migrate() -> None:
+    try:
+        if engine.dialect.name != 'postgresql':
+            print("Nothing to migrate, tables are created with the current schema")
+        elif await migrate_url_hash(engine):
+            print("short_urls.url_hash added and indexed")
+        else:
+            print("Already up to date")
+    finally:
+        await engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.cli")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser("import", help="import short urls from a NDJSON or CSV file")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--format", choices=list(PARSERS), default=None,
+                               help="defaults to the file extension")
+
+    commands.add_parser("migrate", help="bring the tables of an existing database up to date, once per database")
+
+    args = parser.parse_args()
+
+    if args.command == "import":
+        format = args.format or ('csv' if args.path.endswith('.csv') else 'ndjson')
+        asyncio.run(import_file(args.path, format))
+    elif args.command == "migrate":
+        asyncio.run(migrate())
+
+
+if __name__ == "__main__":
+    main()
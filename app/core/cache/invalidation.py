@@ -0,0 +1,168 @@
+import asyncio
+import json
+import logging
+from typing import Any, Callable, Optional
+
+import asyncpg
+from sqlalchemy import ARRAY, Text, bindparam, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+logger = logging.getLogger(__name__)
+
+# postgres rejects NOTIFY payloads of 8000 bytes or more
+MAX_PAYLOAD_BYTES = 7900
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, separators=(',', ':'))
+
+
+class InvalidationBus:
+    """
+    Broadcasts cache invalidations to every worker through Postgres LISTEN/NOTIFY.
+
+    Writers call `publish` with the ids and keys they changed, in the transaction of the change, each
+    worker runs a background task holding a dedicated asyncpg connection that LISTENs on the channel and
+    hands incoming payloads to `on_invalidate`. Notifications sent while a listener is disconnected are lost, so `on_resync` is
+    called every time the connection is (re)established to drop everything the worker may have missed.
+    """
+
+    def __init__(self,
+                 dsn: str,
+                 channel: str,
+                 on_invalidate: Callable[[list[Any], list[str]], None],
+                 on_resync: Callable[[], None],
+                 reconnect_delay: float = 1.0,
+                 max_reconnect_delay: float = 30.0,
+                 healthcheck_interval: float = 15.0):
+        self.dsn = dsn
+        self.channel = channel
+        self.on_invalidate = on_invalidate
+        self.on_resync = on_resync
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.healthcheck_interval = healthcheck_interval
+
+        self.received = 0
+        self.published = 0
+        self.resyncs = 0
+
+        self._task: Optional[asyncio.Task] = None
+        self._connected = asyncio.Event()
+
+    @property
+    def connected(self) -> bool:
+        return self._connected.is_set()
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name=f"invalidation-bus:{self.channel}")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def publish(self, session: AsyncSession, ids: list[Any], keys: list[str]) -> None:
+        """
+        Sends the changed ids and keys on the channel, split in as many notifications as needed
+        to stay below the payload limit. Call it in the transaction of the change, before its commit:
+        postgres only delivers notifications once their transaction commits, and drops them on rollback.
+        """
+        payloads = self.build_payloads(ids, keys)
+
+        if not payloads:
+            return
+
+        # one round-trip however many notifications are needed
+        payload_rows = func.unnest(bindparam('payloads', payloads, type_=ARRAY(Text))).table_valued('payload').render_derived()
+        await session.execute(select(func.pg_notify(self.channel, payload_rows.c.payload)).select_from(payload_rows))
+
+        self.published += len(payloads)
+
+    @staticmethod
+    def build_payloads(ids: list[Any], keys: list[str]) -> list[str]:
+        payloads = []
+        chunk: dict[str, list] = {"ids": [], "keys": []}
+        chunk_size = len(_dumps(chunk))
+
+        for field, values in (("ids", ids), ("keys", keys)):
+            for value in values:
+                # value plus its separating comma
+                value_size = len(_dumps(value).encode()) + 1
+
+                if chunk_size + value_size > MAX_PAYLOAD_BYTES:
+                    payloads.append(_dumps(chunk))
+                    chunk = {"ids": [], "keys": []}
+                    chunk_size = len(_dumps(chunk))
+
+                chunk[field].append(value)
+                chunk_size += value_size
+
+        if chunk["ids"] or chunk["keys"]:
+            payloads.append(_dumps(chunk))
+
+        return payloads
+
+    def _handle_notification(self, connection: asyncpg.Connection, pid: int, channel: str, payload: str) -> None:
+        self.received += 1
+
+        try:
+            message = json.loads(payload)
+            self.on_invalidate(message.get("ids", []), message.get("keys", []))
+        except Exception:
+            # an unreadable message could hide any change, so drop everything rather than serve stale data
+            logger.exception(f"Invalid payload on channel '{channel}', resyncing")
+            self._resync()
+
+    def _resync(self) -> None:
+        self.resyncs += 1
+        self.on_resync()
+
+    async def _run(self) -> None:
+        delay = self.reconnect_delay
+
+        while True:
+            connection: Optional[asyncpg.Connection] = None
+            terminated = asyncio.Event()
+
+            try:
+                connection = await asyncpg.connect(self.dsn)
+                connection.add_termination_listener(lambda _: terminated.set())
+                await connection.add_listener(self.channel, self._handle_notification)
+
+                self._connected.set()
+                # anything published while we were not listening is lost
+                self._resync()
+                delay = self.reconnect_delay
+
+                logger.info(f"Listening for cache invalidations on channel '{self.channel}'")
+
+                while not terminated.is_set():
+                    try:
+                        await asyncio.wait_for(terminated.wait(), timeout=self.healthcheck_interval)
+                    except asyncio.TimeoutError:
+                        # a half-open socket never fires the termination listener
+                        await connection.execute("SELECT 1", timeout=self.healthcheck_interval)
+
+                logger.warning(f"Invalidation listener on channel '{self.channel}' was disconnected")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Invalidation listener on channel '{self.channel}' failed: {e}")
+            finally:
+                if self._connected.is_set():
+                    # entries cached from here on may miss invalidations until we reconnect
+                    self._connected.clear()
+                    self._resync()
+                if connection is not None and not connection.is_closed():
+                    connection.terminate()
+
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
@@ -0,0 +1,124 @@
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, Generic, Hashable, Optional, TypeVar
+
+K = TypeVar('K', bound=Hashable)
+V = TypeVar('V')
+
+# rough per-entry cost of the OrderedDict slot and the (value, expires_at, size) tuple
+ENTRY_OVERHEAD = 200
+
+
+class TTLCache(Generic[K, V]):
+    """
+    In-process cache with LRU eviction and a per-entry time-to-live.
+
+    The cache is bounded both by number of entries and by an estimate of the memory held
+    by its keys and values. It is not thread-safe and is meant to be used from a single event loop.
+    """
+
+    def __init__(self, max_entries: int = 10_000, max_bytes: int = 64 * 1024 * 1024, ttl: float = 60.0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        self._entries: OrderedDict[K, tuple[V, float, int]] = OrderedDict()
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: K) -> bool:
+        return key in self._entries
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    def get(self, key: K) -> Optional[V]:
+        """Returns the cached value for `key`, or None when missing or expired."""
+        entry = self._entries.get(key)
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        value, expires_at, _ = entry
+
+        if expires_at <= time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: K, value: V, ttl: Optional[float] = None) -> None:
+        """Stores `value` under `key`, evicting least recently used entries to stay within bounds."""
+        size = self.estimate_size(key, value)
+
+        if key in self._entries:
+            self._remove(key)
+
+        # a single value larger than the whole budget would just flush the cache
+        if size > self.max_bytes:
+            return
+
+        self._entries[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl), size)
+        self._bytes += size
+
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self.evictions += 1
+
+    def invalidate(self, key: K) -> bool:
+        """Drops `key` from the cache, returns whether it was present."""
+        if key not in self._entries:
+            return False
+
+        self._remove(key)
+        self.invalidations += 1
+        return True
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+    def _remove(self, key: K) -> V:
+        value, _, size = self._entries.pop(key)
+        self._bytes -= size
+        return value
+
+    @staticmethod
+    def estimate_size(key: Any, value: Any) -> int:
+        """Estimates the memory held by an entry, counting one level of attributes for objects such as pydantic models."""
+        size = ENTRY_OVERHEAD + sys.getsizeof(key) + sys.getsizeof(value)
+
+        attributes = getattr(value, '__dict__', None)
+        if attributes:
+            size += sum(sys.getsizeof(attr) for attr in attributes.values())
+
+        return size
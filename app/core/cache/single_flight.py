@@ -0,0 +1,104 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Generic, Hashable, TypeVar
+
+K = TypeVar('K', bound=Hashable)
+V = TypeVar('V')
+
+
+class _Flight:
+    __slots__ = ('future', 'forgotten')
+
+    def __init__(self, future: asyncio.Future):
+        self.future = future
+        self.forgotten = False
+
+
+class SingleFlight(Generic[K, V]):
+    """
+    Coalesces concurrent calls for the same key: while a call for a key is in flight, later calls
+    for that key wait for its outcome instead of running their own.
+
+    The first caller (the leader) runs its function inline, in its own task and context, and the
+    callers that joined it get the same result or the same exception. Cancelling a follower only
+    stops it from waiting. Cancelling the leader cancels the flight: its followers are not cancelled,
+    they start over and one of them leads a new flight. Nothing is remembered once a flight lands,
+    the next call runs again. Meant to be used from a single event loop.
+
+    `forget` detaches the flight of a key whose data changed: later calls run again instead of joining
+    it, and its callers are told their result is from a forgotten flight, so they do not keep it.
+    """
+
+    def __init__(self):
+        self._flights: dict[K, _Flight] = {}
+
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+        self.failures = 0
+        self.forgotten = 0
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._flights)
+
+    async def do(self, key: K, fn: Callable[[], Awaitable[V]]) -> tuple[V, bool]:
+        """
+        Returns the result of `fn()`, or of the call in flight for `key` if there is one, and whether
+        that flight was forgotten before it landed.
+        """
+        self.calls += 1
+
+        while True:
+            flight = self._flights.get(key)
+
+            if flight is None:
+                return await self._lead(key, fn)
+
+            # unlike awaiting the future, wait() only raises when this caller is cancelled
+            await asyncio.wait([flight.future])
+
+            if not flight.future.cancelled():
+                self.coalesced += 1
+                return flight.future.result(), flight.forgotten
+
+    def forget(self, key: K) -> None:
+        """Detaches the flight of `key`, if any, calls made from now on run again."""
+        flight = self._flights.pop(key, None)
+
+        if flight is not None:
+            flight.forgotten = True
+            self.forgotten += 1
+
+    async def _lead(self, key: K, fn: Callable[[], Awaitable[V]]) -> tuple[V, bool]:
+        flight = self._flights[key] = _Flight(asyncio.get_running_loop().create_future())
+        future = flight.future
+        self.executions += 1
+
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            self.failures += 1
+            future.set_exception(e)
+            # followers re-raise it, a flight nobody joined must not log it as never retrieved
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result, flight.forgotten
+        finally:
+            # a forgotten flight may already have been replaced by a newer one
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "calls": self.calls,
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "failures": self.failures,
+            "forgotten": self.forgotten,
+        }
@@ -1,6 +1,10 @@
-from typing import Generic, Optional, TypeVar
+from typing import Any, Generic, Optional, TypeVar
+from fastapi.responses import JSONResponse
 from pydantic import AliasGenerator, BaseModel, ConfigDict, Field
 from pydantic.alias_generators import to_camel
+from pydantic_core import to_json
+
+from app.core.metrics.timing import phase
 
 T = TypeVar('T')
 
@@ -16,5 +20,19 @@ class AppResponse(BaseModel, Generic[T]):
         alias_generator=AliasGenerator(to_camel),
         populate_by_name=True,
     )
+
+
+class AppJSONResponse(JSONResponse):
+    """
+    JSON response encoded to bytes in one pass by pydantic-core, models are dumped with their camelCase aliases.
+
+    It is the default response class of the application. Endpoints returning large payloads can also return
+    `AppJSONResponse(AppResponse(...))` themselves: FastAPI then skips re-validating and dumping the result
+    through `response_model`, which only documents the schema.
+    """
+
+    def render(self, content: Any) -> bytes:
+        with phase('render'):
+            return to_json(content, by_alias=True)
     
         
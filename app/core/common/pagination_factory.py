@@ -1,7 +1,11 @@
+import base64
+import binascii
 import enum
+import json
+from datetime import datetime
 from typing import Any, Optional
-from pydantic import BaseModel, Field, field_validator
-from sqlalchemy import Boolean, ColumnElement, DateTime, Float, Integer, asc, desc
+from pydantic import BaseModel, Field, field_validator, model_validator
+from sqlalchemy import BigInteger, Boolean, ColumnElement, DateTime, Float, Integer, SmallInteger, asc, desc
 from sqlalchemy.orm.attributes import InstrumentedAttribute
 
 
@@ -9,11 +13,40 @@ from app.core.db.database import Base
 from app.core.exceptions import BadRequestException
 
 
+class CountPolicy(str, enum.Enum):
+    # count(*) computed with the page, in the same statement
+    EXACT = 'exact'
+    # planner estimate, from pg_class.reltuples or the row estimate of EXPLAIN
+    ESTIMATED = 'estimated'
+    # exact count memoized per filter for a short time
+    CACHED = 'cached'
+    # no total_count at all
+    NONE = 'none'
+
+
+class FilterQuery(BaseModel):
+    filter_by: Optional[str] = None
+
+
+class SortFilterQuery(FilterQuery):
+    sort_by: Optional[str] = None
+
+
 class PaginationQuery(BaseModel):
-    page: int = Field(ge=1)
+    # leave `page` out to paginate with cursors: the first page is requested without `cursor`,
+    # the following ones pass the `next_cursor` returned with the previous page
+    page: Optional[int] = Field(default=None, ge=1)
     size: int = Field(ge=1)
     sort_by: Optional[str] = None
     filter_by: Optional[str] = None
+    cursor: Optional[str] = None
+    count: CountPolicy = CountPolicy.EXACT
+
+    @model_validator(mode='after')
+    def validate_pagination_mode(self):
+        if self.page is not None and self.cursor is not None:
+            raise ValueError("Pass either 'page' or 'cursor', not both")
+        return self
 
 
 class InvalidDatetimeValue(Exception):
@@ -84,6 +117,86 @@ class FieldOperation:
         raise ValueError("No suppoerted oeprations were determined")
 
 
+class InvalidCursor(Exception):
+    pass
+
+
+class PaginationCursor:
+    """
+    Opaque keyset pagination cursor.
+
+    Holds the sort keys it was created for (`-field` for descending ones) and the values of these
+    keys in the last row of a page, as urlsafe base64 encoded json.
+    """
+
+    @classmethod
+    def encode(cls, sort_keys: list[str], values: list[Any]) -> str:
+        values = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+        payload = json.dumps({"k": sort_keys, "v": values}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    @classmethod
+    def decode(cls, cursor: str, sort_keys: list[str], columns: list[Any]) -> list[Any]:
+        """
+        Returns the values held by `cursor`, converted to the types of `columns`.
+
+        Raises:
+            InvalidCursor: If the cursor is malformed or was created for other sort keys.
+        """
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+            cursor_sort_keys, values = payload["k"], payload["v"]
+        except (binascii.Error, ValueError, TypeError, KeyError) as e:
+            raise InvalidCursor("Cursor is malformed") from e
+
+        if not isinstance(values, list):
+            raise InvalidCursor("Cursor is malformed")
+        if cursor_sort_keys != sort_keys or len(values) != len(columns):
+            raise InvalidCursor("Cursor does not match the requested sort_by")
+
+        return [cls._coerce(column, value) for column, value in zip(columns, values)]
+
+    @staticmethod
+    def _coerce(column: Any, value: Any) -> Any:
+        """
+        Converts a json decoded cursor value to the python type of `column`.
+
+        Raises:
+            InvalidCursor: If the value does not fit the column, so a tampered cursor is rejected before it is bound.
+        """
+        if value is None:
+            return None
+
+        column_type = column.type
+        try:
+            python_type = column_type.python_type
+        except NotImplementedError:
+            return value
+
+        if isinstance(column_type, DateTime) or python_type is datetime:
+            if not isinstance(value, str):
+                raise InvalidCursor("Cursor is malformed")
+            try:
+                return datetime.fromisoformat(value)
+            except ValueError as e:
+                raise InvalidCursor("Cursor is malformed") from e
+
+        # json has no separate bool, so True would otherwise pass as an int
+        if isinstance(value, bool) and python_type is not bool:
+            raise InvalidCursor("Cursor is malformed")
+        if python_type is float and isinstance(value, int):
+            return float(value)
+        if not isinstance(value, python_type):
+            raise InvalidCursor("Cursor is malformed")
+
+        if isinstance(column_type, Integer):
+            bits = 16 if isinstance(column_type, SmallInteger) else 64 if isinstance(column_type, BigInteger) else 32
+            if not -2 ** (bits - 1) <= value < 2 ** (bits - 1):
+                raise InvalidCursor("Cursor is malformed")
+
+        return value
+
+
 class PaginationParser:
     @classmethod
     def split_and_clean_fields(cls, fields: Optional[str] = None) -> list[str]:
@@ -205,18 +318,22 @@ class PaginationFilterParser(PaginationParser):
 
 class PaginationFactory:
     @staticmethod
-    def create_pagination(sortable_fields: list[str] = [], filterable_fields: list[str] = []):
+    def create_pagination(sortable_fields: list[str] = [], filterable_fields: list[str] = [], base: type[BaseModel] = PaginationQuery):
+        """
+        `base` is the query model to extend: `SortFilterQuery` for endpoints taking `sort_by` and `filter_by`
+        without paging, `FilterQuery` for `filter_by` alone.
+        """
         filter_parser = PaginationFilterParser()
         sort_parser = PaginationSortParser()
 
-        class CustomPaginationQuery(PaginationQuery):
+        class CustomPaginationQuery(base):
             def convert_to_model(self, model: Base):
-                sort_by = sort_parser._process_sort_fields(self.sort_by, model)
+                sort_by = sort_parser._process_sort_fields(getattr(self, 'sort_by', None), model)
                 filter_by = filter_parser._process_filter_fields(
                     self.filter_by, model)
                 return sort_by, filter_by
 
-            @field_validator('sort_by')
+            @field_validator('sort_by', check_fields=False)
             def validate_sort_fields(cls, v):
                 if not v:
                     return v
@@ -231,7 +348,7 @@ class PaginationFactory:
 
                 return v
 
-            @field_validator('filter_by')
+            @field_validator('filter_by', check_fields=False)
             def validate_filter_fields(cls, v):
                 if not v:
                     return v
@@ -1,18 +1,183 @@
 # import os
+from typing import Literal, Optional
+
+from pydantic import Field, model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 # ------------- database ------------
+class DatabaseSettings(BaseSettings):
+    # postgres: PostgresSettings, sqlite: a single database file next to the app, see SQLiteSettings
+    DB_BACKEND: Literal['postgres', 'sqlite'] = 'postgres'
+
+
 class PostgresSettings(BaseSettings):
-    PG_USER: str
-    PG_PW: str
-    PG_SERVER: str
-    PG_PORT: str
-    PG_DB: str
+    # required with the postgres backend
+    PG_USER: Optional[str] = None
+    PG_PW: Optional[str] = None
+    PG_SERVER: Optional[str] = None
+    PG_PORT: Optional[str] = None
+    PG_DB: Optional[str] = None
+
+    # connection pool, per worker process
+    PG_POOL_SIZE: int = 5
+    PG_MAX_OVERFLOW: int = 10
+    PG_POOL_TIMEOUT_SECONDS: float = 30.0
+    # -1 never recycles connections
+    PG_POOL_RECYCLE_SECONDS: int = -1
+    PG_POOL_PRE_PING: bool = False
+
+    # asyncpg: prepared statements cached per connection by sqlalchemy and by asyncpg itself,
+    # set both to 0 behind pgbouncer in transaction pooling mode
+    PG_PREPARED_STATEMENT_CACHE_SIZE: int = 100
+    PG_STATEMENT_CACHE_SIZE: int = 100
+    PG_COMMAND_TIMEOUT_SECONDS: Optional[float] = None
+
+    # server settings of every connection
+    PG_APPLICATION_NAME: str = "fast_url_shortner"
+    PG_STATEMENT_TIMEOUT_MS: Optional[int] = None
+    # JIT compilation costs more than it saves on short OLTP queries
+    PG_JIT: bool = False
+
+    # read replicas as a json list of "host[:port]", sharing the credentials and database name of the primary
+    PG_REPLICAS: list[str] = []
+    PG_REPLICA_SELECTION: Literal['round_robin', 'least_connections'] = 'round_robin'
+    # replicas lagging more than this are skipped, reads go to the primary when none is left
+    PG_REPLICA_MAX_LAG_SECONDS: float = 5.0
+    PG_REPLICA_LAG_CHECK_SECONDS: float = 2.0
+
+
+class SQLiteSettings(BaseSettings):
+    SQLITE_PATH: str = "fast_url_shortner.db"
+    # readers never block the writer (nor each other) in WAL mode, writers take turns
+    SQLITE_POOL_SIZE: int = 5
+    SQLITE_MAX_OVERFLOW: int = 10
+    # a writer waits this long for the write lock before failing with "database is locked"
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    # NORMAL only syncs at checkpoints in WAL mode: a power loss can lose the last commits, never corrupt the file
+    SQLITE_SYNCHRONOUS: Literal['OFF', 'NORMAL', 'FULL'] = 'NORMAL'
+    # page cache per connection, and the part of the file read through mmap rather than read() calls
+    SQLITE_CACHE_SIZE_KB: int = 64 * 1024
+    SQLITE_MMAP_SIZE_BYTES: int = 256 * 1024 * 1024
+    # pages the WAL grows to before it is checkpointed into the database file
+    SQLITE_WAL_AUTOCHECKPOINT_PAGES: int = 1000
+
+
+# ------------- cache ------------
+class CacheSettings(BaseSettings):
+    CACHE_ENABLED: bool = True
+    CACHE_MAX_ENTRIES: int = 100_000
+    CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    CACHE_TTL_SECONDS: float = 300.0
+
+    # cross-worker invalidation over postgres LISTEN/NOTIFY
+    CACHE_INVALIDATION_ENABLED: bool = True
+    CACHE_INVALIDATION_CHANNEL: str = "short_urls_invalidation"
+    CACHE_INVALIDATION_RECONNECT_SECONDS: float = 1.0
+    CACHE_INVALIDATION_HEALTHCHECK_SECONDS: float = 15.0
+
+    # concurrent lookups of the same short code missing the cache share a single query
+    CACHE_COALESCE_LOOKUPS: bool = True
+
+    # total counts of listings requested with `count=cached`, per filter
+    CACHE_COUNT_MAX_ENTRIES: int = 1024
+    CACHE_COUNT_TTL_SECONDS: float = 30.0
+
+
+# ------------- click counting ------------
+class ClickCounterSettings(BaseSettings):
+    # atomic: one UPDATE per click, exact
+    # batched: buffer increments in memory and write them in batches
+    # sampled: batched, and links above the threshold only count one in CLICK_SAMPLING_FACTOR clicks
+    CLICK_COUNTING_MODE: Literal['atomic', 'batched', 'sampled'] = 'batched'
+    CLICK_FLUSH_INTERVAL_MS: int = 1000
+    CLICK_FLUSH_MAX_EVENTS: int = 1000
+    # clicks kept in memory at most while flushes fail, later clicks are dropped (and counted)
+    CLICK_BUFFER_MAX_EVENTS: int = 1_000_000
+    CLICK_SAMPLING_FACTOR: int = Field(default=10, ge=1)
+    CLICK_SAMPLING_THRESHOLD: int = 10_000
+
 
+# ------------- redirects ------------
+class RedirectSettings(BaseSettings):
+    # serve `GET {REDIRECT_PATH_PREFIX}{short_code}` as a real redirect ahead of the API routes
+    REDIRECT_ENABLED: bool = True
+    REDIRECT_PATH_PREFIX: str = "/"
+    REDIRECT_STATUS_CODE: Literal[301, 302, 307] = 302
 
-class AppSettings(PostgresSettings):
+
+# ------------- short codes ------------
+class ShortCodeSettings(BaseSettings):
+    # key of the permutation turning sequential ids into short codes, keep it private and never change it
+    SHORT_CODE_SECRET: str = Field(min_length=1)
+    SHORT_CODE_MIN_LENGTH: int = 6
+
+
+# ------------- bulk delete ------------
+class BulkDeleteSettings(BaseSettings):
+    # rows deleted per transaction, and pause between two batches to leave room for live traffic
+    BULK_DELETE_BATCH_SIZE: int = Field(default=1000, ge=1)
+    BULK_DELETE_THROTTLE_MS: int = Field(default=50, ge=0)
+    # finished jobs kept in memory for their progress to be read
+    BULK_DELETE_MAX_FINISHED_JOBS: int = 100
+
+
+# ------------- metrics ------------
+class MetricsSettings(BaseSettings):
+    # route latencies, statement timings, pool and cache statistics, served in the prometheus format on /metrics,
+    # requires ADMIN_TOKEN
+    METRICS_ENABLED: bool = False
+
+
+# ------------- request timing ------------
+class RequestTimingSettings(BaseSettings):
+    # time the phases of every request (repository methods, statements, commits, pool checkouts, rendering)
+    # and send them in a Server-Timing header
+    SERVER_TIMING_ENABLED: bool = False
+    # log requests slower than this with the statements they ran, None turns it off
+    SLOW_REQUEST_THRESHOLD_MS: Optional[int] = None
+    # also log the plan of the slowest statement of a slow request, at most once per interval and per worker:
+    # EXPLAIN (ANALYZE, BUFFERS) runs the statement again, in a read-only transaction
+    SLOW_REQUEST_EXPLAIN: bool = False
+    SLOW_REQUEST_EXPLAIN_INTERVAL_SECONDS: float = 60.0
+
+    @property
+    def request_timing_enabled(self) -> bool:
+        return self.SERVER_TIMING_ENABLED or self.SLOW_REQUEST_THRESHOLD_MS is not None
+
+
+# ------------- profiler ------------
+class ProfilerSettings(BaseSettings):
+    # GET /api/v1/admin/profile samples the stacks of the worker serving it for a few seconds, requires ADMIN_TOKEN
+    PROFILER_ENABLED: bool = False
+    PROFILER_MAX_SECONDS: float = 60.0
+
+
+# ------------- admin ------------
+class AdminSettings(BaseSettings):
+    # when set, /admin endpoints require it in the X-Admin-Token header
+    ADMIN_TOKEN: Optional[str] = None
+
+
+class AppSettings(DatabaseSettings, PostgresSettings, SQLiteSettings, CacheSettings, ClickCounterSettings, RedirectSettings, ShortCodeSettings, BulkDeleteSettings, MetricsSettings, RequestTimingSettings, ProfilerSettings, AdminSettings):
     model_config = SettingsConfigDict(
         env_file='.env', env_file_encoding='utf-8')
 
+    @model_validator(mode='after')
+    def check_database(self) -> 'AppSettings':
+        if self.DB_BACKEND == 'postgres':
+            missing = [name for name in ('PG_USER', 'PG_PW', 'PG_SERVER', 'PG_PORT', 'PG_DB') if getattr(self, name) is None]
+            if missing:
+                raise ValueError(f"{', '.join(missing)} must be set with the postgres backend")
+        return self
+
+    @model_validator(mode='after')
+    def check_admin_token(self) -> 'AppSettings':
+        # these routes expose the internals of the workers, never serve them unauthenticated
+        if self.METRICS_ENABLED and self.ADMIN_TOKEN is None:
+            raise ValueError("ADMIN_TOKEN must be set when METRICS_ENABLED is")
+        if self.PROFILER_ENABLED and self.ADMIN_TOKEN is None:
+            raise ValueError("ADMIN_TOKEN must be set when PROFILER_ENABLED is")
+        return self
+
 
 settings = AppSettings()
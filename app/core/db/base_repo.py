@@ -1,36 +1,74 @@
 
-
-from typing import Any, ClassVar, Generic, Optional, TypeVar
+import enum
+import json
+from collections import namedtuple
+from typing import Any, AsyncIterator, ClassVar, Generic, Hashable, Iterable, Optional, TypeVar
 
 from pydantic import BaseModel
-from sqlalchemy import func, delete, insert, select, update
+from sqlalchemy import ARRAY, Column, and_, bindparam, column, false, func, delete, insert, or_, select, text, tuple_, update, values
 from sqlalchemy.exc import ProgrammingError
-from sqlalchemy.dialects.postgresql import insert as pg_insert
-from sqlalchemy.sql.elements import ColumnElement
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Row, RowMapping
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import ColumnElement, UnaryExpression
 
+from app.core.cache.lru import TTLCache
+from app.core.common.pagination_factory import CountPolicy, InvalidCursor, PaginationCursor
 from app.core.db.database import Base
+from app.core.metrics.db import db_operation, instrumented
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm.attributes import InstrumentedAttribute
 
 from app.core.exceptions import BadRequestException, NotFoundException
 
+# asyncpg (the postgres wire protocol) accepts at most 32767 bind parameters per statement, sqlite 32766
+MAX_BIND_PARAMS = 32766
+# rows per statement of `update_many`, values are bound as one array per column so the limit above does not apply
+UPDATE_MANY_CHUNK_SIZE = 10_000
+
 DbModel = TypeVar('T', bound=Base)  # type: ignore
 PydanticModel = TypeVar('M', bound=BaseModel)
 
+# (table model, return model) -> selected columns
+_read_columns_cache: dict[tuple[type, type], list[Column]] = {}
+
+# INSERT constructs supporting ON CONFLICT, by dialect name
+UPSERT_INSERTS = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+
+class UpsertReturning(str, enum.Enum):
+    ROWS = 'rows'
+    IDS = 'ids'
+    COUNT = 'count'
+
+
+class UpsertTransaction(str, enum.Enum):
+    SINGLE = 'single'
+    PER_CHUNK = 'per_chunk'
+
 
 class PaginatedResponse(BaseModel, Generic[PydanticModel]):
     data: list[PydanticModel]
-    total_count: int
-    page: int
+    # None with the `none` count policy
+    total_count: Optional[int] = None
+    page: Optional[int] = None
     size: int
+    # only set in cursor mode, None on the last page
+    next_cursor: Optional[str] = None
 
 
 class BaseRepo(Generic[DbModel, PydanticModel]):
     __dbmodel__: ClassVar[DbModel]
     __model__: ClassVar[PydanticModel]
+    # columns of the written records `_after_write` reads
+    __write_keys__: ClassVar[tuple[str, ...]] = ('id',)
 
-    def __init__(self, session: AsyncSession):
+    def __init__(self, session: AsyncSession, count_cache: Optional[TTLCache[Hashable, int]] = None):
         self.session = session
+        self.count_cache = count_cache
 
     @property
     def _model(self) -> PydanticModel:
@@ -40,6 +78,53 @@ class BaseRepo(Generic[DbModel, PydanticModel]):
     def _dbmodel(self) -> DbModel:
         return self.__dbmodel__
 
+    @property
+    def _dialect(self) -> str:
+        """Name of the dialect of the session's database, `postgresql` or `sqlite`."""
+        return self.session.bind.dialect.name
+
+    async def _before_commit(self, records: list[DbModel]) -> None:
+        """
+        Hook called with the records affected by an update, upsert or delete, in its transaction right before
+        the commit. Whatever must commit or roll back with the write goes there (cross-worker invalidations).
+        """
+
+    async def _after_write(self, records: list[DbModel]) -> None:
+        """
+        Hook called with the records affected by a committed update, upsert or delete.
+        Repositories override it to keep caches in sync with the table, calling the base implementation,
+        and list the columns it reads in `__write_keys__`: records may only carry those.
+        """
+        self._invalidate_counts()
+
+    def _invalidate_counts(self) -> None:
+        # any write can change the count of any filter
+        if self.count_cache is not None:
+            self.count_cache.clear()
+
+    def _read_columns(self, return_model: type[BaseModel]) -> list[Column]:
+        """The columns of the table `return_model` has a field for, the only ones reads select."""
+        key = (self._dbmodel, return_model)
+
+        if key not in _read_columns_cache:
+            _read_columns_cache[key] = [column for column in self._dbmodel.__table__.columns if column.name in return_model.model_fields]
+
+        return _read_columns_cache[key]
+
+    @staticmethod
+    def _validate_rows(return_model: type[BaseModel], columns: list[Column], rows: Iterable[Row]) -> list[BaseModel]:
+        """
+        Builds `return_model` instances from rows selecting `columns` first. Trailing row values are ignored.
+
+        Rows go through the compiled validator of the model rather than `model_construct`, whose
+        per-field Python loop is the slower of the two. Return models are populated by field name.
+        """
+        names = [column.name for column in columns]
+        validate = return_model.__pydantic_validator__.validate_python
+
+        return [validate(dict(zip(names, row))) for row in rows]
+
+    @instrumented
     async def create(self, data: BaseModel, return_model: Optional[BaseModel | PydanticModel] = None):
         """
         Accepts a Pydantic model as data, creates a new record in the database, catches
@@ -58,31 +143,50 @@ class BaseRepo(Generic[DbModel, PydanticModel]):
         )
         await session.commit()
 
+        self._invalidate_counts()
+
         if not return_model:
             return_model = self._model
 
         return return_model(**created_db_model.dict())
 
+    @instrumented
     async def upsert_many(self,
                           data: list[BaseModel],
                           index_elements: list[InstrumentedAttribute |
                                                str] | None = None,
-                          return_model: Optional[list[BaseModel | PydanticModel]] = None):
+                          return_model: Optional[list[BaseModel | PydanticModel]] = None,
+                          returning: UpsertReturning = UpsertReturning.ROWS,
+                          transaction: UpsertTransaction = UpsertTransaction.SINGLE,
+                          chunk_size: int | None = None,
+                          insert_only: list[InstrumentedAttribute | str] | None = None):
         """
         Performs a bulk upsert operation on the database table.
 
         This function inserts or updates multiple rows in the database based on the provided data.
         If a row with the specified index elements already exists, it updates the row; otherwise, it inserts a new row.
 
+        Items sharing the same index elements are deduplicated (the last one wins), since postgres refuses to
+        update a row twice in one statement. Rows are sent in chunks small enough to stay under the bind
+        parameter limit, committed all at once or chunk by chunk depending on `transaction`.
+
         Args:
             data: A list of BaseModel instances representing the data to be upserted.
             index_elements: A list of InstrumentedAttribute or string column names used to determine conflicts.
                             Defaults to the primary key 'id' if not provided.
             return_model: An optional BaseModel instance to use for returning the results.
                         Defaults to the model associated with the repository if not provided.
+            returning: Whether to return the upserted rows, only their ids, or only their count.
+            transaction: `single` commits once after the last chunk (all or nothing), `per_chunk` commits
+                        every chunk, so a failure keeps the chunks already written. Until a `single` commit
+                        only the `__write_keys__` of the written rows are kept, `data` and its dumped values
+                        stay in memory for the whole call either way.
+            chunk_size: Rows per chunk (the unit of `per_chunk` commits and of cache invalidation), defaults to
+                        the most rows a single INSERT can bind.
+            insert_only: Columns only written when a row is inserted, existing rows keep their values.
 
         Returns:
-            A list of PydanticModel instances representing the upserted or updated rows.
+            A list of PydanticModel instances representing the upserted or updated rows, a list of ids, or a count.
 
         Example:
             >>> await repository.upsert_many(
@@ -99,12 +203,15 @@ class BaseRepo(Generic[DbModel, PydanticModel]):
 
             index_elements = [col.name if isinstance(
                 col, InstrumentedAttribute) else str(col) for col in index_elements]
+            insert_only = {col.name if isinstance(col, InstrumentedAttribute) else str(col) for col in insert_only or []}
 
             model_columns = self._dbmodel.columns()
 
             session = self.session
 
-            data_values = [item.model_dump() for item in data]
+            if not data:
+                return 0 if returning is UpsertReturning.COUNT else []
+
             data_model_fields = data[0].model_fields
 
             data_keys = set(data_model_fields.keys())
@@ -112,9 +219,9 @@ class BaseRepo(Generic[DbModel, PydanticModel]):
 
             # if all keys in data match with index_elements, then the operation is invalid
             # because there are not distinctions that could be used for the on conflict clause.
-            if len(data_keys - index_keys) == 0:
+            if len(data_keys - index_keys - insert_only) == 0:
                 raise ValueError(
-                    f"Index elements match all model fields, upsert is invalid.")
+                    f"Index elements and insert only columns match all model fields, upsert is invalid.")
 
             #  if no key in index_elements exists in data, then the operation is invalid
             missing_keys = index_keys - data_keys
@@ -122,81 +229,349 @@ class BaseRepo(Generic[DbModel, PydanticModel]):
                 raise ValueError(
                     f"Data passed must include the indexed_elements to handle conflicts. Missing: {missing_keys}")
 
-            stmt = pg_insert(self._dbmodel).values(data_values)
+            # ON CONFLICT DO UPDATE cannot affect the same row twice in one statement
+            deduplicated_values = {}
+            for item in data:
+                item_values = item.model_dump()
+                deduplicated_values[tuple(item_values[key] for key in index_elements)] = item_values
+            data_values = list(deduplicated_values.values())
+
+            # as many rows as one multi-row INSERT can bind, columns left out of the payload
+            # still get a bind parameter for their python side default
+            chunk_size = chunk_size or MAX_BIND_PARAMS // len(self._dbmodel.__table__.columns)
+
+            table_columns = list(self._dbmodel.__table__.columns)
+            return_model = return_model or self._model
+
+            upserted_rows = []
+            upserted_count = 0
+            written_keys = []
+            WrittenKeys = namedtuple('WrittenKeys', self.__write_keys__)
+
+            stmt = UPSERT_INSERTS[self._dialect](self._dbmodel.__table__)
 
             updated_columns = {
                 key: getattr(stmt.excluded, key)
                 # Use the first data object's keys
                 for key in data_values[0].keys()
-                if key not in index_elements  # Ensure index elements are not updated
+                if key not in index_elements and key not in insert_only  # Ensure index elements are not updated
             }
 
             if 'updated_at' in model_columns:
                 updated_columns['updated_at'] = func.now()
 
+            # plain rows of the table rather than ORM instances, so nothing piles up in the session identity map
             stmt = stmt.on_conflict_do_update(
                 index_elements=index_elements,
                 set_=updated_columns
-            )
+            ).returning(*table_columns)
 
-            updated_or_created_data = await session.scalars(
-                stmt.returning(self._dbmodel), execution_options={"populate_existing": True}
-            )
+            for start in range(0, len(data_values), chunk_size):
+                # executemany: the statement is compiled once and sent as multi-row batches within the bind parameter limit
+                rows = (await session.execute(stmt, data_values[start:start + chunk_size])).all()
 
-            await session.commit()
+                upserted_count += len(rows)
 
-            return_model = return_model or self._model
+                if returning is UpsertReturning.ROWS:
+                    upserted_rows.extend(return_model(**row._mapping) for row in rows)
+                elif returning is UpsertReturning.IDS:
+                    upserted_rows.extend(row.id for row in rows)
+
+                if transaction is UpsertTransaction.PER_CHUNK:
+                    await self._before_commit(rows)
+                    await session.commit()
+                    await self._after_write(rows)
+                else:
+                    written_keys.extend(WrittenKeys._make(row._mapping[key] for key in self.__write_keys__) for row in rows)
+
+            if transaction is UpsertTransaction.SINGLE:
+                await self._before_commit(written_keys)
+                await session.commit()
+                await self._after_write(written_keys)
 
-            result = updated_or_created_data.all()
+            if returning is UpsertReturning.COUNT:
+                return upserted_count
 
-            return [return_model(**item.dict()) for item in result]
+            return upserted_rows
         except ProgrammingError:
             raise ValueError(
                 "there is no unique or exclusion constraint matching the ON CONFLICT specification. Background on this error at: https://sqlalche.me/e/20/f405)")
 
+    @instrumented
     async def get_many(self,
-                       page: int,
+                       page: int | None,
                        size: int,
                        where_clause: list[ColumnElement[bool]] = [],
                        order_clause: list[InstrumentedAttribute] = [],
-                       return_model: Optional[BaseModel | PydanticModel] = None) -> PaginatedResponse[PydanticModel]:
+                       return_model: Optional[BaseModel | PydanticModel] = None,
+                       cursor: str | None = None,
+                       count_policy: CountPolicy = CountPolicy.EXACT) -> PaginatedResponse[PydanticModel]:
+        """
+        Returns a page of records matching `where_clause`, sorted by `order_clause`, from a read replica when there is one.
 
-        session = self.session
+        Passing a `page` skips `(page - 1) * size` rows with OFFSET. Passing `page=None` switches to keyset
+        pagination: rows are sorted by `order_clause` then `id`, and `cursor` (the `next_cursor` of the
+        previous page, None for the first page) selects the rows after the last one returned, with a
+        WHERE clause on the sort keys that indexes can serve however deep the page is.
 
-        stmt = select(self._dbmodel).where(
-            *where_clause).order_by(*order_clause).offset((page-1)*size).limit(size)
+        `count_policy` decides how `total_count` is computed, see `CountPolicy`. Exact counts are
+        selected along with the page rows so a listing takes a single round-trip.
 
-        result = await session.scalars(stmt)
+        Only the columns `return_model` has a field for are selected, and rows are validated into
+        `return_model` instances directly, without ORM objects.
 
-        total_count = await session.scalar(select(func.count()).select_from(select(self._dbmodel).where(*where_clause).subquery()))
+        Raises:
+            BadRequestException: If the cursor is malformed or was created for another `order_clause`.
+        """
+        if page is None:
+            return await self._get_many_by_cursor(size=size, cursor=cursor, where_clause=where_clause, order_clause=order_clause,
+                                                  return_model=return_model, count_policy=count_policy)
 
-        # print(f"total_count: {total_count}")
+        session = self.session
 
         return_model = return_model or self._model
+        read_columns = self._read_columns(return_model)
+
+        exact_count = count_policy is CountPolicy.EXACT
+        columns = [*read_columns, func.count().over().label('total_count')] if exact_count else read_columns
+
+        stmt = select(*columns).where(
+            *where_clause).order_by(*order_clause).offset((page-1)*size).limit(size).execution_options(read_replica=True)
+
+        rows = (await session.execute(stmt)).all()
+
+        if exact_count and rows:
+            total_count = rows[0].total_count
+        else:
+            # also covers exact counts of pages past the end, which have no row to carry the count
+            total_count = await self._count(where_clause, count_policy)
 
-        return PaginatedResponse(
-            data=[
-                return_model(**item.dict())
-                for item in result.all()
-            ],
+        return PaginatedResponse.model_construct(
+            data=self._validate_rows(return_model, read_columns, rows),
             total_count=total_count,
             page=page,
             size=size
         )
 
+    async def _get_many_by_cursor(self,
+                                  size: int,
+                                  cursor: str | None,
+                                  where_clause: list[ColumnElement[bool]],
+                                  order_clause: list[InstrumentedAttribute],
+                                  return_model: Optional[BaseModel | PydanticModel] = None,
+                                  count_policy: CountPolicy = CountPolicy.EXACT) -> PaginatedResponse[PydanticModel]:
+        session = self.session
+
+        sort_keys = self._keyset_sort_keys(order_clause)
+        columns = [column for column, _ in sort_keys]
+        cursor_keys = [f"-{column.key}" if descending else column.key for column, descending in sort_keys]
+
+        keyset_clause = []
+        if cursor is not None:
+            try:
+                cursor_values = PaginationCursor.decode(cursor, sort_keys=cursor_keys, columns=columns)
+            except InvalidCursor as e:
+                raise BadRequestException(detail=str(e)) from e
+
+            keyset_clause.append(self._keyset_after(sort_keys, cursor_values))
+
+        # nulls placement is spelled out so the keyset predicate matches the order on every backend
+        keyset_order = [
+            column.desc().nulls_first() if descending else column.asc().nulls_last()
+            for column, descending in sort_keys
+        ]
+
+        return_model = return_model or self._model
+        read_columns = self._read_columns(return_model)
+
+        exact_count = count_policy is CountPolicy.EXACT
+        # the next cursor needs the sort keys of the last row, even those return_model has no field for
+        selected = [*read_columns, *[column for column in columns if column.key not in {read_column.name for read_column in read_columns}]]
+        if exact_count:
+            # a window count would only see the rows after the cursor, an uncorrelated subquery runs once for the statement
+            selected.append(select(func.count()).select_from(self._dbmodel).where(*where_clause).scalar_subquery().label('total_count'))
+
+        # one extra row tells whether there is a next page
+        rows = (await session.execute(
+            select(*selected).where(*where_clause, *keyset_clause).order_by(*keyset_order).limit(size + 1)
+            .execution_options(read_replica=True)
+        )).all()
+        records = rows[:size]
+
+        next_cursor = None
+        if len(rows) > size:
+            next_cursor = PaginationCursor.encode(cursor_keys, [records[-1]._mapping[column.key] for column in columns])
+
+        if exact_count and rows:
+            total_count = rows[0].total_count
+        else:
+            total_count = await self._count(where_clause, count_policy)
+
+        return PaginatedResponse.model_construct(
+            data=self._validate_rows(return_model, read_columns, records),
+            total_count=total_count,
+            size=size,
+            next_cursor=next_cursor
+        )
+
+    async def _count(self, where_clause: list[ColumnElement[bool]], count_policy: CountPolicy) -> int | None:
+        """Counts the records matching `where_clause` as requested by `count_policy`."""
+        if count_policy is CountPolicy.NONE:
+            return None
+
+        if count_policy is CountPolicy.ESTIMATED:
+            return await self._estimate_count(where_clause)
+
+        if count_policy is CountPolicy.CACHED and self.count_cache is not None:
+            key = self._count_cache_key(where_clause)
+
+            total_count = self.count_cache.get(key)
+            if total_count is None:
+                total_count = await self._exact_count(where_clause)
+                self.count_cache.set(key, total_count)
+
+            return total_count
+
+        return await self._exact_count(where_clause)
+
+    async def _exact_count(self, where_clause: list[ColumnElement[bool]]) -> int:
+        return await self.session.scalar(
+            select(func.count()).select_from(self._dbmodel).where(*where_clause).execution_options(read_replica=True)
+        )
+
+    async def _estimate_count(self, where_clause: list[ColumnElement[bool]]) -> int:
+        """
+        Returns the planner's idea of the number of matching records: the table statistics
+        without a filter, the row estimate of the query plan otherwise. Both are refreshed by ANALYZE.
+
+        The sqlite planner keeps no row estimates, records are counted there.
+        """
+        if self._dialect == 'sqlite':
+            return await self._exact_count(where_clause)
+
+        session = self.session
+
+        if not where_clause:
+            reltuples = await session.scalar(
+                text("SELECT reltuples FROM pg_class WHERE oid = to_regclass(:table_name)").execution_options(read_replica=True),
+                {"table_name": self._dbmodel.__tablename__}
+            )
+            # -1 until the table was first vacuumed or analyzed
+            if reltuples is not None and reltuples >= 0:
+                return int(reltuples)
+
+        compiled = select(self._dbmodel.id).where(*where_clause).compile(dialect=postgresql.dialect(paramstyle='named'))
+        plan = await session.scalar(text(f"EXPLAIN (FORMAT JSON) {compiled}").execution_options(read_replica=True), compiled.params)
+
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+
+        return int(plan[0]["Plan"]["Plan Rows"])
+
+    @staticmethod
+    def _count_cache_key(where_clause: list[ColumnElement[bool]]) -> Hashable:
+        """Same filters in any order give the same key."""
+        clauses = []
+        for clause in where_clause:
+            compiled = clause.compile()
+            clauses.append((str(compiled), tuple(compiled.params.items())))
+
+        return tuple(sorted(clauses, key=repr))
+
+    def _keyset_sort_keys(self, order_clause: list) -> list[tuple[ColumnElement, bool]]:
+        """Splits `order_clause` in (column, descending) pairs and appends `id` to make the order total."""
+        sort_keys = []
+
+        for expression in order_clause:
+            if isinstance(expression, UnaryExpression) and expression.modifier in (operators.asc_op, operators.desc_op):
+                sort_keys.append((expression.element, expression.modifier is operators.desc_op))
+            else:
+                sort_keys.append((expression, False))
+
+        primary_key = self._dbmodel.__table__.c.id
+        if not any(column.key == primary_key.key for column, _ in sort_keys):
+            sort_keys.append((primary_key, False))
+
+        return sort_keys
+
+    @staticmethod
+    def _keyset_after(sort_keys: list[tuple[ColumnElement, bool]], cursor_values: list[Any]) -> ColumnElement[bool]:
+        """
+        Builds the predicate selecting the rows sorted after `cursor_values`.
+
+        When every key has the same direction and none can be NULL this is a row comparison,
+        `(a, b, id) > (:a, :b, :id)`, which postgres matches against a composite index. Otherwise it is
+        expanded to `a > :a OR (a = :a AND (b < :b OR (b = :b AND id > :id)))`, with NULLs sorting
+        last on ascending keys and first on descending ones.
+        """
+        directions = {descending for _, descending in sort_keys}
+        nullable = any(getattr(column, 'nullable', True) for column, _ in sort_keys)
+
+        if len(directions) == 1 and not nullable and None not in cursor_values:
+            row, cursor_row = tuple_(*[column for column, _ in sort_keys]), tuple_(*cursor_values)
+            return row < cursor_row if True in directions else row > cursor_row
+
+        def after(column, descending, value):
+            if value is None:
+                # nothing sorts after NULL ascending, every value does descending
+                return column.is_not(None) if descending else false()
+            if descending:
+                return column < value
+            return or_(column > value, column.is_(None)) if getattr(column, 'nullable', True) else column > value
+
+        def equal(column, value):
+            return column.is_(None) if value is None else column == value
+
+        predicate = None
+        for (column, descending), value in reversed(list(zip(sort_keys, cursor_values))):
+            step = after(column, descending, value)
+            predicate = step if predicate is None else or_(step, and_(equal(column, value), predicate))
+
+        return predicate
+
+    async def stream_many(self,
+                          where_clause: list[ColumnElement[bool]] = [],
+                          order_clause: list[InstrumentedAttribute] = [],
+                          batch_size: int = 1000) -> AsyncIterator[list[RowMapping]]:
+        """
+        Yields every record matching `where_clause`, sorted by `order_clause` then `id`, in lists of
+        at most `batch_size` rows, from a read replica when there is one.
+
+        Rows are fetched from a server-side cursor `batch_size` at a time, as plain column mappings
+        rather than ORM objects, so memory does not grow with the number of rows. The session is
+        busy until the iteration ends, it cannot run other statements meanwhile.
+        """
+        table = self._dbmodel.__table__
+
+        stmt = select(*table.columns).where(*where_clause).order_by(*order_clause, table.c.id) \
+            .execution_options(yield_per=batch_size, read_replica=True)
+
+        # a generator cannot be wrapped by `instrumented`, only the statement is labeled
+        with db_operation(f"{type(self).__name__}.stream_many"):
+            result = await self.session.stream(stmt)
+
+        try:
+            async for partition in result.mappings().partitions():
+                yield partition
+        finally:
+            await result.close()
+
+    @instrumented
     async def get_one(self,
                       val: Any,
                       field: InstrumentedAttribute | str | None = None,
                       where_clause: list[ColumnElement[bool]] = None,
-                      return_model: Optional[BaseModel | PydanticModel] = None):
+                      return_model: Optional[BaseModel | PydanticModel] = None,
+                      read_replica: bool = True):
         """
-        Retrieves a single record from the database matching the given criteria.
+        Retrieves a single record from the database matching the given criteria, from a read replica when there is one.
 
         Args:
             val: The value to search for.
             field: The InstrumentedAttribute representing the column to search in. Defaults to the model's primary key.
             where_clause: An optional list of additional SQLAlchemy where clauses to apply.
             return_model: An optional BaseModel or PydanticModel to use for returning the result. Defaults to the repository's model.
+            read_replica: Whether a read replica may serve the read, False reads the primary.
 
         Returns:
             A PydanticModel instance representing the found record.
@@ -217,17 +592,19 @@ class BaseRepo(Generic[DbModel, PydanticModel]):
         if where_clause:
             where_cond.extend(where_clause)
 
-        result = await session.scalar(
-            select(self._dbmodel).where(*where_cond)
-        )
+        return_model = return_model or self._model
+        read_columns = self._read_columns(return_model)
 
-        if result is None:
-            raise NotFoundException
+        row = (await session.execute(
+            select(*read_columns).where(*where_cond).execution_options(read_replica=read_replica)
+        )).first()
 
-        return_model = return_model or self._model
+        if row is None:
+            raise NotFoundException
 
-        return return_model(**result.dict())
+        return self._validate_rows(return_model, read_columns, [row])[0]
 
+    @instrumented
     async def update_one(self, data: BaseModel,
                          where_clause: list[ColumnElement[bool]] = None,
                          return_model: Optional[BaseModel | PydanticModel] = None, ):
@@ -258,16 +635,22 @@ class BaseRepo(Generic[DbModel, PydanticModel]):
             .returning(self._dbmodel)
         )
 
+        if updated_db_model is not None:
+            await self._before_commit([updated_db_model])
+
         await session.commit()
 
         if updated_db_model is None:
             raise NotFoundException
 
+        await self._after_write([updated_db_model])
+
         if not return_model:
             return_model = self._model
 
         return return_model(**updated_db_model.dict())
 
+    @instrumented
     async def delete_one(self, val: Any, field: InstrumentedAttribute | None = None, where_clause: list[ColumnElement[bool]] = None,
                          return_model: Optional[BaseModel | PydanticModel] = None, ):
         """
@@ -305,16 +688,22 @@ class BaseRepo(Generic[DbModel, PydanticModel]):
             .returning(self._dbmodel)
         )
 
+        if deleted_db_model:
+            await self._before_commit([deleted_db_model])
+
         await session.commit()
 
         if not deleted_db_model:
             raise NotFoundException
 
+        await self._after_write([deleted_db_model])
+
         if not return_model:
             return_model = self._model
 
         return return_model(**deleted_db_model.dict())
 
+    @instrumented
     async def delete_many(self,
                           where_clause: list[ColumnElement[bool]],
                           return_model: Optional[BaseModel | PydanticModel] = None):
@@ -340,36 +729,96 @@ class BaseRepo(Generic[DbModel, PydanticModel]):
             delete(self._dbmodel).where(*where_clause).returning(self._dbmodel)
         )
 
-        await session.commit()
-
         result = deleted_model_records.all()
 
-        print(f"deleted_records: {result} at where_clause: {where_clause}")
+        await self._before_commit(result)
+        await session.commit()
+
+        await self._after_write(result)
 
         if not return_model:
             return_model = self._model
 
         return [return_model(**item.dict()) for item in result]
 
+    @instrumented
+    async def delete_batch(self, where_clause: list[ColumnElement[bool]], batch_size: int) -> list[Row]:
+        """
+        Deletes at most `batch_size` records matching `where_clause` in its own short transaction,
+        and returns them.
+
+            DELETE FROM table WHERE id IN (
+                SELECT id FROM table WHERE ... LIMIT :batch_size FOR UPDATE SKIP LOCKED
+            ) RETURNING table.*
+
+        Rows locked by another transaction (a redirect counting a click...) are skipped rather than waited
+        for, they are left for a later batch. Call it until `has_any` is False to delete every matching record.
+        sqlite has no row locks, writers wait for each other there and FOR UPDATE is left out.
+
+        Raises:
+            ValueError: If no where_clause is provided.
+        """
+        if not where_clause:
+            raise ValueError("'where_clause' must be passed")
+
+        session = self.session
+        table = self._dbmodel.__table__
+
+        batch_ids = select(table.c.id).where(*where_clause).limit(batch_size).with_for_update(skip_locked=True)
+
+        rows = (await session.execute(
+            delete(table).where(table.c.id.in_(batch_ids.scalar_subquery())).returning(*table.columns)
+        )).all()
+
+        await self._before_commit(rows)
+        await session.commit()
+
+        await self._after_write(rows)
+
+        return rows
+
+    @instrumented
+    async def has_any(self, where_clause: list[ColumnElement[bool]]) -> bool:
+        return await self.session.scalar(select(select(self._dbmodel.id).where(*where_clause).exists()))
+
+    @instrumented
+    async def count(self, where_clause: list[ColumnElement[bool]], count_policy: CountPolicy = CountPolicy.EXACT) -> int | None:
+        """Counts the records matching `where_clause`, see `CountPolicy`."""
+        return await self._count(where_clause, count_policy)
+
+    @instrumented
     async def update_many(
         self,
         data: list[BaseModel],
         field: Any = 'id',
         return_model: Optional[BaseModel | PydanticModel] = None,
+        chunk_size: int = UPDATE_MANY_CHUNK_SIZE,
     ) -> list[BaseModel | PydanticModel]:
         """
-        We expect that data is a list of dictionaries, where each dictionary element will have a field acting as primary key. This field should be passed to the `field` argument in this function.
+        Updates many records at once, each with its own values, and returns the rows that were updated.
 
+        Every item of `data` holds the `field` identifying its record (the primary key by default) and the
+        columns to change, fields left to None keep their current value so items may update different columns.
+        Items sharing the same `field` value are merged, the last one wins.
 
-        Example usage:
-            session.execute(
-            ...     update(User),
-            ...     [
-            ...         {"id": 1, "fullname": "Spongebob Squarepants"},
-            ...         {"id": 3, "fullname": "Patrick Star"},
-            ...         {"id": 5, "fullname": "Eugene H. Krabs"},
-            ...     ],
-            ... )
+        Each chunk of items is sent as a single set-based statement binding one array per column,
+        so it compiles once whatever the number of rows, and every chunk is committed at once:
+
+            UPDATE table SET url = COALESCE(v.url, table.url), ...
+            FROM unnest(:new_id, :new_url, ...) AS v(id, url, ...)
+            WHERE table.id = v.id
+            RETURNING table.*
+
+        sqlite has no arrays, chunks are sent as a VALUES list there, as small as the bind parameter limit requires.
+
+        Args:
+            data: A list of BaseModel instances holding `field` and the values to set.
+            field: The column identifying the records to update.
+            return_model: An optional BaseModel or PydanticModel to use for returning the updated records. Defaults to the repository's model.
+            chunk_size: Items per statement.
+
+        Returns:
+            A list of PydanticModel instances of the updated records, items matching no record are left out.
         """
         if any(field not in item.model_fields for item in data):
             raise ValueError(
@@ -380,33 +829,57 @@ class BaseRepo(Generic[DbModel, PydanticModel]):
                 f"Your passed data sequence contains items that are missing the field: {field}")
 
         session: AsyncSession = self.session
+        table = self._dbmodel.__table__
 
-        update_values = [item.model_dump(exclude_none=True) for item in data]
+        # postgres refuses to update a row twice in one statement
+        merged_values: dict[Any, dict[str, Any]] = {}
+        for item in data:
+            item_values = item.model_dump(exclude_none=True)
+            merged_values.setdefault(item_values[field], {}).update(item_values)
+        update_values = list(merged_values.values())
 
-        # unlike a single record update, a bulk update does not support RETURNING
-        # it is best to update with `executemany` which receives a parameter sets
-        await session.execute(
-            update(self._dbmodel), update_values
-        )
+        if not update_values:
+            return []
 
-        await session.commit()
-        
-        field_values = [item.get(field)
-                        for item in update_values]
-        
-        print(field_values)
-        
-        where_clause = getattr(self._dbmodel, field).in_(field_values)
-
-        result = await session.scalars(
-            select(self._dbmodel).where(
-                where_clause)
-        )
-        
+        value_columns = [field] + sorted({key for item in update_values for key in item} - {field})
+        updated_columns = [key for key in value_columns if key != field]
+
+        if not updated_columns:
+            raise ValueError("Your passed data sequence contains no value to update")
 
         return_model = return_model or self._model
-        
-        result = [return_model(**item.dict()) for item in result.all()]
-        
 
-        return result
+        def update_from(new_values):
+            set_values = {key: func.coalesce(new_values.c[key], table.c[key]) for key in updated_columns}
+            if 'updated_at' in table.c:
+                set_values['updated_at'] = func.now()
+
+            return update(table).where(table.c[field] == new_values.c[field]).values(set_values).returning(*table.columns)
+
+        updated_rows = []
+
+        if self._dialect == 'sqlite':
+            chunk_size = min(chunk_size, MAX_BIND_PARAMS // len(value_columns))
+
+            for start in range(0, len(update_values), chunk_size):
+                chunk = update_values[start:start + chunk_size]
+                new_values = values(*[column(key, table.c[key].type) for key in value_columns], name='v') \
+                    .data([tuple(item.get(key) for key in value_columns) for item in chunk])
+                updated_rows.extend((await session.execute(update_from(new_values))).all())
+        else:
+            stmt = update_from(func.unnest(
+                # bind names must differ from the column names of an UPDATE
+                *[bindparam(f'new_{key}', type_=ARRAY(table.c[key].type)) for key in value_columns]
+            ).table_valued(*[column(key, table.c[key].type) for key in value_columns]).render_derived(name='v'))
+
+            for start in range(0, len(update_values), chunk_size):
+                chunk = update_values[start:start + chunk_size]
+                rows = await session.execute(stmt, {f'new_{key}': [item.get(key) for item in chunk] for key in value_columns})
+                updated_rows.extend(rows.all())
+
+        await self._before_commit(updated_rows)
+        await session.commit()
+
+        await self._after_write(updated_rows)
+
+        return [return_model(**row._mapping) for row in updated_rows]
@@ -3,13 +3,18 @@ from datetime import datetime
 
 import logging
 from typing import AsyncGenerator, TypeVar
-from sqlalchemy import DateTime, inspect
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+from sqlalchemy import URL as EngineURL, DateTime, inspect
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 from sqlalchemy.exc import SQLAlchemyError
 
 
 from app.core.config import AppSettings
+from app.core.db.pool import InstrumentedAsyncQueuePool
+from app.core.db.routing import Replica, ReplicaSet, RoutingSession
+from app.core.db.sqlite import set_pragmas
+from app.core.metrics.collectors import register_pool_metrics
+from app.core.metrics.db import instrument_engine, instrument_session
 
 T = TypeVar('T', bound='Base')
 class Base(DeclarativeBase):
@@ -37,14 +42,105 @@ class Base(DeclarativeBase):
 
 settings = AppSettings()
 
-URL = f"postgresql+asyncpg://{settings.PG_USER}:{settings.PG_PW}@{
-    settings.PG_SERVER}:{settings.PG_PORT}/{settings.PG_DB}"
+def create_url(host: str, port: int) -> EngineURL:
+    return EngineURL.create(
+        drivername="postgresql+asyncpg",
+        username=settings.PG_USER,
+        password=settings.PG_PW,
+        host=host,
+        port=port,
+        database=settings.PG_DB,
+        query={"prepared_statement_cache_size": str(settings.PG_PREPARED_STATEMENT_CACHE_SIZE)},
+    )
 
-logging.log(level=logging.INFO, msg=URL)
 
-engine = create_async_engine(url=URL)
+def create_sqlite_url(path: str) -> EngineURL:
+    return EngineURL.create(drivername="sqlite+aiosqlite", database=path)
 
-AsyncSessionMaker = async_sessionmaker(bind=engine, expire_on_commit=False)
+
+server_settings = {
+    "application_name": settings.PG_APPLICATION_NAME,
+    "jit": "on" if settings.PG_JIT else "off",
+}
+if settings.PG_STATEMENT_TIMEOUT_MS is not None:
+    server_settings["statement_timeout"] = str(settings.PG_STATEMENT_TIMEOUT_MS)
+
+
+sqlite_pragmas = {
+    # readers see the last commit without blocking the writer, and the writer appends to the log instead of rewriting pages
+    "journal_mode": "WAL",
+    "synchronous": settings.SQLITE_SYNCHRONOUS,
+    "busy_timeout": settings.SQLITE_BUSY_TIMEOUT_MS,
+    # negative sizes are in KiB rather than in pages
+    "cache_size": -settings.SQLITE_CACHE_SIZE_KB,
+    "mmap_size": settings.SQLITE_MMAP_SIZE_BYTES,
+    "wal_autocheckpoint": settings.SQLITE_WAL_AUTOCHECKPOINT_PAGES,
+    "temp_store": "MEMORY",
+}
+
+
+def create_engine(url: EngineURL) -> AsyncEngine:
+    logging.log(level=logging.INFO, msg=url.render_as_string(hide_password=True))
+
+    if url.get_backend_name() == "sqlite":
+        engine = create_async_engine(
+            url=url,
+            poolclass=InstrumentedAsyncQueuePool,
+            pool_size=settings.SQLITE_POOL_SIZE,
+            max_overflow=settings.SQLITE_MAX_OVERFLOW,
+        )
+        set_pragmas(engine, sqlite_pragmas)
+    else:
+        engine = create_async_engine(
+            url=url,
+            poolclass=InstrumentedAsyncQueuePool,
+            pool_size=settings.PG_POOL_SIZE,
+            max_overflow=settings.PG_MAX_OVERFLOW,
+            pool_timeout=settings.PG_POOL_TIMEOUT_SECONDS,
+            pool_recycle=settings.PG_POOL_RECYCLE_SECONDS,
+            pool_pre_ping=settings.PG_POOL_PRE_PING,
+            connect_args={
+                "statement_cache_size": settings.PG_STATEMENT_CACHE_SIZE,
+                "command_timeout": settings.PG_COMMAND_TIMEOUT_SECONDS,
+                "server_settings": server_settings,
+            },
+        )
+
+    if settings.METRICS_ENABLED or settings.request_timing_enabled:
+        instrument_engine(engine)
+
+    return engine
+
+
+def parse_replica(replica: str) -> tuple[str, int]:
+    host, _, port = replica.partition(":")
+    return host, int(port or settings.PG_PORT)
+
+
+if settings.DB_BACKEND == 'sqlite':
+    URL = create_sqlite_url(settings.SQLITE_PATH)
+else:
+    URL = create_url(settings.PG_SERVER, int(settings.PG_PORT))
+
+engine = create_engine(URL)
+
+replica_set = ReplicaSet(
+    primary=engine,
+    # a sqlite database has a single node
+    replicas=[Replica(name=replica, engine=create_engine(create_url(*parse_replica(replica))))
+              for replica in (settings.PG_REPLICAS if settings.DB_BACKEND == 'postgres' else [])],
+    selection=settings.PG_REPLICA_SELECTION,
+    max_lag_seconds=settings.PG_REPLICA_MAX_LAG_SECONDS,
+    lag_check_interval=settings.PG_REPLICA_LAG_CHECK_SECONDS,
+)
+
+if settings.request_timing_enabled:
+    instrument_session(RoutingSession)
+
+if settings.METRICS_ENABLED:
+    register_pool_metrics(lambda: {"primary": engine.pool, **{replica.name: replica.engine.pool for replica in replica_set.replicas}})
+
+AsyncSessionMaker = async_sessionmaker(bind=engine, sync_session_class=RoutingSession, replica_set=replica_set, expire_on_commit=False)
 
 async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
     async with AsyncSessionMaker() as session:
@@ -0,0 +1,55 @@
+import time
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app.core.metrics.timing import current_timings
+
+
+class InstrumentedAsyncQueuePool(AsyncAdaptedQueuePool):
+    """
+    Queue pool that also keeps track of how long checkouts take.
+
+    The time of a checkout covers waiting for a connection to be returned when the pool is exhausted,
+    and opening a new connection when it can still overflow. Counters are per process.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def _do_get(self):
+        started_at = time.perf_counter()
+
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started_at
+            self.checkouts += 1
+            self.total_wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+            timings = current_timings.get()
+            if timings is not None:
+                timings.add('pool', waited)
+
+    def stats(self) -> dict:
+        return {
+            "pool_size": self.size(),
+            "max_overflow": self._max_overflow,
+            "checked_out": self.checkedout(),
+            "checked_in": self.checkedin(),
+            # negative while the pool has not opened `pool_size` connections yet
+            "overflow": max(self.overflow(), 0),
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "total_wait_seconds": self.total_wait_seconds,
+            "average_wait_seconds": self.total_wait_seconds / self.checkouts if self.checkouts else 0.0,
+            "max_wait_seconds": self.max_wait_seconds,
+        }
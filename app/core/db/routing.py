@@ -0,0 +1,151 @@
+import asyncio
+import itertools
+import logging
+from typing import Literal, Optional
+
+from sqlalchemy import Select, text
+from sqlalchemy.sql.base import Executable
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# statements carrying this execution option may be served by a replica
+READ_REPLICA = "read_replica"
+
+# seconds of replay lag, 0 when the replica replayed everything it received from the primary
+REPLICATION_LAG_QUERY = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+
+class Replica:
+    def __init__(self, name: str, engine: AsyncEngine):
+        self.name = name
+        self.engine = engine
+        self.reachable = False
+        # None until the first lag check and while the replica cannot be reached
+        self.lag_seconds: Optional[float] = None
+
+    @property
+    def checked_out(self) -> int:
+        return self.engine.pool.checkedout()
+
+
+class ReplicaSet:
+    """
+    The read replicas of the primary database and the policy used to pick one.
+
+    A background task measures the replication lag of every replica, replicas lagging more than
+    `max_lag_seconds` (or not checked yet, or unreachable) are skipped and reads fall back to the primary.
+    """
+
+    def __init__(self,
+                 primary: AsyncEngine,
+                 replicas: list[Replica],
+                 selection: Literal['round_robin', 'least_connections'] = 'round_robin',
+                 max_lag_seconds: float = 5.0,
+                 lag_check_interval: float = 2.0):
+        self.primary = primary
+        self.replicas = replicas
+        self.selection = selection
+        self.max_lag_seconds = max_lag_seconds
+        self.lag_check_interval = lag_check_interval
+
+        self.replica_reads = 0
+        self.primary_fallbacks = 0
+
+        self._round_robin = itertools.count()
+        self._task: Optional[asyncio.Task] = None
+
+    def available(self) -> list[Replica]:
+        return [replica for replica in self.replicas
+                if replica.lag_seconds is not None and replica.lag_seconds <= self.max_lag_seconds]
+
+    def pick(self) -> AsyncEngine:
+        """Returns the engine of the replica to read from, or the primary when no replica is fit."""
+        available = self.available()
+
+        if not available:
+            if self.replicas:
+                self.primary_fallbacks += 1
+            return self.primary
+
+        if self.selection == 'least_connections':
+            replica = min(available, key=lambda replica: replica.checked_out)
+        else:
+            replica = available[next(self._round_robin) % len(available)]
+
+        self.replica_reads += 1
+        return replica.engine
+
+    async def start(self) -> None:
+        if self.replicas and self._task is None:
+            self._task = asyncio.create_task(self._run(), name="replica-lag-monitor")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        for replica in self.replicas:
+            await replica.engine.dispose()
+
+    async def check_lag(self) -> None:
+        for replica in self.replicas:
+            try:
+                async with replica.engine.connect() as connection:
+                    lag = await asyncio.wait_for(connection.scalar(REPLICATION_LAG_QUERY), timeout=self.lag_check_interval)
+                replica.lag_seconds = float(lag)
+                replica.reachable = True
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if replica.reachable:
+                    logger.warning(f"Replica '{replica.name}' is unreachable, reading from the primary instead: {e}")
+                replica.reachable = False
+                replica.lag_seconds = None
+
+    async def _run(self) -> None:
+        while True:
+            await self.check_lag()
+            await asyncio.sleep(self.lag_check_interval)
+
+
+class RoutingSession(Session):
+    """
+    Session sending statements marked with the `read_replica` execution option to a replica.
+
+    Everything else goes to the primary: writes, flushes, and reads that must see the latest data
+    (`nextval`, ...). Once a session ran anything but a SELECT on the primary, it is pinned there so it reads its own writes.
+    A session reads from the same replica for its whole life.
+    """
+
+    def __init__(self, *args, replica_set: Optional[ReplicaSet] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.replica_set = replica_set
+        self.pinned_to_primary = False
+        self._replica: Optional[Engine] = None
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self.replica_set is None or not self.replica_set.replicas:
+            return super().get_bind(mapper, clause=clause, **kwargs)
+
+        if not self._flushing and not self.pinned_to_primary and isinstance(clause, Executable) \
+                and clause.get_execution_options().get(READ_REPLICA):
+            if self._replica is None:
+                self._replica = self.replica_set.pick().sync_engine
+            return self._replica
+
+        if self._flushing or not isinstance(clause, Select):
+            self.pinned_to_primary = True
+
+        return self.replica_set.primary.sync_engine
@@ -0,0 +1,74 @@
+from typing import Any
+
+from sqlalchemy import BigInteger, Column, MetaData, Sequence, String, Table, event, insert, update
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, AsyncSession
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import Values
+
+# sqlite has no sequences, each one is emulated by a row holding the next value it hands out
+sequence_metadata = MetaData()
+
+sequence_table = Table(
+    "sequences",
+    sequence_metadata,
+    Column("name", String(256), primary_key=True),
+    Column("next_value", BigInteger, nullable=False),
+    Column("increment", BigInteger, nullable=False),
+)
+
+
+def set_pragmas(engine: AsyncEngine, pragmas: dict[str, Any]) -> None:
+    """Runs `PRAGMA name = value` for each of `pragmas` on every connection `engine` opens."""
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
+
+
+@compiles(Values, "sqlite")
+def _compile_values(element: Values, compiler, asfrom=False, **kw) -> str:
+    """
+    sqlite cannot name the columns of a VALUES list in its alias, `(VALUES ...) AS v (a, b)`,
+    named VALUES are selected from instead: `(SELECT column1 AS a, column2 AS b FROM (VALUES ...)) AS v`.
+    """
+    if not asfrom or element._unnamed:
+        return compiler.visit_values(element, asfrom=asfrom, **kw)
+
+    from_linter = kw.pop('from_linter', None)
+    if from_linter:
+        from_linter.froms[element._de_clone()] = element.name
+
+    columns = ", ".join(f"column{position} AS {compiler.preparer.quote(column.name)}"
+                        for position, column in enumerate(element.columns, start=1))
+
+    return f"(SELECT {columns} FROM ({compiler._render_values(element, **kw)})){compiler.get_render_as_alias_suffix(compiler.preparer.quote(element.name))}"
+
+
+async def create_sequences(connection: AsyncConnection, metadata: MetaData) -> None:
+    """Creates the rows emulating the sequences of `metadata`, sequences that already have one are left as is."""
+    await connection.run_sync(sequence_metadata.create_all)
+
+    for sequence in metadata._sequences.values():
+        await connection.execute(
+            insert(sequence_table).prefix_with("OR IGNORE").values(
+                name=sequence.name, next_value=sequence.start or 1, increment=sequence.increment or 1)
+        )
+
+
+async def next_values(session: AsyncSession, sequence: Sequence, count: int) -> list[int]:
+    """
+    Returns the next `count` values of `sequence`, like `count` calls to `nextval`, with a single UPDATE.
+
+    The row stays locked (sqlite locks the whole database for writes) until the session commits.
+    """
+    next_value, increment = (await session.execute(
+        update(sequence_table)
+        .where(sequence_table.c.name == sequence.name)
+        .values(next_value=sequence_table.c.next_value + sequence_table.c.increment * count)
+        .returning(sequence_table.c.next_value, sequence_table.c.increment)
+    )).one()
+
+    return list(range(next_value - increment * count, next_value, increment))
@@ -0,0 +1,64 @@
+from typing import Callable, Mapping
+
+from sqlalchemy.pool import Pool
+
+from app.core.cache.lru import TTLCache
+from app.core.cache.single_flight import SingleFlight
+
+from .registry import CallbackMetric, registry
+
+
+def register_pool_metrics(pools: Callable[[], Mapping[str, Pool]]) -> None:
+    """
+    Exports the statistics of the connection pools returned by `pools`, by name.
+    Pools must provide `stats()` like `InstrumentedAsyncQueuePool`.
+    """
+
+    def collect(key: str) -> Callable[[], dict]:
+        return lambda: {(name,): pool.stats()[key] for name, pool in pools().items()}
+
+    for key, name, type, documentation in (
+        ('pool_size', 'db_pool_size', 'gauge', "Connections the pool keeps open"),
+        ('checked_out', 'db_pool_checked_out', 'gauge', "Connections in use"),
+        ('checked_in', 'db_pool_checked_in', 'gauge', "Idle connections"),
+        ('overflow', 'db_pool_overflow', 'gauge', "Connections opened beyond the pool size"),
+        ('checkouts', 'db_pool_checkouts_total', 'counter', "Connections checked out"),
+        ('timeouts', 'db_pool_timeouts_total', 'counter', "Checkouts that timed out waiting for a connection"),
+        ('total_wait_seconds', 'db_pool_wait_seconds_total', 'counter', "Time spent waiting for a connection"),
+    ):
+        registry.register(CallbackMetric(name, documentation, type, collect(key), labelnames=('pool',)))
+
+
+def register_cache_metrics(caches: Mapping[str, TTLCache]) -> None:
+    """Exports the statistics of `caches`, by name."""
+
+    def collect(key: str) -> Callable[[], dict]:
+        return lambda: {(name,): cache.stats()[key] for name, cache in caches.items()}
+
+    for key, name, type, documentation in (
+        ('entries', 'cache_entries', 'gauge', "Entries in the cache"),
+        ('bytes', 'cache_bytes', 'gauge', "Estimated memory held by the cache"),
+        ('hit_ratio', 'cache_hit_ratio', 'gauge', "Hits over lookups since the start of the worker"),
+        ('hits', 'cache_hits_total', 'counter', "Lookups answered by the cache"),
+        ('misses', 'cache_misses_total', 'counter', "Lookups missing or expired"),
+        ('evictions', 'cache_evictions_total', 'counter', "Entries evicted to stay within bounds"),
+        ('invalidations', 'cache_invalidations_total', 'counter', "Entries dropped because the row changed"),
+    ):
+        registry.register(CallbackMetric(name, documentation, type, collect(key), labelnames=('cache',)))
+
+
+def register_single_flight_metrics(flights: Mapping[str, SingleFlight]) -> None:
+    """Exports the statistics of the coalesced `flights`, by name."""
+
+    def collect(key: str) -> Callable[[], dict]:
+        return lambda: {(name,): flight.stats()[key] for name, flight in flights.items()}
+
+    for key, name, type, documentation in (
+        ('in_flight', 'single_flight_in_flight', 'gauge', "Calls running with possible followers"),
+        ('calls', 'single_flight_calls_total', 'counter', "Calls, run or coalesced"),
+        ('executions', 'single_flight_executions_total', 'counter', "Calls that ran"),
+        ('coalesced', 'single_flight_coalesced_total', 'counter', "Calls answered by a call already in flight"),
+        ('failures', 'single_flight_failures_total', 'counter', "Calls that ran and raised"),
+        ('forgotten', 'single_flight_forgotten_total', 'counter', "Calls detached by an invalidation while in flight"),
+    ):
+        registry.register(CallbackMetric(name, documentation, type, collect(key), labelnames=('flight',)))
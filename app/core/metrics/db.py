@@ -0,0 +1,128 @@
+import functools
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Iterator, TypeVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.orm import Session
+
+from .registry import Counter, Histogram, registry
+from .timing import TimedStatement, current_timings
+
+# label of statements run outside of a repository method (migrations, notifications...)
+OTHER_OPERATION = "other"
+
+current_operation: ContextVar[str] = ContextVar('current_operation', default=OTHER_OPERATION)
+
+db_statement_duration = registry.register(Histogram(
+    'db_statement_duration_seconds',
+    "Time spent executing statements, by repository method",
+    labelnames=('operation',),
+))
+db_statement_errors = registry.register(Counter(
+    'db_statement_errors_total',
+    "Statements that raised, by repository method",
+    labelnames=('operation',),
+))
+
+F = TypeVar('F', bound=Callable[..., Awaitable[Any]])
+
+# the async engines instrumented, by the sync engine their events fire on
+_async_engines: dict[Engine, AsyncEngine] = {}
+
+
+@contextmanager
+def db_operation(label: str) -> Iterator[None]:
+    """
+    Labels the statements run inside with `label`, and times it as a phase of the current request,
+    unless an enclosing operation already labels them.
+    """
+    if current_operation.get() != OTHER_OPERATION:
+        yield
+        return
+
+    token = current_operation.set(label)
+    timings = current_timings.get()
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        current_operation.reset(token)
+        if timings is not None:
+            timings.add(label, time.perf_counter() - started_at)
+
+
+def instrumented(method: F) -> F:
+    """Same as `db_operation`, labeling the statements run by a repository method with `Repository.method`."""
+    name = method.__name__
+
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        if current_operation.get() != OTHER_OPERATION:
+            return await method(self, *args, **kwargs)
+
+        label = f"{type(self).__name__}.{name}"
+        token = current_operation.set(label)
+        timings = current_timings.get()
+        started_at = time.perf_counter()
+        try:
+            return await method(self, *args, **kwargs)
+        finally:
+            current_operation.reset(token)
+            if timings is not None:
+                timings.add(label, time.perf_counter() - started_at)
+
+    return wrapper
+
+
+def _before_cursor_execute(connection, cursor, statement, parameters, context, executemany) -> None:
+    context._metrics_started_at = time.perf_counter()
+
+
+def _after_cursor_execute(connection, cursor, statement, parameters, context, executemany) -> None:
+    seconds = time.perf_counter() - context._metrics_started_at
+    operation = current_operation.get()
+
+    db_statement_duration.observe(seconds, operation)
+
+    timings = current_timings.get()
+    if timings is not None:
+        # executemany batches cannot be explained as one statement
+        engine = _async_engines.get(connection.engine) if not executemany else None
+        timings.add_statement(TimedStatement(operation, statement, parameters, seconds, engine))
+
+
+def _handle_error(exception_context) -> None:
+    db_statement_errors.inc(current_operation.get())
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    """Times every statement run through `engine`, events fire on the sync engine driving the async one."""
+    sync_engine = engine.sync_engine
+    _async_engines[sync_engine] = engine
+
+    event.listen(sync_engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(sync_engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(sync_engine, 'handle_error', _handle_error)
+
+
+def _before_commit(session: Session) -> None:
+    if current_timings.get() is not None:
+        session.info['commit_started_at'] = time.perf_counter()
+
+
+def _after_commit(session: Session) -> None:
+    started_at = session.info.pop('commit_started_at', None)
+    timings = current_timings.get()
+
+    if started_at is not None and timings is not None:
+        timings.add('commit', time.perf_counter() - started_at)
+
+
+def instrument_session(session_class: type[Session]) -> None:
+    """Times the commits (flush included) of the sessions of `session_class` as the `commit` phase of requests."""
+    event.listen(session_class, 'before_commit', _before_commit)
+    event.listen(session_class, 'after_commit', _after_commit)
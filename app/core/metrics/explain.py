@@ -0,0 +1,86 @@
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from app.core.config import settings
+
+from .timing import TimedStatement
+
+logger = logging.getLogger(__name__)
+
+# a plan that takes longer than this to capture is not worth the load
+EXPLAIN_TIMEOUT_MS = 5000
+
+
+class SlowQueryExplainer:
+    """
+    Logs the plan of the slowest statement of slow requests, at most once every `interval` seconds.
+
+    The statement runs again on a connection of the engine that ran it, in the background so the response
+    is not delayed, inside a read-only transaction with a statement timeout: SELECTs are explained with
+    `EXPLAIN (ANALYZE, BUFFERS)`, writes (and reads with side effects, which a read-only transaction
+    rejects) only get a plain `EXPLAIN`, they are planned but not run.
+    """
+
+    def __init__(self, interval: float = 60.0):
+        self.interval = interval
+
+        self.captures = 0
+        self.skipped = 0
+
+        self._last_capture_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def capture(self, statements: list[TimedStatement], description: str) -> bool:
+        """Explains the slowest of `statements` unless a capture is running or ran less than `interval` ago."""
+        now = time.monotonic()
+
+        if (self._task is not None and not self._task.done()) \
+                or (self._last_capture_at is not None and now - self._last_capture_at < self.interval):
+            self.skipped += 1
+            return False
+
+        # the EXPLAIN options and the read-only transaction are postgres only
+        statements = [statement for statement in statements
+                      if statement.engine is not None and statement.engine.dialect.name == 'postgresql']
+        if not statements:
+            return False
+
+        self._last_capture_at = now
+        self.captures += 1
+
+        slowest = max(statements, key=lambda statement: statement.seconds)
+        self._task = asyncio.create_task(self._explain(slowest, description), name="slow-query-explain")
+        return True
+
+    async def _explain(self, statement: TimedStatement, description: str) -> None:
+        analyze = statement.statement.lstrip().upper().startswith(("SELECT", "WITH"))
+        explain = "EXPLAIN (ANALYZE, BUFFERS) " if analyze else "EXPLAIN "
+
+        try:
+            async with statement.engine.connect() as connection:
+                raw_connection = (await connection.get_raw_connection()).driver_connection
+
+                async with raw_connection.transaction(readonly=True):
+                    await raw_connection.execute(f"SET LOCAL statement_timeout = {EXPLAIN_TIMEOUT_MS}")
+                    rows = await raw_connection.fetch(explain + statement.statement, *(statement.parameters or ()))
+        except Exception as e:
+            logger.warning(f"Could not explain the slowest statement of {description}: {e}")
+            return
+
+        plan = "\n".join(row[0] for row in rows)
+        logger.warning(f"Plan of the slowest statement of {description}, {statement.operation} "
+                       f"({statement.seconds * 1000:.1f} ms):\n{statement.statement}\n{plan}")
+
+    async def stop(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+
+slow_query_explainer = SlowQueryExplainer(interval=settings.SLOW_REQUEST_EXPLAIN_INTERVAL_SECONDS)
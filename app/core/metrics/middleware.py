@@ -0,0 +1,123 @@
+import logging
+import time
+from typing import Optional
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .explain import SlowQueryExplainer
+from .registry import Counter, Histogram, registry
+from .timing import RequestTimings, current_timings
+
+logger = logging.getLogger(__name__)
+
+# scope key under which middlewares answering before routing name the route they served
+ROUTE_LABEL = "metrics.route"
+# keeps unknown paths from creating a series each
+UNMATCHED_ROUTE = "unmatched"
+
+http_request_duration = registry.register(Histogram(
+    'http_request_duration_seconds',
+    "Time from the request to the end of the response body, by route",
+    labelnames=('method', 'route'),
+))
+http_responses = registry.register(Counter(
+    'http_responses_total',
+    "Responses sent, by route and status code",
+    labelnames=('method', 'route', 'status'),
+))
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI layer recording the latency and status of every http request.
+
+    Requests are labeled with the path template of the route that served them (`/api/v1/shorten/{short_code}`),
+    read from the scope once the inner application returns, so it costs a couple of clock reads and dict updates.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        started_at = time.perf_counter()
+        # a response never started is an unhandled error
+        status = "500"
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            route = route.path if route is not None else scope.get(ROUTE_LABEL, UNMATCHED_ROUTE)
+            method = scope["method"]
+
+            http_request_duration.observe(time.perf_counter() - started_at, method, route)
+            http_responses.inc(method, route, status)
+
+
+class RequestTimingMiddleware:
+    """
+    Pure ASGI layer timing the phases of every request (see `RequestTimings`).
+
+    With `server_timing`, the phases recorded before the response starts are sent in a `Server-Timing` header.
+    Requests slower than `slow_request_threshold` seconds are logged with their phases and statements,
+    and `explainer`, when given, may log the plan of their slowest statement.
+    """
+
+    def __init__(self,
+                 app: ASGIApp,
+                 server_timing: bool = True,
+                 slow_request_threshold: Optional[float] = None,
+                 explainer: Optional[SlowQueryExplainer] = None):
+        self.app = app
+        self.server_timing = server_timing
+        self.slow_request_threshold = slow_request_threshold
+        self.explainer = explainer
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        status = 500
+
+        async def send_with_timing(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing:
+                    headers = [*message.get("headers", ()), (b"server-timing", timings.server_timing(timings.elapsed()).encode("latin-1"))]
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_timings.reset(token)
+
+            duration = timings.elapsed()
+            if self.slow_request_threshold is not None and duration >= self.slow_request_threshold:
+                self._log_slow_request(scope, status, duration, timings)
+
+    def _log_slow_request(self, scope: Scope, status: int, duration: float, timings: RequestTimings) -> None:
+        description = f"{scope['method']} {scope['path']}"
+
+        phases = ", ".join(f"{phase} {seconds * 1000:.1f} ms" for phase, seconds in timings.phases.items())
+        statements = "".join(f"\n  {statement.seconds * 1000:8.1f} ms  {statement.operation}: {' '.join(statement.statement.split())}"
+                             for statement in timings.statements)
+        if timings.dropped_statements:
+            statements += f"\n  ... and {timings.dropped_statements} more statements"
+
+        logger.warning(f"Slow request {description} answered {status} in {duration * 1000:.1f} ms ({phases}){statements}")
+
+        if self.explainer is not None:
+            self.explainer.capture(timings.statements, description)
@@ -0,0 +1,145 @@
+import abc
+from bisect import bisect_left
+from typing import Callable, ClassVar, Iterable, Optional
+
+Labels = tuple[str, ...]
+Sample = tuple[str, dict[str, str], float]
+
+# seconds, from a cache hit to a slow listing
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, int) or value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class Metric(abc.ABC):
+    """
+    A named metric and its series, one per combination of label values.
+
+    Label values are passed positionally in the order of `labelnames`. Metrics are not thread-safe
+    and are meant to be updated from a single event loop.
+    """
+    type: ClassVar[str]
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    @abc.abstractmethod
+    def samples(self) -> Iterable[Sample]:
+        ...
+
+    def _labels(self, values: Labels) -> dict[str, str]:
+        return dict(zip(self.labelnames, values))
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self) -> Iterable[Sample]:
+        for labels, value in self._values.items():
+            yield self.name, self._labels(labels), value
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # per series: the observations falling in each bucket (not cumulative, the last one is +Inf) and their sum
+        self._series: dict[Labels, tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        series = self._series.get(labels)
+
+        if series is None:
+            series = self._series[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+
+        counts, total = series
+        counts[bisect_left(self.buckets, value)] += 1
+        total[0] += value
+
+    def samples(self) -> Iterable[Sample]:
+        bounds = [*self.buckets, float('inf')]
+
+        for labels, (counts, total) in self._series.items():
+            base = self._labels(labels)
+            cumulative = 0
+
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                yield f"{self.name}_bucket", {**base, 'le': _format_value(bound)}, cumulative
+
+            yield f"{self.name}_sum", base, total[0]
+            yield f"{self.name}_count", base, cumulative
+
+
+class CallbackMetric(Metric):
+    """
+    Metric whose values are read when it is collected, for state already tracked elsewhere
+    (pool and cache statistics...). `collect` returns the value of each series by label values.
+    """
+
+    def __init__(self,
+                 name: str,
+                 documentation: str,
+                 type: str,
+                 collect: Callable[[], dict[Labels, float]],
+                 labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.type = type
+        self.collect = collect
+
+    def samples(self) -> Iterable[Sample]:
+        for labels, value in self.collect().items():
+            yield self.name, self._labels(labels), value
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def get(self, name: str) -> Optional[Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """All the metrics in the Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+
+            for name, labels, value in metric.samples():
+                if labels:
+                    formatted = ",".join(f'{key}="{_escape(str(label))}"' for key, label in labels.items())
+                    lines.append(f"{name}{{{formatted}}} {_format_value(value)}")
+                else:
+                    lines.append(f"{name} {_format_value(value)}")
+
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
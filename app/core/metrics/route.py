@@ -0,0 +1,17 @@
+from fastapi import APIRouter, Depends
+from fastapi.responses import PlainTextResponse
+
+from app.api.v1.admin.dependencies import verify_admin_token
+
+from .registry import registry
+
+router = APIRouter(tags=["metrics"], dependencies=[Depends(verify_admin_token)])
+
+
+class PrometheusResponse(PlainTextResponse):
+    media_type = "text/plain; version=0.0.4"
+
+
+@router.get('/metrics', response_class=PrometheusResponse, include_in_schema=False)
+async def get_metrics():
+    return PrometheusResponse(registry.render())
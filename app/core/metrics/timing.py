@@ -0,0 +1,75 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Iterator, Optional
+
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+# statements kept per request for the slow request log, the others are only counted
+MAX_STATEMENTS = 100
+
+
+class TimedStatement:
+    # `engine` is the engine that ran the statement, None when it cannot be run again on its own
+    __slots__ = ('operation', 'statement', 'parameters', 'seconds', 'engine')
+
+    def __init__(self, operation: str, statement: str, parameters: Any, seconds: float, engine: Optional[AsyncEngine]):
+        self.operation = operation
+        self.statement = statement
+        self.parameters = parameters
+        self.seconds = seconds
+        self.engine = engine
+
+
+class RequestTimings:
+    """
+    Time spent in each phase of one request (repository methods, statements, commits, pool checkouts,
+    rendering...), and the statements it ran. Phases nest: the time of a statement also counts in
+    the repository method that ran it.
+    """
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.phases: dict[str, float] = {}
+        self.statements: list[TimedStatement] = []
+        self.dropped_statements = 0
+
+    def add(self, phase: str, seconds: float) -> None:
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def add_statement(self, statement: TimedStatement) -> None:
+        self.add('db', statement.seconds)
+
+        if len(self.statements) < MAX_STATEMENTS:
+            self.statements.append(statement)
+        else:
+            self.dropped_statements += 1
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started_at
+
+    def server_timing(self, total: float) -> str:
+        """The phases as a `Server-Timing` header value, durations in milliseconds."""
+        metrics = [f"{phase};dur={seconds * 1000:.3f}" for phase, seconds in self.phases.items()]
+        metrics.append(f"total;dur={total * 1000:.3f}")
+        return ", ".join(metrics)
+
+
+# set by `RequestTimingMiddleware` for the duration of a request, None when timing is off
+current_timings: ContextVar[Optional[RequestTimings]] = ContextVar('current_timings', default=None)
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """Adds the time spent inside to the `name` phase of the current request, if it is timed."""
+    timings = current_timings.get()
+
+    if timings is None:
+        yield
+        return
+
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - started_at)
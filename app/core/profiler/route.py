@@ -0,0 +1,49 @@
+import asyncio
+import threading
+from typing import Literal
+
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import PlainTextResponse
+
+from app.api.v1.admin.dependencies import verify_admin_token
+from app.core.common.app_response import AppJSONResponse
+from app.core.config import settings
+from app.core.exceptions import AlreadyExistsException
+
+from .sampler import ProfileMode, StackSampler
+
+router = APIRouter(tags=["admin"], prefix='/api/v1/admin', dependencies=[Depends(verify_admin_token)])
+
+# samples of two profiles would mix, one at a time per worker
+_profiling = asyncio.Lock()
+
+
+@router.get('/profile', response_class=PlainTextResponse)
+async def profile(seconds: float = Query(default=10.0, gt=0, le=settings.PROFILER_MAX_SECONDS),
+                  interval_ms: float = Query(default=10.0, ge=1, le=1000),
+                  mode: ProfileMode = 'threads',
+                  format: Literal['collapsed', 'speedscope'] = 'collapsed'):
+    """
+    Samples the stacks of this worker for `seconds` and returns them, see `StackSampler`.
+
+    `collapsed` stacks can be fed to flamegraph.pl or dropped on https://www.speedscope.app, as can `speedscope` files.
+    """
+    if _profiling.locked():
+        raise AlreadyExistsException(detail="A profile is already running in this worker")
+
+    async with _profiling:
+        sampler = StackSampler(interval=interval_ms / 1000,
+                               mode=mode,
+                               loop=asyncio.get_running_loop(),
+                               loop_thread_id=threading.get_ident())
+        sampler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            sampler.stop()
+
+    if format == 'speedscope':
+        return AppJSONResponse(sampler.speedscope(name=f"{mode} profile, {sampler.samples} samples in {sampler.duration:.1f}s"),
+                               headers={'Content-Disposition': 'attachment; filename="profile.speedscope.json"'})
+
+    return PlainTextResponse(sampler.collapsed())
@@ -0,0 +1,203 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+from types import CodeType, FrameType
+from typing import Any, Literal, Optional
+
+ProfileMode = Literal['threads', 'asyncio']
+
+# root of the stacks of asyncio tasks, and of the event loop thread when no task runs
+TASKS_ROOT = "asyncio tasks"
+LOOP_ROOT = "event loop"
+
+
+class StackSampler:
+    """
+    Low overhead in-process sampling profiler.
+
+    A background thread wakes up every `interval` seconds and records the stack of every other thread
+    of the process (`sys._current_frames`), counting identical stacks. Stacks are lists of functions, root
+    first, the first element naming the thread they were sampled from.
+
+    In `asyncio` mode the thread running `loop` is sampled per task instead: each task of the loop counts
+    once per sample with the chain of coroutines it awaits (route handler, service, repository method...),
+    ending with `[waiting]` when it is suspended, or with the functions it is running otherwise. Its stacks
+    therefore add up to the wall-clock time of every task, not to the time of the thread. Samples taken
+    while no task runs (callbacks, polling for I/O) are recorded under `event loop`.
+    """
+
+    def __init__(self,
+                 interval: float = 0.01,
+                 mode: ProfileMode = 'threads',
+                 loop: Optional[asyncio.AbstractEventLoop] = None,
+                 loop_thread_id: Optional[int] = None):
+        if mode == 'asyncio' and (loop is None or loop_thread_id is None):
+            raise ValueError("asyncio mode needs the loop to sample and the id of its thread")
+
+        self.interval = interval
+        self.mode = mode
+        self.loop = loop
+        self.loop_thread_id = loop_thread_id
+
+        self.counts: dict[tuple[str, ...], int] = {}
+        self.samples = 0
+        self.started_at: Optional[float] = None
+        self.duration = 0.0
+
+        self._labels: dict[CodeType, str] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self.started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.duration = time.perf_counter() - self.started_at
+
+    def _run(self) -> None:
+        own_thread_id = threading.get_ident()
+        next_sample_at = time.perf_counter()
+
+        while not self._stop.is_set():
+            self._sample(own_thread_id)
+            self.samples += 1
+
+            next_sample_at += self.interval
+            delay = next_sample_at - time.perf_counter()
+            if delay > 0:
+                self._stop.wait(delay)
+            else:
+                # fell behind (the GIL was busy), skip the missed samples rather than burst
+                next_sample_at = time.perf_counter()
+
+    def _sample(self, own_thread_id: int) -> None:
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_thread_id:
+                continue
+
+            if self.mode == 'asyncio' and thread_id == self.loop_thread_id:
+                self._sample_tasks(frame)
+            else:
+                self._add((thread_names.get(thread_id, str(thread_id)), *self._stack(frame)))
+
+    def _sample_tasks(self, loop_frame: FrameType) -> None:
+        running = asyncio.current_task(self.loop)
+
+        try:
+            tasks = asyncio.all_tasks(self.loop)
+        except RuntimeError:
+            # the set of tasks kept changing while it was copied, drop this sample
+            return
+
+        if running is None:
+            self._add((LOOP_ROOT, *self._stack(loop_frame)))
+
+        for task in tasks:
+            chain, innermost = self._await_chain(task.get_coro())
+
+            if task is running:
+                frames = self._frames(loop_frame)
+                # the functions called by the innermost coroutine, or all of them when it runs in a greenlet
+                above = frames[frames.index(innermost) + 1:] if innermost in frames else frames
+                self._add((TASKS_ROOT, *chain, *(self._label(frame.f_code) for frame in above)))
+            else:
+                self._add((TASKS_ROOT, *chain, "[waiting]"))
+
+    def _await_chain(self, coro: Any) -> tuple[list[str], Optional[FrameType]]:
+        """The coroutines `coro` awaits, outermost first, and the frame of the innermost one."""
+        chain = []
+        innermost = None
+
+        while coro is not None:
+            frame = getattr(coro, 'cr_frame', None) or getattr(coro, 'ag_frame', None) or getattr(coro, 'gi_frame', None)
+            if frame is None:
+                break
+
+            chain.append(self._label(frame.f_code))
+            innermost = frame
+            coro = getattr(coro, 'cr_await', None) or getattr(coro, 'ag_await', None) or getattr(coro, 'gi_yieldfrom', None)
+
+        return chain, innermost
+
+    @staticmethod
+    def _frames(frame: Optional[FrameType]) -> list[FrameType]:
+        frames = []
+        while frame is not None:
+            frames.append(frame)
+            frame = frame.f_back
+        frames.reverse()
+        return frames
+
+    def _stack(self, frame: FrameType) -> list[str]:
+        return [self._label(frame.f_code) for frame in self._frames(frame)]
+
+    def _label(self, code: CodeType) -> str:
+        label = self._labels.get(code)
+
+        if label is None:
+            label = self._labels[code] = f"{code.co_qualname} ({_short_path(code.co_filename)}:{code.co_firstlineno})".replace(";", ",")
+
+        return label
+
+    def _add(self, stack: tuple[str, ...]) -> None:
+        self.counts[stack] = self.counts.get(stack, 0) + 1
+
+    def collapsed(self) -> str:
+        """The samples in the collapsed stack format of flamegraph.pl and speedscope: `root;...;leaf count` lines."""
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in sorted(self.counts.items()))
+
+    def speedscope(self, name: str = "profile") -> dict[str, Any]:
+        """The samples as a speedscope file (https://www.speedscope.app), one sampled profile per thread."""
+        frames: list[dict[str, Any]] = []
+        frame_indexes: dict[str, int] = {}
+        profiles: dict[str, dict[str, Any]] = {}
+
+        for stack, count in sorted(self.counts.items()):
+            root, *functions = stack
+
+            profile = profiles.get(root)
+            if profile is None:
+                profile = profiles[root] = {
+                    "type": "sampled", "name": root, "unit": "seconds",
+                    "startValue": 0, "endValue": 0, "samples": [], "weights": [],
+                }
+
+            sample = []
+            for function in functions:
+                index = frame_indexes.get(function)
+                if index is None:
+                    index = frame_indexes[function] = len(frames)
+                    frames.append({"name": function})
+                sample.append(index)
+
+            profile["samples"].append(sample)
+            profile["weights"].append(count * self.interval)
+            profile["endValue"] += count * self.interval
+
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "fast_url_shortner",
+            "activeProfileIndex": 0,
+            "shared": {"frames": frames},
+            "profiles": list(profiles.values()),
+        }
+
+
+def _short_path(filename: str) -> str:
+    """`filename` relative to the longest entry of `sys.path` containing it (site-packages, the project...)."""
+    best = ""
+    for path in sys.path:
+        if path and filename.startswith(path + os.sep) and len(path) > len(best):
+            best = path
+    return filename[len(best) + 1:] if best else filename
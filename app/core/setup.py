@@ -1,33 +1,64 @@
-from typing import Any, AsyncGenerator, Callable
+import logging
+from typing import Any, AsyncGenerator, Awaitable, Callable, Sequence
 from contextlib import _AsyncGeneratorContextManager, asynccontextmanager
 from fastapi import APIRouter, FastAPI
+from starlette.middleware import Middleware
 
-from app.core.config import AppSettings, PostgresSettings
-from app.core.db.database import engine, Base
+from app.core.common.app_response import AppJSONResponse
+from app.core.config import AdminSettings, AppSettings, DatabaseSettings, MetricsSettings, ProfilerSettings, RequestTimingSettings
+from app.core.db.database import engine, replica_set, Base
+from app.core.db.sqlite import create_sequences
 from app.core.db.models import *
+from app.core.metrics.explain import slow_query_explainer
+from app.core.metrics.middleware import MetricsMiddleware, RequestTimingMiddleware
+from app.core.metrics.route import router as metrics_router
+from app.core.profiler.route import router as profiler_router
+
+logger = logging.getLogger(__name__)
+
 
 async def create_tables() -> None:
-    try:
-        async with engine.begin() as conn:
-            print("Starting table creation...")
-            await conn.run_sync(Base.metadata.create_all)
-            print("Tables created successfully")
-    except Exception as e:
-        print(f"Error creating tables: {e}")
+    """Creates missing tables, failures abort the startup. Changes to existing tables are migrations, see `app.cli migrate`."""
+    async with engine.begin() as conn:
+        logger.info("Starting table creation...")
+        await conn.run_sync(Base.metadata.create_all)
+        if conn.dialect.name == 'sqlite':
+            await create_sequences(conn, Base.metadata)
+        logger.info("Tables created successfully")
+
+
+Hook = Callable[[], Awaitable[None]]
 
 
 def applifespan_factory(
     settings: AppSettings,
-    create_tables_on_start: bool = True
+    create_tables_on_start: bool = True,
+    on_startup: Sequence[Hook] = (),
+    on_shutdown: Sequence[Hook] = (),
 ) -> Callable[[FastAPI], _AsyncGeneratorContextManager[Any]]:
+    """
+    `on_startup` hooks run in order once the tables exist, `on_shutdown` hooks run in order before
+    the engine is disposed, so they can still write (buffered clicks...).
+    """
 
     @asynccontextmanager
     async def lifespan(app: FastAPI) -> AsyncGenerator:
-        if isinstance(settings, PostgresSettings) and create_tables_on_start:
+        if isinstance(settings, DatabaseSettings) and create_tables_on_start:
             await create_tables()
+
+        await replica_set.start()
+
+        for hook in on_startup:
+            await hook()
         
         yield
-        
+
+        for hook in on_shutdown:
+            await hook()
+
+        await slow_query_explainer.stop()
+
+        await replica_set.stop()
         await engine.dispose()
     
     return lifespan
@@ -36,12 +67,47 @@ def create_application(
     router: APIRouter,
     settings: AppSettings,
     create_tables_on_start: bool = True,
+    on_startup: Sequence[Hook] = (),
+    on_shutdown: Sequence[Hook] = (),
+    middleware: Sequence[Middleware] = (),
     **kwargs: Any,
-) -> FastAPI:   
-    lifespan = applifespan_factory(settings, create_tables_on_start=create_tables_on_start)
+) -> FastAPI:
+    """
+    Builds the application around `router`. `middleware` wraps the routes, the first one outermost,
+    inside the request timing and metrics middlewares so whatever it answers is measured too.
+    """
+    lifespan = applifespan_factory(settings, create_tables_on_start=create_tables_on_start,
+                                   on_startup=on_startup, on_shutdown=on_shutdown)
+
+    # encodes responses with pydantic-core rather than jsonable_encoder and the stdlib json
+    kwargs.setdefault('default_response_class', AppJSONResponse)
     
     application = FastAPI(lifespan=lifespan, **kwargs)
     
     application.include_router(router)
+
+    metrics_enabled = isinstance(settings, MetricsSettings) and settings.METRICS_ENABLED
+    if metrics_enabled:
+        application.include_router(metrics_router)
+
+    # the profiler runs code in the worker on demand, it is only served behind an admin token
+    if isinstance(settings, ProfilerSettings) and settings.PROFILER_ENABLED \
+            and isinstance(settings, AdminSettings) and settings.ADMIN_TOKEN is not None:
+        application.include_router(profiler_router)
+
+    for item in reversed(middleware):
+        application.add_middleware(item.cls, *item.args, **item.kwargs)
+
+    if isinstance(settings, RequestTimingSettings) and settings.request_timing_enabled:
+        threshold_ms = settings.SLOW_REQUEST_THRESHOLD_MS
+
+        application.add_middleware(RequestTimingMiddleware,
+                                   server_timing=settings.SERVER_TIMING_ENABLED,
+                                   slow_request_threshold=threshold_ms / 1000 if threshold_ms is not None else None,
+                                   explainer=slow_query_explainer if settings.SLOW_REQUEST_EXPLAIN else None)
+
+    if metrics_enabled:
+        # outermost, so redirects answered by a middleware above are measured too
+        application.add_middleware(MetricsMiddleware)
     
     return application
\ No newline at end of file
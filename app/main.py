@@ -1,24 +1,46 @@
 from fastapi import Request
-from fastapi.responses import JSONResponse
+from starlette.middleware import Middleware
 
-from app.core.common.app_response import AppResponse
+from app.core.common.app_response import AppJSONResponse, AppResponse
 from .api import router
+from .api.v1.short_urls.bulk_delete import bulk_deleter
+from .api.v1.short_urls.cache import short_url_invalidation_bus
+from .api.v1.short_urls.click_counter import click_counting
+from .api.v1.short_urls.redirect import RedirectMiddleware
 from .core.config import settings
 from .core.setup import create_application
 
 import logging
 logger = logging.getLogger(__name__)
 
-app = create_application(router=router, settings=settings)
+on_startup = [click_counting.start]
+on_shutdown = [
+    # running jobs stop after their current batch, whatever they deleted stays deleted
+    bulk_deleter.stop,
+    # write buffered clicks before the engine goes away so deploys do not lose counts
+    click_counting.stop,
+]
+
+if short_url_invalidation_bus is not None:
+    on_startup.insert(0, short_url_invalidation_bus.start)
+    on_shutdown.append(short_url_invalidation_bus.stop)
+
+middleware = []
+if settings.REDIRECT_ENABLED:
+    middleware.append(Middleware(RedirectMiddleware,
+                                 prefix=settings.REDIRECT_PATH_PREFIX,
+                                 status_code=settings.REDIRECT_STATUS_CODE))
+
+app = create_application(router=router, settings=settings, on_startup=on_startup, on_shutdown=on_shutdown, middleware=middleware)
 
 
 @app.exception_handler(Exception)
 async def generic_exception_logger(request: Request, exc: Exception):
     """Logs all unhandled exceptions and returns a proper response."""
     error_msg = exc.__str__()
-    # logger.exception(f"An unhandled exception occurred: {error_msg}")
+    logger.exception(f"An unhandled exception occurred: {error_msg}")
     app_response = AppResponse(success=False, status_code=500, message=(
                 f"Failed method {request.method} at URL {request.url}."
                 f" Exception message is: {error_msg}."
             ))
-    return JSONResponse(content=app_response.__dict__)
+    return AppJSONResponse(content=app_response, status_code=500)
@@ -0,0 +1,10 @@
+"""
+Benchmarks of the shortener hot paths, every one prints a JSON report (see `common.report`) to compare runs
+with `python -m benchmarks.compare before.json after.json`.
+
+- `benchmarks.micro`: code generation, filter and sort parsing, row to model mapping and response encoding,
+  without a database.
+- `benchmarks.responses`: response encoding through FastAPI, in-process, without a database.
+- `benchmarks.load`: an asyncio load generator driving the whole application in-process against the
+  database configured in the environment (`PG_*` settings), with a mix of redirects, creates, bulk upserts and listings.
+"""
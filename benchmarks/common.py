@@ -0,0 +1,100 @@
+import asyncio
+import datetime
+import json
+import platform
+import statistics
+import subprocess
+import sys
+from typing import Any, Optional
+
+from starlette.types import ASGIApp
+
+
+async def asgi_request(app: ASGIApp,
+                       method: str,
+                       path: str,
+                       query_string: str = "",
+                       body: bytes = b"",
+                       headers: Optional[list[tuple[bytes, bytes]]] = None) -> tuple[int, bytes]:
+    """Sends one http request straight to `app`, without a server or an http client, returns the status and body."""
+    status = 0
+    chunks = []
+    received = False
+
+    async def receive():
+        nonlocal received
+        if received:
+            # nothing more to read, wait like a client keeping the connection open
+            await asyncio.Event().wait()
+        received = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    headers = list(headers or [])
+    if body:
+        headers.append((b"content-length", str(len(body)).encode()))
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method, "scheme": "http",
+        "path": path, "raw_path": path.encode(), "query_string": query_string.encode(), "root_path": "",
+        "headers": headers, "server": ("benchmark", 80), "client": ("benchmark", 1),
+    }
+    await app(scope, receive, send)
+
+    return status, b"".join(chunks)
+
+
+def percentile(values: list[float], q: float) -> float:
+    """The `q` percentile (0 to 100) of `values`, interpolated between the closest ranks."""
+    if not values:
+        return 0.0
+
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def latency_summary(latencies: list[float]) -> dict[str, float]:
+    """Latencies in milliseconds."""
+    return {
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p90_ms": round(percentile(latencies, 90) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "max_ms": round(max(latencies, default=0.0) * 1000, 3),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3) if latencies else 0.0,
+    }
+
+
+def environment() -> dict[str, Any]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+
+    return {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "commit": commit,
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+    }
+
+
+def report(benchmark: str, config: dict[str, Any], results: dict[str, Any], output: Optional[str] = None) -> None:
+    """Prints (or writes to `output`) the JSON report of a run: what ran, with which settings, where, and the results."""
+    document = json.dumps({"benchmark": benchmark, "environment": environment(), "config": config, "results": results}, indent=2)
+
+    if output:
+        with open(output, 'w') as file:
+            file.write(document + "\n")
+    else:
+        print(document)
@@ -0,0 +1,59 @@
+"""
+Compares two reports of the same benchmark, case by case.
+
+    python -m benchmarks.compare before.json after.json
+
+Prints the change of every number the two runs have in common: for rates (`*_per_second`) higher is better,
+for everything else (`*_ms`, `ns_per_op`) lower is better.
+"""
+import argparse
+import json
+from typing import Any
+
+# numbers that describe the run rather than measure it
+IGNORED = {"requests", "errors", "iterations", "operations_per_iteration", "body_bytes"}
+
+
+def compare(before: dict[str, Any], after: dict[str, Any]) -> list[tuple[str, str, float, float, float]]:
+    rows = []
+
+    for case, metrics in after["results"].items():
+        previous = before["results"].get(case)
+        if previous is None:
+            continue
+
+        for metric, value in metrics.items():
+            if metric in IGNORED or metric not in previous or not isinstance(value, (int, float)) or not previous[metric]:
+                continue
+
+            change = (value - previous[metric]) / previous[metric] * 100
+            # positive is an improvement whatever the direction of the metric
+            improvement = change if metric.endswith('_per_second') else -change
+            rows.append((case, metric, previous[metric], value, improvement))
+
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('before')
+    parser.add_argument('after')
+    args = parser.parse_args()
+
+    with open(args.before) as file:
+        before = json.load(file)
+    with open(args.after) as file:
+        after = json.load(file)
+
+    if before["benchmark"] != after["benchmark"]:
+        raise SystemExit(f"cannot compare a '{before['benchmark']}' run with a '{after['benchmark']}' run")
+    if before["config"] != after["config"]:
+        print("warning: the runs were made with different arguments\n")
+
+    print(f"{before['environment'].get('commit')} -> {after['environment'].get('commit')}")
+    for case, metric, old, new, improvement in compare(before, after):
+        print(f"{case:32} {metric:18} {old:>14,.3f} {new:>14,.3f} {improvement:+8.1f}%")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+"""
+End-to-end load generator: runs the application in-process (lifespan included) and drives it over ASGI
+from `--concurrency` asyncio workers, against the database configured in the environment.
+
+    PG_SERVER=localhost ... python -m benchmarks.load --duration 30 --concurrency 32 --output load.json
+    DB_BACKEND=sqlite SQLITE_PATH=/tmp/load.db SHORT_CODE_SECRET=bench python -m benchmarks.load --duration 30 --concurrency 32
+
+Each worker picks its next operation from the mix at random (seeded, so runs are reproducible):
+- `redirect`: `GET /{short_code}`, codes drawn from a Zipf distribution over the seeded urls,
+  a few hot links take most of the traffic like in production;
+- `create`: `POST /api/v1/shorten/` with a new url;
+- `bulk_upsert`: `POST /api/v1/shorten/bulk-upsert` with `--bulk-size` urls, half of them new and half drawn
+  from the seeded ones like `redirect` does (existing urls keep their code, so redirects are not affected);
+- `listing`: `GET /api/v1/shorten/` at a random page of the last tenth of the table (deep OFFSETs).
+
+The report has, per operation and overall, the requests per second and the p50/p90/p99 latencies.
+Everything runs in one process: the load generator competes with the application for the CPU,
+compare runs made on the same machine with the same arguments.
+"""
+import argparse
+import asyncio
+import bisect
+import itertools
+import json
+import random
+import time
+import uuid
+from typing import Any
+
+from .common import asgi_request, latency_summary, report
+
+DEFAULT_MIX = "redirect=80,create=10,bulk_upsert=2,listing=8"
+SEED_BATCH_SIZE = 10_000
+
+
+class ZipfSampler:
+    """Draws indexes of [0, n) with a probability proportional to 1 / rank^s, in O(log n)."""
+
+    def __init__(self, n: int, s: float, rng: random.Random):
+        self.rng = rng
+        self.cumulative = list(itertools.accumulate(1 / rank ** s for rank in range(1, n + 1)))
+
+    def sample(self) -> int:
+        return bisect.bisect_left(self.cumulative, self.rng.random() * self.cumulative[-1])
+
+
+class LoadGenerator:
+    def __init__(self, app, short_codes: list[str], args: argparse.Namespace):
+        self.app = app
+        self.args = args
+        self.run_id = uuid.uuid4().hex[:8]
+        self.url_counter = itertools.count()
+
+        rng = random.Random(args.seed)
+        # which seeded url is the hottest is random, so it is not always the oldest row
+        self.short_codes = short_codes[:]
+        rng.shuffle(self.short_codes)
+
+        self.mix = [(name, float(weight)) for name, weight in (part.split('=') for part in args.mix.split(','))]
+        unknown = {name for name, _ in self.mix} - set(self.operations())
+        if unknown:
+            raise SystemExit(f"unknown operations in --mix: {', '.join(sorted(unknown))}")
+
+        self.latencies: dict[str, list[float]] = {name: [] for name, _ in self.mix}
+        self.errors: dict[str, int] = {name: 0 for name, _ in self.mix}
+
+    def operations(self) -> dict[str, Any]:
+        return {
+            'redirect': self.redirect,
+            'create': self.create,
+            'bulk_upsert': self.bulk_upsert,
+            'listing': self.listing,
+        }
+
+    def new_url(self) -> str:
+        return f"https://load.example.com/{self.run_id}/{next(self.url_counter)}"
+
+    async def redirect(self, rng: random.Random, zipf: ZipfSampler) -> bool:
+        status, _ = await asgi_request(self.app, "GET", f"/{self.short_codes[zipf.sample()]}")
+        return status in (301, 302, 307)
+
+    async def create(self, rng: random.Random, zipf: ZipfSampler) -> bool:
+        body = json.dumps({"url": self.new_url()}).encode()
+        status, _ = await asgi_request(self.app, "POST", "/api/v1/shorten/", body=body, headers=[(b"content-type", b"application/json")])
+        return status in (200, 201)
+
+    async def bulk_upsert(self, rng: random.Random, zipf: ZipfSampler) -> bool:
+        urls = [self.new_url() if i % 2 else seed_url(zipf.sample()) for i in range(self.args.bulk_size)]
+        body = json.dumps([{"url": url} for url in urls]).encode()
+        status, _ = await asgi_request(self.app, "POST", "/api/v1/shorten/bulk-upsert", query_string="returning=count",
+                                       body=body, headers=[(b"content-type", b"application/json")])
+        return status == 200
+
+    async def listing(self, rng: random.Random, zipf: ZipfSampler) -> bool:
+        pages = max(1, self.args.urls // self.args.page_size)
+        page = rng.randint(max(1, pages - pages // 10), pages)
+        status, _ = await asgi_request(self.app, "GET", "/api/v1/shorten/",
+                                       query_string=f"page={page}&size={self.args.page_size}&count=none")
+        return status == 200
+
+    async def worker(self, index: int, deadline: float, measure_after: float) -> None:
+        rng = random.Random(self.args.seed * 1000 + index)
+        zipf = ZipfSampler(len(self.short_codes), self.args.zipf_s, rng)
+        operations = self.operations()
+        names = [name for name, _ in self.mix]
+        weights = list(itertools.accumulate(weight for _, weight in self.mix))
+
+        while True:
+            started_at = time.perf_counter()
+            if started_at >= deadline:
+                return
+
+            name = rng.choices(names, cum_weights=weights)[0]
+            try:
+                ok = await operations[name](rng, zipf)
+            except Exception:
+                ok = False
+
+            if started_at >= measure_after:
+                self.latencies[name].append(time.perf_counter() - started_at)
+                if not ok:
+                    self.errors[name] += 1
+
+    async def run(self) -> dict[str, Any]:
+        started_at = time.perf_counter()
+        measure_after = started_at + self.args.warmup
+        deadline = measure_after + self.args.duration
+
+        await asyncio.gather(*(self.worker(index, deadline, measure_after) for index in range(self.args.concurrency)))
+
+        results = {}
+        for name, latencies in self.latencies.items():
+            results[name] = {
+                "requests": len(latencies),
+                "errors": self.errors[name],
+                "requests_per_second": round(len(latencies) / self.args.duration, 1),
+                **latency_summary(latencies),
+            }
+
+        everything = [latency for latencies in self.latencies.values() for latency in latencies]
+        results["total"] = {
+            "requests": len(everything),
+            "errors": sum(self.errors.values()),
+            "requests_per_second": round(len(everything) / self.args.duration, 1),
+            **latency_summary(everything),
+        }
+        return results
+
+
+def seed_url(index: int) -> str:
+    return f"https://seed.example.com/{index}"
+
+
+async def seed(app, urls: int) -> list[str]:
+    """Makes sure the `urls` seed urls exist (they are shared by runs), returns their short codes."""
+    short_codes = []
+
+    for start in range(0, urls, SEED_BATCH_SIZE):
+        batch = [{"url": seed_url(i)} for i in range(start, min(start + SEED_BATCH_SIZE, urls))]
+        status, body = await asgi_request(app, "POST", "/api/v1/shorten/bulk-upsert", body=json.dumps(batch).encode(),
+                                          headers=[(b"content-type", b"application/json")])
+        if status != 200:
+            raise SystemExit(f"seeding failed with {status}: {body[:500]!r}")
+        short_codes.extend(row["shortCode"] for row in json.loads(body)["data"])
+
+    return short_codes
+
+
+async def main_async(args: argparse.Namespace) -> dict[str, Any]:
+    from app.main import app
+
+    async with app.router.lifespan_context(app):
+        short_codes = await seed(app, args.urls)
+        return await LoadGenerator(app, short_codes, args).run()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--duration', type=float, default=20.0, help="seconds measured")
+    parser.add_argument('--warmup', type=float, default=3.0, help="seconds run before measuring")
+    parser.add_argument('--concurrency', type=int, default=32, help="requests in flight")
+    parser.add_argument('--mix', default=DEFAULT_MIX, help="relative weight of each operation")
+    parser.add_argument('--urls', type=int, default=100_000, help="seeded urls, redirected to and listed")
+    parser.add_argument('--zipf-s', type=float, default=1.1, help="skew of the redirects, higher is hotter")
+    parser.add_argument('--bulk-size', type=int, default=100)
+    parser.add_argument('--page-size', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="write the report to this file instead of stdout")
+    args = parser.parse_args()
+
+    results = asyncio.run(main_async(args))
+
+    report("load", {key: value for key, value in vars(args).items() if key != 'output'}, results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+Microbenchmarks of the CPU-bound pieces of a request, without a database (settings are still read from the environment).
+
+    python -m benchmarks.micro [--only filter] [--output micro.json]
+
+Every case is timed `repeat` times over enough iterations to last `min_time` seconds, the best run is reported.
+"""
+import argparse
+import json
+import time
+from datetime import datetime, timezone
+from typing import Callable
+
+from app.api.v1.short_urls.code_allocator import ShortCodeEncoder
+from app.api.v1.short_urls.model import ShortUrl
+from app.api.v1.short_urls.repository import URLShortRepository
+from app.api.v1.short_urls.schema import ShortUrlGetManyRequest, ShortUrlGetManyResult, ShortUrlRead
+from app.core.common.app_response import AppJSONResponse, AppResponse
+from app.core.common.pagination_factory import PaginationFilterParser, PaginationSortParser
+
+from .common import report
+
+PAGE_ROWS = 1000
+
+
+def _rows(count: int) -> list[tuple]:
+    """Rows as the listing selects them: the columns of `ShortUrlRead`, in table order."""
+    now = datetime.now(timezone.utc)
+    columns = URLShortRepository(session=None)._read_columns(ShortUrlRead)
+    values = {
+        'url': lambda i: f"https://example.com/articles/{i}?utm_source=benchmark",
+        'short_code': lambda i: f"{i:08x}",
+        'access_count': lambda i: i * 7,
+        'id': lambda i: i,
+        'created_at': lambda i: now,
+        'updated_at': lambda i: now,
+    }
+    return [tuple(values[column.name](i) for column in columns) for i in range(count)]
+
+
+def cases() -> dict[str, tuple[Callable[[], object], int]]:
+    """name -> (function, operations per call)"""
+    encoder = ShortCodeEncoder(secret="benchmark", min_length=6)
+    ids = range(10_000_000, 10_001_000)
+
+    sort_parser = PaginationSortParser()
+    filter_parser = PaginationFilterParser()
+    sort_by = "-created_at,access_count"
+    filter_by = "access_count>=10,created_at<2024-01-01T00:00:00,short_code!=abc123"
+
+    columns = URLShortRepository(session=None)._read_columns(ShortUrlRead)
+    names = [column.name for column in columns]
+    rows = _rows(PAGE_ROWS)
+
+    page = AppResponse(data=ShortUrlGetManyResult(total_count=PAGE_ROWS, data=URLShortRepository._validate_rows(ShortUrlRead, columns, rows)))
+    response = AppJSONResponse(None)
+
+    return {
+        "encode_short_code": (lambda: encoder.encode_many(ids), len(ids)),
+        "parse_sort": (lambda: sort_parser._process_sort_fields(sort_by, ShortUrl), 1),
+        "parse_filter": (lambda: filter_parser._process_filter_fields(filter_by, ShortUrl), 1),
+        "validate_listing_query": (lambda: ShortUrlGetManyRequest(page=3, size=50, sort_by=sort_by, filter_by=filter_by), 1),
+        "map_rows": (lambda: URLShortRepository._validate_rows(ShortUrlRead, columns, rows), PAGE_ROWS),
+        "map_rows_model_construct": (lambda: [ShortUrlRead.model_construct(**dict(zip(names, row))) for row in rows], PAGE_ROWS),
+        "serialize_page_stdlib": (lambda: json.dumps(page.model_dump(mode='json', by_alias=True), separators=(',', ':')).encode(), 1),
+        "serialize_page_pydantic_core": (lambda: response.render(page), 1),
+    }
+
+
+def measure(function: Callable[[], object], operations: int, min_time: float, repeat: int) -> dict[str, float]:
+    # calibrate the iterations so a run lasts about `min_time`
+    iterations = 1
+    while True:
+        started_at = time.perf_counter()
+        for _ in range(iterations):
+            function()
+        if time.perf_counter() - started_at >= min_time / 10:
+            break
+        iterations *= 2
+
+    iterations = max(1, int(iterations * min_time / max(time.perf_counter() - started_at, 1e-9)))
+
+    best = float('inf')
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        for _ in range(iterations):
+            function()
+        best = min(best, time.perf_counter() - started_at)
+
+    per_operation = best / (iterations * operations)
+    return {
+        "ns_per_op": round(per_operation * 1e9, 1),
+        "ops_per_second": round(1 / per_operation, 1),
+        "iterations": iterations,
+        "operations_per_iteration": operations,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--only', help="run the cases whose name contains this")
+    parser.add_argument('--min-time', type=float, default=0.2, help="seconds per run")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help="write the report to this file instead of stdout")
+    args = parser.parse_args()
+
+    results = {
+        name: measure(function, operations, args.min_time, args.repeat)
+        for name, (function, operations) in cases().items()
+        if not args.only or args.only in name
+    }
+
+    report("micro", {"min_time": args.min_time, "repeat": args.repeat, "page_rows": PAGE_ROWS}, results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Throughput of the response encoding alone: the same page of short urls returned by an endpoint through
+FastAPI's default path (`response_model` validation, `jsonable_encoder`-style dump, stdlib json) and as an
+`AppJSONResponse`, driven in-process over ASGI so neither the network nor the database is measured.
+
+    python -m benchmarks.responses --rows 1000 --requests 500 [--output responses.json]
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime, timezone
+
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+
+from app.core.common.app_response import AppJSONResponse, AppResponse
+from app.api.v1.short_urls.schema import ShortUrlGetManyResult, ShortUrlRead
+
+from .common import asgi_request, report
+
+
+def build_page(rows: int) -> ShortUrlGetManyResult:
+    now = datetime.now(timezone.utc)
+    return ShortUrlGetManyResult(
+        total_count=rows,
+        data=[
+            ShortUrlRead(id=i, url=f"https://example.com/articles/{i}?utm_source=benchmark", short_code=f"{i:08x}",
+                         created_at=now, updated_at=now, access_count=i * 7)
+            for i in range(rows)
+        ],
+    )
+
+
+def build_app(page: ShortUrlGetManyResult) -> FastAPI:
+    app = FastAPI()
+
+    @app.get('/stdlib', response_model=AppResponse[ShortUrlGetManyResult], response_class=JSONResponse)
+    async def stdlib():
+        return AppResponse(data=page)
+
+    @app.get('/default', response_model=AppResponse[ShortUrlGetManyResult], response_class=AppJSONResponse)
+    async def default():
+        return AppResponse(data=page)
+
+    @app.get('/direct', response_model=AppResponse[ShortUrlGetManyResult])
+    async def direct():
+        return AppJSONResponse(AppResponse(data=page))
+
+    return app
+
+
+async def call(app: FastAPI, path: str) -> bytes:
+    _, body = await asgi_request(app, "GET", path)
+    return body
+
+
+async def run(rows: int, requests: int) -> dict:
+    app = build_app(build_page(rows))
+    results = {}
+
+    bodies = {path: json.loads(await call(app, path)) for path in ('/stdlib', '/default', '/direct')}
+    assert bodies['/stdlib'] == bodies['/default'] == bodies['/direct'], "encodings differ"
+
+    for path in ('/stdlib', '/default', '/direct'):
+        for _ in range(10):
+            await call(app, path)
+
+        started_at = time.perf_counter()
+        for _ in range(requests):
+            body = await call(app, path)
+        elapsed = time.perf_counter() - started_at
+
+        results[path.strip('/')] = {
+            "requests_per_second": round(requests / elapsed, 1),
+            "mean_ms": round(elapsed / requests * 1000, 3),
+            "body_bytes": len(body),
+        }
+
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--output', help="write the report to this file instead of stdout")
+    args = parser.parse_args()
+
+    report("responses", {"rows": args.rows, "requests": args.requests}, asyncio.run(run(args.rows, args.requests)), args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,32 @@
+import os
+import tempfile
+
+import httpx
+import pytest
+
+# settings are read when the app modules are imported, they must point at a throwaway sqlite database first
+os.environ.update(
+    DB_BACKEND='sqlite',
+    SQLITE_PATH=os.path.join(tempfile.mkdtemp(prefix='fast_url_shortner_tests_'), 'test.db'),
+    SHORT_CODE_SECRET='test-secret',
+)
+
+
+@pytest.fixture(scope='session')
+def anyio_backend():
+    # a single event loop for the session, the engine pool keeps its connections across tests
+    return 'asyncio'
+
+
+@pytest.fixture(scope='session')
+async def app(anyio_backend):
+    from app.main import app
+
+    async with app.router.lifespan_context(app):
+        yield app
+
+
+@pytest.fixture
+async def client(app):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://test') as client:
+        yield client
@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+
+from app.api.v1.short_urls.code_allocator import ALPHABET, BASE, CodeAllocator, FeistelPermutation, ShortCodeEncoder
+from app.api.v1.short_urls.repository import URLShortRepository
+from app.core.db.database import AsyncSessionMaker
+
+
+@pytest.mark.parametrize('domain', [1, 2, 62, 1000, 4096, 3844])
+def test_feistel_permutation_is_a_bijection(domain):
+    permutation = FeistelPermutation(key=b'key', domain=domain)
+
+    assert sorted(permutation.permute(value) for value in range(domain)) == list(range(domain))
+
+
+def test_feistel_permutation_depends_on_the_key():
+    values = range(1000)
+
+    first = [FeistelPermutation(key=b'first', domain=1000).permute(value) for value in values]
+    second = [FeistelPermutation(key=b'second', domain=1000).permute(value) for value in values]
+
+    assert first != second
+
+
+def test_feistel_permutation_rejects_values_outside_of_the_domain():
+    permutation = FeistelPermutation(key=b'key', domain=100)
+
+    with pytest.raises(ValueError):
+        permutation.permute(100)
+    with pytest.raises(ValueError):
+        permutation.permute(-1)
+
+
+def test_encoder_gives_unique_codes_across_length_bands():
+    encoder = ShortCodeEncoder(secret='secret', min_length=1)
+    # every 1 and 2 character code, then the start of the 3 character band
+    ids = range(BASE + BASE ** 2 + 100)
+
+    codes = encoder.encode_many(ids)
+
+    assert len(set(codes)) == len(codes)
+    assert all(set(code) <= set(ALPHABET) for code in codes)
+    assert [len(code) for code in codes] == [1] * BASE + [2] * BASE ** 2 + [3] * 100
+
+
+@pytest.mark.anyio
+async def test_allocators_never_hand_out_the_same_code(app):
+    # two allocators lease blocks from the same sequence, like two workers would
+    allocators = [CodeAllocator(ShortCodeEncoder(secret='secret')) for _ in range(2)]
+
+    async def allocate(allocator, index):
+        async with AsyncSessionMaker() as session:
+            repository = URLShortRepository(session)
+            if index % 2:
+                return [await allocator.allocate(repository) for _ in range(50)]
+            return await allocator.allocate_many(repository, 700)
+
+    batches = await asyncio.gather(*(allocate(allocator, index) for index in range(6) for allocator in allocators))
+    codes = [code for batch in batches for code in batch]
+
+    assert len(codes) == 6 * 750
+    assert len(set(codes)) == len(codes)
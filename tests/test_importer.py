@@ -0,0 +1,54 @@
+import pytest
+
+from app.api.v1.short_urls.importer import MAX_CSV_RECORD_LINES, ImportRecord, iter_lines, parse_csv
+from app.api.v1.short_urls.schema import ShortUrlImportRejection
+
+pytestmark = pytest.mark.anyio
+
+
+async def parse(data: bytes, chunk_size: int = 7):
+    async def chunks():
+        for start in range(0, len(data), chunk_size):
+            yield data[start:start + chunk_size]
+
+    return [row async for row in parse_csv(iter_lines(chunks()))]
+
+
+def summary(rows):
+    return [(row.line, row.url, row.short_code) if isinstance(row, ImportRecord) else (row.line, type(row).__name__) for row in rows]
+
+
+async def test_quoted_fields_span_lines():
+    rows = await parse(b'url,short_code\n"https://a.example.com/x\ny",abc\n"https://b.example.com/""q""",\nhttps://c.example.com,\n')
+
+    assert summary(rows) == [
+        (2, 'https://a.example.com/x\ny', 'abc'),
+        (4, 'https://b.example.com/"q"', None),
+        (5, 'https://c.example.com', None),
+    ]
+
+
+async def test_crlf_line_endings():
+    rows = await parse(b'url\r\n"https://a.example.com/\r\nx"\r\nhttps://b.example.com\r\n')
+
+    assert [row.url for row in rows] == ['https://a.example.com/\nx', 'https://b.example.com']
+
+
+async def test_stray_quote_is_rejected_and_parsing_resyncs():
+    lines = [f'https://example.com/{i}' for i in range(3 * MAX_CSV_RECORD_LINES)]
+    rows = await parse(('url\n"https://stray.example.com\n' + '\n'.join(lines) + '\n').encode())
+
+    rejection, *records = rows
+    assert isinstance(rejection, ShortUrlImportRejection)
+    assert rejection.line == 2
+    assert 'not closed' in rejection.reason
+    # the lines swallowed by the open quote are lost, every later one is read
+    assert [record.url for record in records] == lines[MAX_CSV_RECORD_LINES - 1:]
+    assert records[0].line == MAX_CSV_RECORD_LINES + 2
+
+
+async def test_unterminated_quote_at_end_of_data():
+    rows = await parse(b'url\nhttps://a.example.com\n"https://b.example.com\n')
+
+    assert summary(rows) == [(2, 'https://a.example.com', None), (3, 'ShortUrlImportRejection')]
+    assert 'unterminated' in rows[-1].reason
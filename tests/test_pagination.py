@@ -0,0 +1,89 @@
+import base64
+import json
+from datetime import datetime
+
+import pytest
+
+from app.core.common.pagination_factory import InvalidCursor, PaginationCursor
+from app.api.v1.short_urls.model import ShortUrl
+
+pytestmark = pytest.mark.anyio
+
+PAGE_SIZE = 4
+
+
+def encode_payload(payload):
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+
+@pytest.fixture
+async def first_id(client):
+    """Creates 25 short urls with tied access counts, returns the smallest of their ids."""
+    response = await client.post('/api/v1/shorten/bulk-upsert',
+                                 json=[{'url': f'https://page.example.com/{id(object())}/{i}'} for i in range(25)])
+    assert response.status_code == 200
+    ids = [row['id'] for row in response.json()['data']]
+
+    response = await client.post('/api/v1/shorten/bulk-update', json={'records': [{'id': id, 'access_count': i % 4} for i, id in enumerate(ids)]})
+    assert response.status_code == 200
+
+    return min(ids)
+
+
+async def walk(client, params, max_pages=20):
+    ids, cursor = [], None
+
+    # a cursor that does not move forward would page forever
+    for _ in range(max_pages):
+        response = await client.get('/api/v1/shorten/', params={**params, 'size': PAGE_SIZE, **({'cursor': cursor} if cursor else {})})
+        assert response.status_code == 200, response.text
+        data = response.json()['data']
+        ids.extend(row['id'] for row in data['data'])
+
+        cursor = data['nextCursor']
+        if cursor is None:
+            return ids
+
+    pytest.fail(f"still paging after {max_pages} pages")
+
+
+@pytest.mark.parametrize('sort_by', ['-access_count', 'access_count,-id', '-created_at', '-access_count,-created_at'])
+async def test_cursor_pages_match_one_big_page(client, first_id, sort_by):
+    params = {'sort_by': sort_by, 'filter_by': f'id>={first_id}'}
+
+    response = await client.get('/api/v1/shorten/', params={**params, 'page': 1, 'size': 100})
+    expected = [row['id'] for row in response.json()['data']['data']]
+
+    assert len(expected) == 25
+    assert await walk(client, params) == expected
+
+
+@pytest.mark.parametrize('values', [['abc'], [True], [2 ** 70], [1.5], [[1]], [{'id': 1}]])
+async def test_tampered_cursor_is_a_bad_request(client, values):
+    response = await client.get('/api/v1/shorten/', params={'size': PAGE_SIZE, 'cursor': encode_payload({'k': ['id'], 'v': values})})
+
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('cursor', ['not base64 !', encode_payload([1]), encode_payload({'k': ['-id'], 'v': [1]}), encode_payload({'k': ['id'], 'v': 'a'})])
+async def test_malformed_cursor_is_a_bad_request(client, cursor):
+    response = await client.get('/api/v1/shorten/', params={'size': PAGE_SIZE, 'cursor': cursor})
+
+    assert response.status_code == 400
+
+
+def test_cursor_round_trip_converts_values_back():
+    created_at = datetime(2024, 5, 1, 12, 30, 15, 123456)
+    cursor = PaginationCursor.encode(['-created_at', 'access_count', 'id'], [created_at, None, 7])
+
+    values = PaginationCursor.decode(cursor, sort_keys=['-created_at', 'access_count', 'id'],
+                                     columns=[ShortUrl.created_at, ShortUrl.access_count, ShortUrl.id])
+
+    assert values == [created_at, None, 7]
+
+
+def test_cursor_of_other_sort_keys_is_rejected():
+    cursor = PaginationCursor.encode(['-created_at', 'id'], [datetime(2024, 5, 1), 7])
+
+    with pytest.raises(InvalidCursor):
+        PaginationCursor.decode(cursor, sort_keys=['created_at', 'id'], columns=[ShortUrl.created_at, ShortUrl.id])
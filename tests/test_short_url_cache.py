@@ -0,0 +1,111 @@
+import asyncio
+
+import pytest
+
+from app.api.v1.short_urls.cache import ShortUrlCache
+from app.api.v1.short_urls.model import ShortUrl, hash_url
+from app.api.v1.short_urls.repository import URLShortRepository
+from app.api.v1.short_urls.schema import ShortUrlUpdate
+from app.core.cache.single_flight import SingleFlight
+from app.core.db.database import AsyncSessionMaker
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def short_code(client):
+    response = await client.post('/api/v1/shorten/', json={'url': f'https://old.example.com/{id(object())}'})
+    assert response.status_code == 200
+    return response.json()['data']['shortCode']
+
+
+class SlowLookups:
+    """Holds the first lookup after its SELECT, until `release` is set."""
+
+    def __init__(self, monkeypatch):
+        self.read = asyncio.Event()
+        self.release = asyncio.Event()
+        self.held = False
+
+        find_by_short_code = URLShortRepository._find_by_short_code
+
+        async def slow_find_by_short_code(repository, short_code, read_replica):
+            found = await find_by_short_code(repository, short_code, read_replica)
+            if not self.held:
+                self.held = True
+                self.read.set()
+                await self.release.wait()
+            return found
+
+        monkeypatch.setattr(URLShortRepository, '_find_by_short_code', slow_find_by_short_code)
+
+
+def repository(session, cache, lookups=None):
+    return URLShortRepository(session, cache=cache, invalidation_bus=None, count_cache=None, lookups=lookups)
+
+
+async def lookup(cache, short_code, lookups=None):
+    async with AsyncSessionMaker() as session:
+        return await repository(session, cache, lookups).get_by_short_code(short_code)
+
+
+async def update(cache, short_code, url, lookups=None):
+    async with AsyncSessionMaker() as session:
+        await repository(session, cache, lookups).update_one(data=ShortUrlUpdate(url=url, url_hash=hash_url(url)),
+                                                             where_clause=[ShortUrl.short_code == short_code])
+
+
+def new_cache():
+    return ShortUrlCache(max_entries=100, ttl=60)
+
+
+async def test_lookup_caches_the_row(short_code):
+    cache = new_cache()
+
+    found = await lookup(cache, short_code)
+
+    assert cache.get(short_code) == found
+
+
+async def test_write_evicts_the_cached_row(short_code):
+    cache = new_cache()
+    await lookup(cache, short_code)
+
+    await update(cache, short_code, 'https://new.example.com/evicted')
+
+    assert cache.get(short_code) is None
+    assert (await lookup(cache, short_code)).url == 'https://new.example.com/evicted'
+
+
+async def test_row_read_before_a_write_is_not_cached(short_code, monkeypatch):
+    cache = new_cache()
+    slow_lookups = SlowLookups(monkeypatch)
+
+    stale_lookup = asyncio.create_task(lookup(cache, short_code))
+    await slow_lookups.read.wait()
+    # the write commits and invalidates while the lookup holds the old row
+    await update(cache, short_code, 'https://new.example.com/race')
+    slow_lookups.release.set()
+
+    assert (await stale_lookup).url.startswith('https://old.example.com/')
+    assert cache.get(short_code) is None
+    assert (await lookup(cache, short_code)).url == 'https://new.example.com/race'
+    assert cache.get(short_code).url == 'https://new.example.com/race'
+
+
+async def test_lookup_after_a_write_does_not_join_a_stale_flight(short_code, monkeypatch):
+    cache, lookups = new_cache(), SingleFlight()
+    slow_lookups = SlowLookups(monkeypatch)
+
+    stale_lookup = asyncio.create_task(lookup(cache, short_code, lookups))
+    await slow_lookups.read.wait()
+    await update(cache, short_code, 'https://new.example.com/coalesced', lookups)
+
+    # without forget() this lookup would join the flight holding the old row
+    fresh_lookup = asyncio.create_task(lookup(cache, short_code, lookups))
+    await asyncio.sleep(0.01)
+    slow_lookups.release.set()
+
+    assert (await stale_lookup).url.startswith('https://old.example.com/')
+    assert (await fresh_lookup).url == 'https://new.example.com/coalesced'
+    assert cache.get(short_code).url == 'https://new.example.com/coalesced'
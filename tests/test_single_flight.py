@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+
+from app.core.cache.single_flight import SingleFlight
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_concurrent_calls_share_one_execution():
+    single_flight = SingleFlight()
+    executions = 0
+
+    async def fetch():
+        nonlocal executions
+        executions += 1
+        await asyncio.sleep(0.01)
+        return 'row'
+
+    results = await asyncio.gather(*(single_flight.do('key', fetch) for _ in range(20)))
+
+    assert results == [('row', False)] * 20
+    assert executions == 1
+    assert single_flight.stats()['coalesced'] == 19
+    assert single_flight.in_flight == 0
+
+
+async def test_error_reaches_every_caller_and_is_not_remembered():
+    single_flight = SingleFlight()
+    executions = 0
+
+    async def fail():
+        nonlocal executions
+        executions += 1
+        await asyncio.sleep(0.01)
+        raise ConnectionError('database is gone')
+
+    results = await asyncio.gather(*(single_flight.do('key', fail) for _ in range(5)), return_exceptions=True)
+
+    assert executions == 1
+    assert all(isinstance(result, ConnectionError) for result in results)
+    assert single_flight.failures == 1
+
+    # the next call runs again instead of getting the old error
+    async def succeed():
+        return 'row'
+
+    assert await single_flight.do('key', succeed) == ('row', False)
+
+
+async def test_cancelled_leader_hands_over_to_a_follower():
+    single_flight = SingleFlight()
+    executions = 0
+
+    async def fetch():
+        nonlocal executions
+        executions += 1
+        await asyncio.sleep(0.05)
+        return executions
+
+    leader = asyncio.create_task(single_flight.do('key', fetch))
+    await asyncio.sleep(0)
+    followers = [asyncio.create_task(single_flight.do('key', fetch)) for _ in range(3)]
+    await asyncio.sleep(0.01)
+    leader.cancel()
+
+    results = await asyncio.gather(*followers)
+
+    assert leader.cancelled()
+    # one of the followers led a second flight, the others joined it
+    assert results == [(2, False)] * 3
+
+
+async def test_forget_detaches_the_flight_in_progress():
+    single_flight = SingleFlight()
+    executions = 0
+    release = asyncio.Event()
+
+    async def fetch():
+        nonlocal executions
+        executions += 1
+        version = executions
+        await release.wait()
+        return version
+
+    before = [asyncio.create_task(single_flight.do('key', fetch)) for _ in range(2)]
+    await asyncio.sleep(0)
+    single_flight.forget('key')
+    after = [asyncio.create_task(single_flight.do('key', fetch)) for _ in range(2)]
+    await asyncio.sleep(0)
+    release.set()
+
+    # callers of the forgotten flight are told so, calls made after forget() ran again
+    assert await asyncio.gather(*before) == [(1, True)] * 2
+    assert await asyncio.gather(*after) == [(2, False)] * 2
+    assert single_flight.forgotten == 1
+    assert single_flight.in_flight == 0